@@ -0,0 +1,364 @@
+#!/usr/bin/env python
+r"""Catalog of locations and slide scenarios
+
+The locations (topography sources, lakes, named regions) and the slide
+scenarios of every tool are defined once in ``scenarios.json`` next to this
+file, or the file named by the GLOF_CATALOG environment variable.  This
+module loads and validates it using the standard library only, so scripts
+that only need the definitions do not pay for importing numpy, matplotlib or
+clawpack.
+
+A scenario holds
+
+ - ``start`` - [longitude, latitude] where the slide starts
+ - ``slide_speed`` (m/s), ``max_length`` (m), ``sigma`` (m) - slide motion
+   and width
+ - ``theta`` - direction of the slide, in degrees in the catalog and
+   converted to radians by the loader
+ - ``A`` - amplitude (m) and ``t_end`` - duration (s)
+ - optionally ``shape`` - name of a shape in topo/slide_shapes.py,
+   ``path`` - [[longitude, latitude], ...] vertices the slide follows after
+   start and ``taper`` (m) - edge width of the tapered block
+
+and a lake its ``extent`` and ``level`` (m), optionally with ``cutouts``
+(boxes left dry), a shoreline ``polygon`` [[x, y], ...] and a ``mask``, a
+topotype 3 file relative to the catalog whose nonzero values mark the lake
+(see imja/lake_module.f90).
+
+A location run with GeoClaw also has its ``domain``: the ``extent`` of the
+computational domain, the ``coarse_delta`` of level 1 and the AMR
+``refinement_ratios``, and may list the tiles of its topography
+``pyramid`` (see topo/topo_pyramid.py), each covering the named boxes
+(``domain``, lakes or regions, see :func:`box`) to the resolution of its
+``level`` and registered with GeoClaw to allow refinement up to its
+``max_level``.
+
+:func:`scenarios` enumerates the named scenarios of a location together with
+parameter sweeps over them and filters the result, e.g.
+
+    python catalog.py imja snow_line --sweep sigma=250:500:6 \
+                                     --sweep theta=150:210:5 --where A=0:250
+
+lists the 30 variants of snow_line.
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import sys
+import os
+import math
+import json
+import itertools
+import argparse
+
+default_path = os.environ.get("GLOF_CATALOG",
+                              os.path.join(os.path.dirname(
+                                    os.path.abspath(__file__)), "scenarios.json"))
+
+scenario_keys = ("start", "slide_speed", "max_length", "theta", "sigma", "A",
+                 "t_end")
+optional_keys = ("shape", "path", "taper")
+positive_keys = ("slide_speed", "max_length", "sigma", "t_end")
+sweep_parameters = ("slide_speed", "sigma", "A", "theta", "max_length")
+
+_cache = {}
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _check_extent(extent, where):
+    if (not isinstance(extent, list) or len(extent) != 4 or
+            not all([_is_number(value) for value in extent])):
+        raise ValueError("%s: expected [x1, x2, y1, y2]." % where)
+    if extent[0] >= extent[1] or extent[2] >= extent[3]:
+        raise ValueError("%s: empty extent %s." % (where, extent))
+
+
+def _check_domain(domain, where):
+    _check_extent(domain.get('extent', None), where)
+    delta = domain.get('coarse_delta', None)
+    if not _is_number(delta) or delta <= 0:
+        raise ValueError("%s: coarse_delta must be a positive number." % where)
+    ratios = domain.get('refinement_ratios', None)
+    if (not isinstance(ratios, list) or
+            not all([isinstance(ratio, int) and ratio > 0
+                     for ratio in ratios])):
+        raise ValueError("%s: refinement_ratios must be a list of positive "
+                         "integers." % where)
+
+
+def _check_tile(location, tile, where):
+    if "domain" not in location:
+        raise ValueError("%s: a pyramid needs the domain." % where)
+    if not isinstance(tile.get('name', None), str):
+        raise ValueError("%s: missing name." % where)
+    covers = tile.get('covers', None)
+    if not isinstance(covers, list) or len(covers) == 0:
+        raise ValueError("%s: covers must list boxes." % where)
+    for name in covers:
+        try:
+            box(location, name)
+        except KeyError as error:
+            raise ValueError("%s: %s" % (where, error.args[0]))
+    if not _is_number(tile.get('margin', None)) or tile['margin'] < 0:
+        raise ValueError("%s: margin must be a non-negative number." % where)
+    levels = len(location['domain']['refinement_ratios']) + 1
+    for key in ("level", "max_level"):
+        if tile.get(key, None) not in range(1, levels + 1):
+            raise ValueError("%s: %s must be 1 to %s." % (where, key, levels))
+
+
+def validate_scenario(scenario, where="scenario"):
+    """Raise ValueError unless *scenario* has every key with a sane value"""
+    for key in scenario_keys:
+        if key not in scenario:
+            raise ValueError("%s: missing %s." % (where, key))
+    for key in scenario.keys():
+        if key not in scenario_keys + optional_keys:
+            raise ValueError("%s: unknown key %s." % (where, key))
+    start = scenario['start']
+    if (not isinstance(start, list) or len(start) != 2 or
+            not all([_is_number(value) for value in start])):
+        raise ValueError("%s: start must be [longitude, latitude]." % where)
+    for key in scenario_keys[1:]:
+        if not _is_number(scenario[key]):
+            raise ValueError("%s: %s must be a number." % (where, key))
+    for key in positive_keys:
+        if scenario[key] <= 0:
+            raise ValueError("%s: %s must be positive." % (where, key))
+    if not isinstance(scenario.get('shape', ""), str):
+        raise ValueError("%s: shape must be a name." % where)
+    path = scenario.get('path', [[0, 0]])
+    if (not isinstance(path, list) or len(path) == 0 or
+            not all([isinstance(point, list) and len(point) == 2 and
+                     all([_is_number(value) for value in point])
+                     for point in path])):
+        raise ValueError("%s: path must be a list of [longitude, latitude]."
+                                                                    % where)
+    taper = scenario.get('taper', 1)
+    if not _is_number(taper) or taper <= 0:
+        raise ValueError("%s: taper must be a positive number." % where)
+
+
+def validate(data):
+    """Raise ValueError unless *data* is a valid catalog"""
+
+    if data.get('version', None) != 1:
+        raise ValueError("Unsupported catalog version %s."
+                                                  % data.get('version', None))
+    for (name, location) in data['locations'].items():
+        for (n, topo) in enumerate(location.get('topo', [])):
+            for key in ("path", "out_path", "strip_zeros"):
+                if key not in topo:
+                    raise ValueError("%s topo %s: missing %s." % (name, n, key))
+        if "extent" in location:
+            _check_extent(location['extent'], "%s extent" % name)
+        for (n, lake) in enumerate(location.get('lakes', [])):
+            _check_extent(lake.get('extent', None), "%s lake %s" % (name, n))
+            if not _is_number(lake.get('level', None)):
+                raise ValueError("%s lake %s: level must be a number."
+                                                                % (name, n))
+            for (m, cutout) in enumerate(lake.get('cutouts', [])):
+                _check_extent(cutout, "%s lake %s cutout %s" % (name, n, m))
+            polygon = lake.get('polygon', [])
+            if (not isinstance(polygon, list) or 0 < len(polygon) < 3 or
+                    not all([isinstance(point, list) and len(point) == 2 and
+                             all([_is_number(value) for value in point])
+                             for point in polygon])):
+                raise ValueError("%s lake %s: polygon must be a list of at "
+                                 "least 3 [x, y] vertices." % (name, n))
+            if not isinstance(lake.get('mask', ""), str):
+                raise ValueError("%s lake %s: mask must be a path." % (name, n))
+        for (region, extent) in location.get('regions', {}).items():
+            _check_extent(extent, "%s region %s" % (name, region))
+        if "domain" in location:
+            _check_domain(location['domain'], "%s domain" % name)
+        for (n, tile) in enumerate(location.get('pyramid', [])):
+            _check_tile(location, tile, "%s pyramid tile %s" % (name, n))
+
+        scenarios = location.get('scenarios', {})
+        if len(scenarios) > 0 and "extent" not in location:
+            raise ValueError("%s: scenarios need the dtopo extent." % name)
+        for (scenario_name, scenario) in scenarios.items():
+            validate_scenario(scenario, "%s/%s" % (name, scenario_name))
+        default = location.get('default_scenario', None)
+        if default is not None and default not in scenarios:
+            raise ValueError("%s: default scenario %s is not defined."
+                                                            % (name, default))
+
+
+def load(path=None):
+    """Validated contents of the catalog at *path*, cached until it changes"""
+    if path is None:
+        path = default_path
+    mtime = os.path.getmtime(path)
+    if path not in _cache or _cache[path][0] != mtime:
+        with open(path) as catalog_file:
+            data = json.load(catalog_file)
+        validate(data)
+        _cache[path] = (mtime, data)
+    return _cache[path][1]
+
+
+def convert(scenario):
+    """Copy of catalog *scenario* in the units the tools use, theta in radians"""
+    scenario = dict(scenario)
+    scenario['start'] = tuple(scenario['start'])
+    scenario['theta'] = math.radians(scenario['theta'])
+    return scenario
+
+
+def location(name, path=None):
+    r"""Location *name* with its scenarios converted, see :func:`convert`
+
+    Lake mask paths are made absolute, they are relative to the catalog.
+    """
+    if path is None:
+        path = default_path
+    data = load(path)['locations']
+    if name not in data:
+        raise KeyError("Unknown location %s, expected one of %s."
+                                            % (name, ", ".join(sorted(data))))
+    result = dict(data[name])
+    result['lakes'] = [dict(lake) for lake in data[name].get('lakes', [])]
+    for lake in result['lakes']:
+        if lake.get('mask', ""):
+            lake['mask'] = os.path.join(os.path.dirname(os.path.abspath(path)),
+                                        lake['mask'])
+    result['scenarios'] = dict([(key, convert(scenario)) for (key, scenario)
+                                      in data[name].get('scenarios', {}).items()])
+    return result
+
+
+def box(location, name):
+    r"""Extent of the box *name* of *location*
+
+    *name* is ``domain`` for the computational domain, or the name of one of
+    its lakes or regions.
+    """
+    if name == "domain" and "domain" in location:
+        return location['domain']['extent']
+    for lake in location.get('lakes', []):
+        if lake.get('name', None) == name:
+            return lake['extent']
+    if name in location.get('regions', {}):
+        return location['regions'][name]
+    raise KeyError("Unknown box %s, expected domain, a lake or a region."
+                                                                      % name)
+
+
+def locations(path=None):
+    """Every location, see :func:`location`"""
+    return dict([(name, location(name, path))
+                                     for name in load(path)['locations']])
+
+
+def parse_range(spec):
+    """Parse "start:stop:num" (inclusive) or "v1,v2,..." into a list of floats"""
+    if ":" in spec:
+        start, stop, num = spec.split(":")
+        start, stop, num = float(start), float(stop), int(num)
+        if num == 1:
+            return [start]
+        step = (stop - start) / (num - 1)
+        return [start + n * step for n in range(num - 1)] + [stop]
+    return [float(value) for value in spec.split(",")]
+
+
+def sweep(name, base, ranges):
+    r"""Generate (name, scenario) pairs for every combination in *ranges*
+
+    *ranges* maps parameter names in *sweep_parameters* to sequences of
+    values, the other parameters are taken from *base*.  The variant names
+    encode the swept values so they are stable between runs.
+    """
+
+    for key in ranges.keys():
+        if key not in sweep_parameters:
+            raise ValueError("Cannot sweep over %s, expected one of %s."
+                                                    % (key, sweep_parameters))
+
+    keys = sorted(ranges.keys())
+    if len(keys) == 0:
+        yield name, base
+        return
+
+    for values in itertools.product(*[ranges[key] for key in keys]):
+        scenario = dict(base)
+        scenario.update(zip(keys, values))
+        suffix = "_".join(["%s%g" % (key, value)
+                                        for (key, value) in zip(keys, values)])
+        yield "%s_%s" % (name, suffix), scenario
+
+
+def scenarios(location_name, names=None, ranges=None, where=None, path=None):
+    r"""Enumerate the scenarios of a location
+
+    :Input:
+     - *names* (list) Base scenarios, all of the location by default
+     - *ranges* (dict) Parameter sweeps applied to every base, see
+       :func:`sweep`, in catalog units (theta in degrees)
+     - *where* (dict or function) Keep only scenarios whose parameters lie in
+       the given inclusive (low, high) bounds, in catalog units, or for which
+       the function of the catalog scenario returns True
+
+    Yields (name, scenario) with the scenarios converted by :func:`convert`.
+    """
+
+    defined = load(path)['locations'][location_name].get('scenarios', {})
+    if names is None:
+        names = sorted(defined.keys())
+    if ranges is None:
+        ranges = {}
+    if isinstance(where, dict):
+        bounds = where
+        where = lambda scenario: all([low <= scenario[key] <= high
+                                      for (key, (low, high)) in bounds.items()])
+
+    for name in names:
+        if name not in defined:
+            raise KeyError("Unknown scenario %s of %s." % (name,
+                                                           location_name))
+        for (variant, scenario) in sweep(name, defined[name], ranges):
+            if where is None or where(scenario):
+                yield variant, convert(scenario)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("location", nargs="?", default=None)
+    parser.add_argument("scenarios", nargs="*",
+                        help="Base scenarios, defaults to all of the location")
+    parser.add_argument("--sweep", action="append", default=[],
+                        metavar="PARAM=RANGE",
+                        help="Sweep PARAM over RANGE, may be repeated")
+    parser.add_argument("--where", action="append", default=[],
+                        metavar="PARAM=LOW:HIGH",
+                        help="Keep scenarios with PARAM in [LOW, HIGH]")
+    parser.add_argument("--catalog", default=None)
+    args = parser.parse_args()
+
+    if args.location is None:
+        for (name, loc) in sorted(load(args.catalog)['locations'].items()):
+            print("%-10s %s scenarios" % (name, len(loc.get('scenarios', {}))))
+        sys.exit(0)
+
+    ranges = {}
+    for spec in args.sweep:
+        key, values = spec.split("=")
+        ranges[key] = parse_range(values)
+    bounds = {}
+    for spec in args.where:
+        key, values = spec.split("=")
+        bounds[key] = [float(value) for value in values.split(":")]
+
+    count = 0
+    for (name, scenario) in scenarios(args.location, args.scenarios or None,
+                                      ranges, bounds or None, args.catalog):
+        print(name)
+        count += 1
+    print("%s scenarios" % count)
@@ -18,6 +18,8 @@
 !             DONTFLAG (no refinement needed)  or
 !             DOFLAG   (refinement desired)
 !
+! With GLOF_INSTRUMENT set the calls and flags are counted by reason, see
+! instrument_module.
 !
 ! ::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
 subroutine flag2refine2(mx,my,mbc,mbuff,meqn,maux,xlower,ylower,dx,dy,t,level, &
@@ -27,21 +29,23 @@ subroutine flag2refine2(mx,my,mbc,mbuff,meqn,maux,xlower,ylower,dx,dy,t,level, &
     use geoclaw_module, only:dry_tolerance, sea_level
     use geoclaw_module, only: spherical_distance, coordinate_system
 
-    use topo_module, only: tlowtopo,thitopo,xlowtopo,xhitopo,ylowtopo,yhitopo
-    use topo_module, only: minleveltopo,mtopofiles
-
-    use topo_module, only: tfdtopo,xlowdtopo,xhidtopo,ylowdtopo,yhidtopo
-    use topo_module, only: minleveldtopo,num_dtopo
-
     use qinit_module, only: x_low_qinit,x_hi_qinit,y_low_qinit,y_hi_qinit
     use qinit_module, only: min_level_qinit,qinit_type
 
     use storm_module, only: storm_type, wind_refine, R_refine, storm_location
     use storm_module, only: wind_forcing, wind_index, wind_refine
 
-    use regions_module, only: num_regions, regions
     use refinement_module
 
+    use flag_index_module, only: build_flag_index, patch_candidates, rects
+    use flag_index_module, only: num_rects
+    use flag_index_module, only: TOPO_RECT, REGION_RECT, DTOPO_RECT
+
+    use instrument_module, only: start_timer, record_flagging, NUM_REASONS
+    use instrument_module, only: REASON_STORM, REASON_TOPO, REASON_REGION
+    use instrument_module, only: REASON_DTOPO, REASON_QINIT, REASON_WAVE
+    use instrument_module, only: REASON_SPEED
+
     implicit none
 
     ! Subroutine arguments
@@ -60,15 +64,68 @@ subroutine flag2refine2(mx,my,mbc,mbuff,meqn,maux,xlower,ylower,dx,dy,t,level, &
     external allowflag
 
     ! Generic locals
-    integer :: i,j,m
+    integer :: i,j,m,n
     real(kind=8) :: x_c,y_c,x_low,y_low,x_hi,y_hi
     real(kind=8) :: speed, eta, ds
 
     ! Storm specific variables
     real(kind=8) :: R_eye(2), wind_speed
 
+    ! Forcing rectangles (topo, regions and dtopo) overlapping this patch
+    integer, allocatable :: candidates(:)
+    integer :: num_candidates
+    logical :: qinit_forced
+
+    ! Instrumentation, cells flagged for each reason (see instrument_module)
+    integer(kind=8) :: clock
+    integer :: counts(NUM_REASONS), rect_reason(3)
+    
     ! Initialize flags
     amrflags = DONTFLAG
+    call start_timer(clock)
+    counts = 0
+    rect_reason(TOPO_RECT) = REASON_TOPO
+    rect_reason(REGION_RECT) = REASON_REGION
+    rect_reason(DTOPO_RECT) = REASON_DTOPO
+
+    ! Only the rectangles that force refinement on this level at this time
+    ! and overlap the patch need to be checked cell by cell
+    call build_flag_index()
+    allocate(candidates(num_rects))
+    call patch_candidates(level, t, xlower, xlower + mx * dx,               &
+                                    ylower, ylower + my * dy,               &
+                          candidates, num_candidates)
+
+    ! Patch level fast paths:
+    ! If a forcing rectangle overlaps every cell the whole patch is flagged
+    do n = 1, num_candidates
+        m = candidates(n)
+        if (xlower + dx > rects(m)%x_low .and.                              &
+            xlower + (mx - 1) * dx < rects(m)%x_hi .and.                    &
+            ylower + dy > rects(m)%y_low .and.                              &
+            ylower + (my - 1) * dy < rects(m)%y_hi) then
+
+            amrflags(1:mx, 1:my) = DOFLAG
+            counts(rect_reason(rects(m)%source)) = mx * my
+            call record_flagging(level, mx, my, clock, counts)
+            return
+        endif
+    enddo
+
+    ! A dry patch can only be flagged by forcing, so if nothing forces
+    ! refinement anywhere on it there is nothing to do
+    qinit_forced = qinit_type > 0 .and. t == t0 .and.                       &
+                   level < min_level_qinit .and.                            &
+                   xlower + mx * dx > x_low_qinit .and.                     &
+                   xlower < x_hi_qinit .and.                                &
+                   ylower + my * dy > y_low_qinit .and. ylower < y_hi_qinit
+    if (num_candidates == 0 .and. storm_type == 0 .and.                     &
+        .not. qinit_forced) then
+        if (maxval(q(1, 1:mx, 1:my)) <= dry_tolerance) then
+            call record_flagging(level, mx, my, clock, counts)
+            return
+        endif
+    endif
 
     ! Loop over interior points on this grid
     ! (i,j) grid cell is [x_low,x_hi] x [y_low,y_hi], cell center at (x_c,y_c)
@@ -99,6 +156,7 @@ subroutine flag2refine2(mx,my,mbc,mbuff,meqn,maux,xlower,ylower,dx,dy,t,level, &
                     
                     if ( ds < R_refine(m) .and. level <= m ) then
                         amrflags(i,j) = DOFLAG
+                        counts(REASON_STORM) = counts(REASON_STORM) + 1
                         cycle x_loop
                     endif
                 enddo
@@ -109,6 +167,7 @@ subroutine flag2refine2(mx,my,mbc,mbuff,meqn,maux,xlower,ylower,dx,dy,t,level, &
                     do m=1,size(wind_refine,1)
                         if ((wind_speed > wind_refine(m)) .and. (level <= m)) then
                             amrflags(i,j) = DOFLAG
+                            counts(REASON_STORM) = counts(REASON_STORM) + 1
                             cycle x_loop
                         endif
                     enddo
@@ -116,40 +175,17 @@ subroutine flag2refine2(mx,my,mbc,mbuff,meqn,maux,xlower,ylower,dx,dy,t,level, &
             endif
             ! *****************************************************
 
-            ! Check to see if refinement is forced in any topography file region:
-            do m=1,mtopofiles
-                if (level < minleveltopo(m) .and. t >= tlowtopo(m) .and. t <= thitopo(m)) then
-                    if (  x_hi > xlowtopo(m) .and. x_low < xhitopo(m) .and. &
-                          y_hi > ylowtopo(m) .and. y_low < yhitopo(m) ) then
-
-                        amrflags(i,j) = DOFLAG
-                        cycle x_loop
-                    endif
-                endif
-            enddo
-
-            ! Check to see if refinement is forced in any other region:
-            do m=1,num_regions
-                if (level < regions(m)%min_level .and. &
-                    t >= regions(m)%t_low .and. t <= regions(m)%t_hi) then
-                    if (x_hi > regions(m)%x_low .and. x_low < regions(m)%x_hi .and. &
-                        y_hi > regions(m)%y_low .and. y_low < regions(m)%y_hi ) then
-
-                        amrflags(i,j) = DOFLAG
-                        cycle x_loop
-                    endif
-                endif
-            enddo
-
-            ! Check if we're in the dtopo region and need to refine:
-            ! force refinement to level minleveldtopo
-            do m = 1,num_dtopo
-                if (level < minleveldtopo(m).and. &
-                    t <= tfdtopo(m) .and. & !t.ge.t0dtopo(m).and.
-                    x_hi > xlowdtopo(m) .and. x_low < xhidtopo(m).and. &
-                    y_hi > ylowdtopo(m) .and. y_low < yhidtopo(m)) then
+            ! Check to see if refinement is forced in any topography file
+            ! region, any other region or the dtopo region, the level and
+            ! time conditions were already checked for the patch:
+            do n = 1, num_candidates
+                m = candidates(n)
+                if (x_hi > rects(m)%x_low .and. x_low < rects(m)%x_hi .and. &
+                    y_hi > rects(m)%y_low .and. y_low < rects(m)%y_hi) then
 
                     amrflags(i,j) = DOFLAG
+                    counts(rect_reason(rects(m)%source)) =                  &
+                        counts(rect_reason(rects(m)%source)) + 1
                     cycle x_loop
                 endif
             enddo
@@ -164,13 +200,16 @@ subroutine flag2refine2(mx,my,mbc,mbuff,meqn,maux,xlower,ylower,dx,dy,t,level, &
                     y_hi > y_low_qinit .and. y_low < y_hi_qinit) then
 
                     amrflags(i,j) = DOFLAG
+                    counts(REASON_QINIT) = counts(REASON_QINIT) + 1
                     cycle x_loop
                 endif
             endif
 
             ! -----------------------------------------------------------------
             ! Refinement not forced, so check if it is allowed and if so,
-            ! check if there is a reason to flag this point:
+            ! check if there is a reason to flag this point, dry cells are
+            ! never flagged so skip allowflag for them:
+            if (q(1,i,j) <= dry_tolerance) cycle x_loop
             if (allowflag(x_c,y_c,t,level)) then
 
                 if (q(1,i,j) > dry_tolerance) then
@@ -179,6 +218,7 @@ subroutine flag2refine2(mx,my,mbc,mbuff,meqn,maux,xlower,ylower,dx,dy,t,level, &
                     ! Check wave criteria
                     if (abs(q(1,i,j)) > wave_tolerance) then
                         amrflags(i,j) = DOFLAG
+                        counts(REASON_WAVE) = counts(REASON_WAVE) + 1
                         cycle x_loop
                     endif
 
@@ -189,6 +229,7 @@ subroutine flag2refine2(mx,my,mbc,mbuff,meqn,maux,xlower,ylower,dx,dy,t,level, &
                     do m=1,min(size(speed_tolerance),mxnest)
                         if (speed > speed_tolerance(m) .and. level <= m) then
                             amrflags(i,j) = DOFLAG
+                            counts(REASON_SPEED) = counts(REASON_SPEED) + 1
                             cycle x_loop
                         endif
                     enddo
@@ -197,4 +238,7 @@ subroutine flag2refine2(mx,my,mbc,mbuff,meqn,maux,xlower,ylower,dx,dy,t,level, &
 
         enddo x_loop
     enddo y_loop
+
+    call record_flagging(level, mx, my, clock, counts)
+
 end subroutine flag2refine2
@@ -0,0 +1,256 @@
+! ::::::::::::::::::::: flag_index_module ::::::::::::::::::::::::::::::::::
+!
+! Spatial index of the rectangles that force refinement in flag2refine2:
+! topography files, refinement regions and dtopo files.
+!
+! The rectangles are gathered once, the first time flag2refine2 is called
+! (after all of the data has been read), and binned on a uniform grid over
+! the domain separately for each level, keeping only those that can force
+! refinement at that level (level < min_level).  A patch then looks up the
+! bins it overlaps and tests only the rectangles found there, and a patch
+! no rectangle intersects skips the per-cell checks entirely.
+!
+! ::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+module flag_index_module
+
+    implicit none
+    save
+
+    ! Number of bins in each direction
+    integer, parameter :: NUM_BINS = 32
+
+    ! Where a forcing rectangle comes from
+    integer, parameter :: TOPO_RECT = 1, REGION_RECT = 2, DTOPO_RECT = 3
+
+    type forcing_rect
+        ! Refinement is forced while level < min_level and t_low <= t <= t_hi
+        integer :: source
+        integer :: min_level
+        real(kind=8) :: t_low, t_hi
+        real(kind=8) :: x_low, x_hi, y_low, y_hi
+    end type forcing_rect
+
+    logical, private :: index_built = .false.
+
+    integer :: num_rects = 0
+    type(forcing_rect), allocatable :: rects(:)
+
+    ! Bin grid and per level compressed bin lists, the rectangles in bin b
+    ! at level L are bin_rects(bin_start(b, L):bin_start(b + 1, L) - 1)
+    real(kind=8) :: bin_lower(2), bin_width(2)
+    integer, allocatable :: bin_start(:, :), bin_rects(:)
+
+contains
+
+    ! ========================================================================
+    !  build_flag_index()
+    !    Gather the forcing rectangles and bin them, only done once
+    ! ========================================================================
+    subroutine build_flag_index()
+
+        use amr_module, only: mxnest, xlower, xupper, ylower, yupper
+
+        use topo_module, only: tlowtopo,thitopo,xlowtopo,xhitopo,ylowtopo,yhitopo
+        use topo_module, only: minleveltopo,mtopofiles
+        use topo_module, only: tfdtopo,xlowdtopo,xhidtopo,ylowdtopo,yhidtopo
+        use topo_module, only: minleveldtopo,num_dtopo
+
+        use regions_module, only: num_regions, regions
+
+        implicit none
+
+        integer :: m, n, level, b, ix, iy, total
+        integer :: ix_range(2), iy_range(2)
+        integer, allocatable :: fill(:)
+        logical :: built
+
+        ! Atomic read and flush so that a thread seeing index_built set also
+        ! sees what was set up before it
+        !$OMP ATOMIC READ
+        built = index_built
+        !$OMP FLUSH
+        if (built) return
+
+        !$OMP CRITICAL (flag_index_build)
+        if (.not. index_built) then
+
+            num_rects = mtopofiles + num_regions + num_dtopo
+            allocate(rects(num_rects))
+
+            n = 0
+            do m = 1, mtopofiles
+                n = n + 1
+                rects(n) = forcing_rect(TOPO_RECT,                           &
+                                        minleveltopo(m), tlowtopo(m),        &
+                                        thitopo(m), xlowtopo(m), xhitopo(m), &
+                                        ylowtopo(m), yhitopo(m))
+            end do
+            do m = 1, num_regions
+                n = n + 1
+                rects(n) = forcing_rect(REGION_RECT,                         &
+                                        regions(m)%min_level,                &
+                                        regions(m)%t_low, regions(m)%t_hi,   &
+                                        regions(m)%x_low, regions(m)%x_hi,   &
+                                        regions(m)%y_low, regions(m)%y_hi)
+            end do
+            do m = 1, num_dtopo
+                n = n + 1
+                rects(n) = forcing_rect(DTOPO_RECT,                          &
+                                        minleveldtopo(m), -huge(1.d0),       &
+                                        tfdtopo(m), xlowdtopo(m),            &
+                                        xhidtopo(m), ylowdtopo(m),           &
+                                        yhidtopo(m))
+            end do
+
+            bin_lower = [xlower, ylower]
+            bin_width = [(xupper - xlower) / NUM_BINS,                       &
+                         (yupper - ylower) / NUM_BINS]
+
+            ! Count the entries of every bin on every level
+            allocate(bin_start(NUM_BINS**2 + 1, mxnest))
+            bin_start = 0
+            do level = 1, mxnest
+                do n = 1, num_rects
+                    if (level >= rects(n)%min_level) cycle
+                    call bin_range(rects(n)%x_low, rects(n)%x_hi,            &
+                                   rects(n)%y_low, rects(n)%y_hi,            &
+                                   ix_range, iy_range)
+                    do iy = iy_range(1), iy_range(2)
+                        do ix = ix_range(1), ix_range(2)
+                            b = ix + (iy - 1) * NUM_BINS
+                            bin_start(b + 1, level) = bin_start(b + 1, level) + 1
+                        end do
+                    end do
+                end do
+            end do
+
+            ! Turn the counts into offsets into bin_rects
+            total = 1
+            do level = 1, mxnest
+                bin_start(1, level) = total
+                do b = 1, NUM_BINS**2
+                    bin_start(b + 1, level) = bin_start(b, level)            &
+                                            + bin_start(b + 1, level)
+                end do
+                total = bin_start(NUM_BINS**2 + 1, level)
+            end do
+
+            allocate(bin_rects(max(total - 1, 1)))
+            allocate(fill(NUM_BINS**2))
+            do level = 1, mxnest
+                fill = bin_start(1:NUM_BINS**2, level)
+                do n = 1, num_rects
+                    if (level >= rects(n)%min_level) cycle
+                    call bin_range(rects(n)%x_low, rects(n)%x_hi,            &
+                                   rects(n)%y_low, rects(n)%y_hi,            &
+                                   ix_range, iy_range)
+                    do iy = iy_range(1), iy_range(2)
+                        do ix = ix_range(1), ix_range(2)
+                            b = ix + (iy - 1) * NUM_BINS
+                            bin_rects(fill(b)) = n
+                            fill(b) = fill(b) + 1
+                        end do
+                    end do
+                end do
+            end do
+            deallocate(fill)
+
+            !$OMP FLUSH
+            !$OMP ATOMIC WRITE
+            index_built = .true.
+        end if
+        !$OMP END CRITICAL (flag_index_build)
+
+    end subroutine build_flag_index
+
+    ! ========================================================================
+    !  bin_range(x_low, x_hi, y_low, y_hi, ix_range, iy_range)
+    !    Range of bins overlapping a rectangle, clipped to the bin grid
+    ! ========================================================================
+    subroutine bin_range(x_low, x_hi, y_low, y_hi, ix_range, iy_range)
+
+        implicit none
+
+        real(kind=8), intent(in) :: x_low, x_hi, y_low, y_hi
+        integer, intent(out) :: ix_range(2), iy_range(2)
+
+        ix_range(1) = bin_index(x_low, 1)
+        ix_range(2) = bin_index(x_hi, 1)
+        iy_range(1) = bin_index(y_low, 2)
+        iy_range(2) = bin_index(y_hi, 2)
+
+    end subroutine bin_range
+
+    integer pure function bin_index(x, dim) result(index)
+
+        implicit none
+
+        real(kind=8), intent(in) :: x
+        integer, intent(in) :: dim
+        real(kind=8) :: s
+
+        ! Clip in real arithmetic first to avoid integer overflow
+        s = (x - bin_lower(dim)) / bin_width(dim)
+        s = max(0.d0, min(real(NUM_BINS - 1, kind=8), s))
+        index = int(s) + 1
+
+    end function bin_index
+
+    ! ========================================================================
+    !  patch_candidates(level, t, x_low, x_hi, y_low, y_hi, candidates, num)
+    !    Rectangles forcing refinement on this level at time t that overlap
+    !    the patch [x_low, x_hi] x [y_low, y_hi].  candidates must have room
+    !    for num_rects entries.  They are returned in increasing index, i.e.
+    !    topo, region then dtopo in the order flag2refine2 checked them.
+    ! ========================================================================
+    subroutine patch_candidates(level, t, x_low, x_hi, y_low, y_hi,          &
+                                candidates, num_candidates)
+
+        implicit none
+
+        integer, intent(in) :: level
+        real(kind=8), intent(in) :: t, x_low, x_hi, y_low, y_hi
+        integer, intent(out) :: candidates(:), num_candidates
+
+        integer :: ix, iy, b, k, n, m
+        integer :: ix_range(2), iy_range(2)
+        logical :: seen(num_rects)
+
+        num_candidates = 0
+        if (num_rects == 0 .or. level > size(bin_start, 2)) return
+
+        seen = .false.
+        call bin_range(x_low, x_hi, y_low, y_hi, ix_range, iy_range)
+        do iy = iy_range(1), iy_range(2)
+            do ix = ix_range(1), ix_range(2)
+                b = ix + (iy - 1) * NUM_BINS
+                do k = bin_start(b, level), bin_start(b + 1, level) - 1
+                    n = bin_rects(k)
+                    if (seen(n)) cycle
+                    seen(n) = .true.
+                    if (t >= rects(n)%t_low .and. t <= rects(n)%t_hi .and.   &
+                        x_hi > rects(n)%x_low .and. x_low < rects(n)%x_hi .and. &
+                        y_hi > rects(n)%y_low .and. y_low < rects(n)%y_hi) then
+                        num_candidates = num_candidates + 1
+                        candidates(num_candidates) = n
+                    end if
+                end do
+            end do
+        end do
+
+        ! The bins give them in no particular order, insertion sort as there
+        ! are only a few
+        do k = 2, num_candidates
+            n = candidates(k)
+            m = k - 1
+            do while (m >= 1)
+                if (candidates(m) <= n) exit
+                candidates(m + 1) = candidates(m)
+                m = m - 1
+            end do
+            candidates(m + 1) = n
+        end do
+
+    end subroutine patch_candidates
+
+end module flag_index_module
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+r"""Rank the costs recorded by the instrumented Fortran routines
+
+Run xgeoclaw with GLOF_INSTRUMENT=1 to have flag2refine2 and qinit write
+instrument.json to the output directory (see instrument_module.f90).  This
+script ranks the (routine, level) pairs by the wall time spent in them,
+summed over threads, and the reasons cells were flagged for refinement on
+each level.  The regridding parameters in amr.data are printed alongside
+as they are what the numbers are used to tune.
+
+Usage:  python analyze_instrument.py [outdir]
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import sys
+import os
+import json
+
+from run_manager import read_data_value
+
+summary_name = "instrument.json"
+
+# Entries of amr.data and geoclaw.data worth reading the ranking against
+tuning_parameters = (("amr.data", "regrid_interval"),
+                     ("amr.data", "clustering_cutoff"),
+                     ("geoclaw.data", "wave_tolerance"),
+                     ("geoclaw.data", "speed_tolerance"))
+
+
+def load(outdir="_output"):
+    """Contents of instrument.json in *outdir*"""
+    with open(os.path.join(outdir, summary_name)) as summary_file:
+        return json.load(summary_file)
+
+
+def rank_costs(summary):
+    r"""(routine, level) pairs by decreasing time
+
+    Returns a list of dicts with the calls, cells and seconds of each pair
+    that was called, and its share of the thread time available, elapsed
+    times threads.
+    """
+
+    available = summary['elapsed'] * summary['threads']
+    costs = []
+    for level in summary['levels']:
+        for routine in ("flag2refine2", "qinit"):
+            entry = dict(level[routine])
+            if entry['calls'] == 0:
+                continue
+            entry['routine'] = routine
+            entry['level'] = level['level']
+            entry['share'] = 0.0
+            if available > 0:
+                entry['share'] = entry['seconds'] / available
+            costs.append(entry)
+    return sorted(costs, key=lambda entry: entry['seconds'], reverse=True)
+
+
+def rank_flags(summary):
+    r"""Flag counts by level and reason, largest first
+
+    Returns a list of (level, reason, count, fraction of the cells flagged
+    on that level, fraction of the cells checked on that level).
+    """
+
+    ranking = []
+    for level in summary['levels']:
+        flagged = sum(level['flags'])
+        checked = level['flag2refine2']['cells']
+        for (reason, count) in zip(summary['reasons'], level['flags']):
+            if count == 0:
+                continue
+            ranking.append((level['level'], reason, count,
+                            float(count) / flagged, float(count) / checked))
+    return sorted(ranking, key=lambda entry: entry[2], reverse=True)
+
+
+def tuning(outdir="_output"):
+    """Values of *tuning_parameters* found in *outdir* as (name, value)"""
+    values = []
+    for (file_name, name) in tuning_parameters:
+        try:
+            path = os.path.join(outdir, file_name)
+            values.append((name, read_data_value(path, name)))
+        except (IOError, OSError, KeyError):
+            pass
+    return values
+
+
+if __name__ == "__main__":
+
+    outdir = "_output"
+    if len(sys.argv) > 1:
+        outdir = sys.argv[1]
+
+    summary = load(outdir)
+    print("%.1f s elapsed on %s threads" % (summary['elapsed'],
+                                            summary['threads']))
+    for (name, value) in tuning(outdir):
+        print("  %-18s %s" % (name, value))
+
+    print("\nTime by routine and level:")
+    print("  %-13s %5s %10s %12s %10s %8s %10s" % ("routine", "level", "calls",
+                                                  "cells", "seconds", "share",
+                                                  "ns/cell"))
+    for entry in rank_costs(summary):
+        print("  %-13s %5s %10s %12s %10.3f %7.2f%% %10.1f"
+                % (entry['routine'], entry['level'], entry['calls'],
+                   entry['cells'], entry['seconds'], 100.0 * entry['share'],
+                   1e9 * entry['seconds'] / max(entry['cells'], 1)))
+
+    print("\nFlagged cells by level and reason:")
+    print("  %5s %-16s %12s %9s %9s" % ("level", "reason", "cells",
+                                        "of flags", "of cells"))
+    for (level, reason, count, of_flagged, of_checked) in rank_flags(summary):
+        print("  %5s %-16s %12s %8.1f%% %8.1f%%" % (level, reason, count,
+                                                    100.0 * of_flagged,
+                                                    100.0 * of_checked))
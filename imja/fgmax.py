@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+r"""Maximum depth, speed, momentum flux and arrival time on a fixed grid
+
+The output frames are streamed one at a time in time order.  Each frame is
+sampled onto a uniform grid, taking every point from the finest patch
+covering it (see region.py), and folded into running grids of
+
+ - ``max_depth`` - maximum water depth h
+ - ``max_speed`` - maximum speed |(hu, hv)| / h
+ - ``max_momentum_flux`` - maximum h * speed**2
+ - ``arrival_time`` - first output time at which h exceeds the depth of the
+   first frame by more than *arrival_tolerance*, NaN if it never does.  The
+   lake starts wet, so arrival is measured against the initial depth.
+
+after which the frame's patch data is dropped, so memory does not grow with
+the number of frames.  Only patches intersecting the grid are read.  The
+grids are written as ``<name>.npy`` next to ``fgmax.json`` describing the
+grid and the frames that went in.
+
+Usage:  python fgmax.py [outdir] [region] [delta] [out_dir]
+
+where region is a name from region.py or x1,x2,y1,y2 (default "lake") and
+delta is the grid spacing in degrees (default 1e-4).
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import sys
+import os
+import json
+
+import numpy
+
+import region
+from render_frames import output_frames
+
+grid_names = ("max_depth", "max_speed", "max_momentum_flux", "arrival_time")
+
+
+class FixedGridMax(object):
+    r"""Running maxima on the uniform grid of spacing *delta* over *extent*
+
+    :Input:
+     - *extent* (list) [x1, x2, y1, y2], grid points are cell centers
+     - *delta* (float) Grid spacing
+     - *dry_tolerance* (float) Depth below which a point is dry, as in setrun
+     - *arrival_tolerance* (float) Rise in depth that counts as arrival
+    """
+
+    def __init__(self, extent, delta, dry_tolerance=1e-3,
+                       arrival_tolerance=0.1):
+
+        self.extent = list(extent)
+        self.delta = delta
+        self.dry_tolerance = dry_tolerance
+        self.arrival_tolerance = arrival_tolerance
+        self.x = numpy.arange(extent[0] + 0.5 * delta, extent[1], delta)
+        self.y = numpy.arange(extent[2] + 0.5 * delta, extent[3], delta)
+
+        shape = (self.y.shape[0], self.x.shape[0])
+        self.grids = {}
+        for name in grid_names:
+            self.grids[name] = numpy.empty(shape)
+            self.grids[name].fill(numpy.nan)
+        self.initial_depth = None
+        self.frames = []
+        self.times = []
+
+        # Work arrays reused for every frame
+        self._q = numpy.empty((3,) + shape)
+        self._speed = numpy.empty(shape)
+
+    def add_frame(self, frame):
+        r"""Fold :class:`frame_reader.Frame` *frame* into the grids"""
+
+        if len(self.times) > 0 and frame.t < self.times[-1]:
+            raise ValueError("Frames must be added in time order.")
+
+        patches = frame.select(extent=self.extent)
+        h, hu, hv = self._q
+        self._q.fill(numpy.nan)
+        for m in range(3):
+            region.sample(patches, self.x, self.y, var=m, out=self._q[m])
+        for patch in patches:
+            patch.release()
+
+        # Points not covered by any patch are NaN and never update a maximum
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            wet = h > self.dry_tolerance
+            numpy.hypot(hu, hv, out=self._speed)
+            numpy.divide(self._speed, h, out=self._speed, where=wet)
+            self._speed[~wet] = 0.0
+            self._speed[numpy.isnan(h)] = numpy.nan
+
+            numpy.fmax(self.grids['max_depth'], h,
+                       out=self.grids['max_depth'])
+            numpy.fmax(self.grids['max_speed'], self._speed,
+                       out=self.grids['max_speed'])
+            numpy.fmax(self.grids['max_momentum_flux'],
+                       h * self._speed**2, out=self.grids['max_momentum_flux'])
+
+            if self.initial_depth is None:
+                self.initial_depth = h.copy()
+            arrived = ((h - self.initial_depth > self.arrival_tolerance)
+                       & numpy.isnan(self.grids['arrival_time']))
+            self.grids['arrival_time'][arrived] = frame.t
+
+        self.frames.append(frame.frameno)
+        self.times.append(frame.t)
+
+    def write(self, out_dir):
+        """Write the grids as .npy files with fgmax.json describing them"""
+        if not os.path.exists(out_dir):
+            os.makedirs(out_dir)
+        for (name, grid) in self.grids.items():
+            numpy.save(os.path.join(out_dir, "%s.npy" % name), grid)
+        with open(os.path.join(out_dir, "fgmax.json"), "w") as meta_file:
+            json.dump({"extent": self.extent,
+                       "delta": self.delta,
+                       "shape": [self.y.shape[0], self.x.shape[0]],
+                       "x_lower": float(self.x[0]),
+                       "y_lower": float(self.y[0]),
+                       "dry_tolerance": self.dry_tolerance,
+                       "arrival_tolerance": self.arrival_tolerance,
+                       "grids": list(grid_names),
+                       "frames": self.frames,
+                       "times": self.times}, meta_file, indent=1)
+
+
+def fgmax(outdir="_output", extent="lake", delta=1e-4, out_dir=None,
+          frames=None, **kwargs):
+    r"""Stream the frames of *outdir* into a :class:`FixedGridMax`
+
+    *extent* is a name from :data:`region.regions` or [x1, x2, y1, y2] and
+    *out_dir* defaults to ``<outdir>/fgmax``.  Returns the accumulator.
+    """
+
+    if isinstance(extent, str):
+        extent = region.regions[extent.lower()]
+    if out_dir is None:
+        out_dir = os.path.join(outdir, "fgmax")
+    if frames is None:
+        frames = output_frames(outdir)
+
+    index = region.patch_index(outdir)
+    accumulator = FixedGridMax(extent, delta, **kwargs)
+    for frameno in frames:
+        accumulator.add_frame(index.frame(frameno))
+    index.save()
+
+    accumulator.write(out_dir)
+    return accumulator
+
+
+if __name__ == "__main__":
+
+    outdir = "_output"
+    extent = "lake"
+    delta = 1e-4
+    out_dir = None
+    if len(sys.argv) > 1:
+        outdir = sys.argv[1]
+    if len(sys.argv) > 2:
+        extent = sys.argv[2]
+        if "," in extent:
+            extent = [float(value) for value in extent.split(",")]
+    if len(sys.argv) > 3:
+        delta = float(sys.argv[3])
+    if len(sys.argv) > 4:
+        out_dir = sys.argv[4]
+
+    accumulator = fgmax(outdir, extent, delta, out_dir=out_dir)
+    print("Folded %s frames onto a %s x %s grid" % (len(accumulator.frames),
+                                                    accumulator.x.shape[0],
+                                                    accumulator.y.shape[0]))
+    for name in grid_names:
+        print("  %s: max %s" % (name, numpy.nanmax(accumulator.grids[name])))
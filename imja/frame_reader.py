@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+r"""Lazy reader for GeoClaw output frames
+
+Opening a frame only reads its patch headers, from which it builds an index
+of the patches (grid number, level, size, lower corner, spacing) and where
+each patch's data lives.  The data of a patch is read when its ``q`` is
+first accessed: binary output (fort.bNNNN) is memory mapped so only the
+bytes of that patch are touched, ASCII output (fort.qNNNN) is parsed from
+the byte range of that patch.  A consumer that only needs, say, the level 4
+patches over the lake therefore never reads the rest of the frame.
+
+Usage:  python frame_reader.py frameno [outdir]  - Summarize a frame
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import sys
+import os
+
+import numpy
+
+
+class Patch(object):
+    r"""One patch of a frame, its data is loaded on first access of *q*
+
+    *q* is shaped (num_eqn, mx, my) without ghost cells, for GeoClaw the
+    components are h, hu, hv and eta.
+    """
+
+    def __init__(self, frame, grid_number, level, mx, my, xlower, ylower,
+                       dx, dy, offset, length=None):
+        self.frame = frame
+        self.grid_number = grid_number
+        self.level = level
+        self.mx = mx
+        self.my = my
+        self.xlower = xlower
+        self.ylower = ylower
+        self.dx = dx
+        self.dy = dy
+        self.offset = offset
+        self.length = length
+        self._q = None
+
+    @property
+    def xupper(self):
+        return self.xlower + self.mx * self.dx
+
+    @property
+    def yupper(self):
+        return self.ylower + self.my * self.dy
+
+    @property
+    def extent(self):
+        return [self.xlower, self.xupper, self.ylower, self.yupper]
+
+    @property
+    def x(self):
+        """Cell centers in x"""
+        return self.xlower + (numpy.arange(self.mx) + 0.5) * self.dx
+
+    @property
+    def y(self):
+        """Cell centers in y"""
+        return self.ylower + (numpy.arange(self.my) + 0.5) * self.dy
+
+    def intersects(self, extent):
+        return (self.xlower < extent[1] and extent[0] < self.xupper and
+                self.ylower < extent[3] and extent[2] < self.yupper)
+
+    @property
+    def q(self):
+        if self._q is None:
+            self._q = self.frame._read_patch(self)
+        return self._q
+
+    def release(self):
+        """Drop the loaded data"""
+        self._q = None
+
+
+class Frame(object):
+    r"""Index of the patches of output frame *frameno* in *outdir*
+
+    *headers* is an already known list of patch headers as returned by
+    :meth:`headers`, in which case fort.q is not scanned again.
+    """
+
+    def __init__(self, frameno, outdir="_output", headers=None):
+
+        self.frameno = frameno
+        self.outdir = outdir
+        self.q_path = os.path.join(outdir, "fort.q%04d" % frameno)
+        self.b_path = os.path.join(outdir, "fort.b%04d" % frameno)
+        self._read_t_file(os.path.join(outdir, "fort.t%04d" % frameno))
+        self._data = None
+
+        if self.file_format is None:
+            self.file_format = "ascii"
+            if os.path.exists(self.b_path):
+                self.file_format = "binary"
+        # Clawpack names the precision of binary output as binary64 or
+        # binary32, plain binary is double precision
+        self.binary = self.file_format.startswith("binary")
+        self.dtype = numpy.dtype("<f4" if self.file_format == "binary32"
+                                      else "<f8")
+        if headers is None:
+            self.patches = self._read_headers()
+        else:
+            self.patches = [Patch(self, *header) for header in headers]
+
+    def _read_t_file(self, path):
+        values = {}
+        with open(path) as t_file:
+            for line in t_file:
+                fields = line.split()
+                if len(fields) >= 2:
+                    values[fields[1].lower()] = fields[0]
+        self.t = float(values["time"])
+        self.num_eqn = int(values["meqn"])
+        self.num_patches = int(values["ngrids"])
+        self.num_aux = int(values.get("naux", 0))
+        self.num_ghost = int(values.get("nghost", 2))
+        self.file_format = values.get("format", None)
+
+    def _read_headers(self):
+        r"""Scan fort.q for the patch headers
+
+        For binary output the file only holds headers and the data offsets
+        into fort.b follow from the patch sizes.  For ASCII output the data
+        follows each header and is skipped, remembering its byte range.
+        """
+
+        patches = []
+        offset = 0
+        with open(self.q_path, "rb") as q_file:
+            while True:
+                header = []
+                while len(header) < 8:
+                    line = q_file.readline()
+                    if len(line) == 0:
+                        return patches
+                    fields = line.split()
+                    if len(fields) > 0:
+                        header.append(fields[0].decode())
+                mx, my = int(header[2]), int(header[3])
+                if self.binary:
+                    length = None
+                    size = (mx + 2 * self.num_ghost) * (my + 2 * self.num_ghost)
+                    patch_offset = offset
+                    offset += self.num_eqn * size * self.dtype.itemsize
+                else:
+                    # Data follows as my blocks of mx lines
+                    patch_offset = q_file.tell()
+                    lines = 0
+                    while lines < mx * my:
+                        line = q_file.readline()
+                        if len(line) == 0:
+                            raise IOError("Truncated patch in %s." % self.q_path)
+                        if len(line.strip()) > 0:
+                            lines += 1
+                    length = q_file.tell() - patch_offset
+
+                patches.append(Patch(self, int(header[0]), int(header[1]),
+                                     mx, my, float(header[4]), float(header[5]),
+                                     float(header[6]), float(header[7]),
+                                     patch_offset, length))
+
+    def _read_patch(self, patch):
+        if self.binary:
+            if self._data is None:
+                self._data = numpy.memmap(self.b_path, dtype=self.dtype,
+                                          mode="r")
+            g = self.num_ghost
+            size = (self.num_eqn * (patch.mx + 2 * g) * (patch.my + 2 * g))
+            start = patch.offset // self.dtype.itemsize
+            q = self._data[start:start + size].reshape((self.num_eqn,
+                                                        patch.mx + 2 * g,
+                                                        patch.my + 2 * g),
+                                                       order="F")
+            return q[:, g:g + patch.mx, g:g + patch.my]
+
+        with open(self.q_path, "rb") as q_file:
+            q_file.seek(patch.offset)
+            text = q_file.read(patch.length)
+        # Accept Fortran double precision exponents (1.0D+00)
+        values = numpy.array(text.replace(b"D", b"E").split(), dtype=float)
+        q = values.reshape((patch.my, patch.mx, self.num_eqn))
+        return q.transpose((2, 1, 0))
+
+    def select(self, level=None, extent=None):
+        r"""Patches on *level* (int or list of ints) that intersect *extent*"""
+        patches = self.patches
+        if level is not None:
+            levels = numpy.atleast_1d(level)
+            patches = [patch for patch in patches if patch.level in levels]
+        if extent is not None:
+            patches = [patch for patch in patches if patch.intersects(extent)]
+        return patches
+
+    def headers(self):
+        r"""Patch headers as tuples of (grid_number, level, mx, my, xlower,
+        ylower, dx, dy, offset, length)"""
+        return [(patch.grid_number, patch.level, patch.mx, patch.my,
+                 patch.xlower, patch.ylower, patch.dx, patch.dy, patch.offset,
+                 patch.length) for patch in self.patches]
+
+    @property
+    def levels(self):
+        return sorted(set([patch.level for patch in self.patches]))
+
+
+if __name__ == "__main__":
+
+    outdir = "_output"
+    if len(sys.argv) > 2:
+        outdir = sys.argv[2]
+    frame = Frame(int(sys.argv[1]), outdir=outdir)
+    print("Frame %s at t = %s, %s output, %s patches" % (frame.frameno, frame.t,
+                                                         frame.file_format,
+                                                         len(frame.patches)))
+    for level in frame.levels:
+        patches = frame.select(level=level)
+        cells = sum([patch.mx * patch.my for patch in patches])
+        print("  Level %s: %5s patches, %9s cells" % (level, len(patches), cells))
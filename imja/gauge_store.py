@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+r"""Columnar store of gauge time series
+
+Gauge output of one or more runs (ensemble members) is ingested into a
+directory holding one raw little-endian float64 file per column, ``time``,
+``h``, ``hu``, ``hv`` and ``eta``, with the records of every series (one
+gauge of one member) stored contiguously, and ``index.json`` listing the
+series with their member, gauge number, location and record range.  Columns
+are memory mapped when read, so a query only touches the columns it needs.
+
+The queries reduce every selected series in one vectorized pass over the
+columns and return one value per series:
+
+ - :meth:`GaugeStore.peak_stage` - maximum eta
+ - :meth:`GaugeStore.peak_discharge` - maximum |(hu, hv)|, per unit width
+ - :meth:`GaugeStore.arrival_time` - first time h rises more than a
+   threshold above its first sample, NaN if it never does
+ - :meth:`GaugeStore.duration_above` - total time a column is above a
+   threshold
+
+Usage:  python gauge_store.py ingest store outdir [member]
+        python gauge_store.py summary store [threshold]
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import sys
+import os
+import re
+import glob
+import json
+
+import numpy
+
+columns = ("time", "h", "hu", "hv", "eta")
+
+
+def read_gauge_file(path):
+    r"""Read a GeoClaw gaugeNNNNN.txt file
+
+    Returns (gauge number, location, data) with the data columns ordered as
+    *columns*.
+    """
+
+    gauge_id = None
+    location = None
+    with open(path) as gauge_file:
+        for line in gauge_file:
+            if not line.startswith("#"):
+                break
+            match = re.search(r"gauge_id=\s*(\d+)", line)
+            if match is not None:
+                gauge_id = int(match.group(1))
+            match = re.search(r"location=\(\s*(\S+)\s+(\S+)\s*\)", line)
+            if match is not None:
+                location = [float(value.replace("D", "E"))
+                            for value in match.groups()]
+
+    # Columns are level, t, h, hu, hv, eta
+    data = numpy.loadtxt(path, comments="#", ndmin=2)
+    if data.shape[0] > 0 and data.shape[1] < 6:
+        raise IOError("%s does not hold h, hu, hv and eta." % path)
+    return gauge_id, location, data[:, 1:6]
+
+
+def read_fort_gauge(path):
+    r"""Read the older combined fort.gauge file, yielding its gauges as
+    (gauge number, location, data) like :func:`read_gauge_file`"""
+
+    # Columns are gauge number, level, t, h, hu, hv, eta
+    data = numpy.loadtxt(path, ndmin=2)
+    for gauge_id in numpy.unique(data[:, 0]):
+        yield int(gauge_id), None, data[data[:, 0] == gauge_id, 2:7]
+
+
+def output_gauges(outdir):
+    """Gauges of the run in *outdir*"""
+    paths = sorted(glob.glob(os.path.join(outdir, "gauge[0-9]*.txt")))
+    if len(paths) > 0:
+        return [read_gauge_file(path) for path in paths]
+    fort_gauge = os.path.join(outdir, "fort.gauge")
+    if os.path.exists(fort_gauge):
+        return list(read_fort_gauge(fort_gauge))
+    return []
+
+
+def _segment_reduce(ufunc, values, starts, stops):
+    r"""ufunc reduction of values[starts[n]:stops[n]] for every n
+
+    The segments must be sorted, non-empty and not overlap.
+    """
+    indices = numpy.empty(2 * starts.shape[0], dtype=int)
+    indices[0::2] = starts
+    indices[1::2] = stops
+    if indices[-1] == values.shape[0]:
+        indices = indices[:-1]
+    return ufunc.reduceat(values, indices)[0::2]
+
+
+class GaugeStore(object):
+    r"""Gauge time series stored column-wise in *path*"""
+
+    def __init__(self, path):
+        self.path = path
+        self.series = []
+        self._columns = {}
+        index_path = os.path.join(path, "index.json")
+        if os.path.exists(index_path):
+            with open(index_path) as index_file:
+                self.series = json.load(index_file)['series']
+
+    @property
+    def num_records(self):
+        if len(self.series) == 0:
+            return 0
+        return self.series[-1]['stop']
+
+    @property
+    def members(self):
+        return sorted(set([series['member'] for series in self.series]))
+
+    @property
+    def gauges(self):
+        return sorted(set([series['gauge'] for series in self.series]))
+
+    def column(self, name):
+        """Memory mapped column *name*"""
+        if name not in self._columns:
+            self._columns[name] = numpy.memmap(os.path.join(self.path,
+                                                            "%s.f8" % name),
+                                               dtype="<f8", mode="r",
+                                               shape=(self.num_records,))
+        return self._columns[name]
+
+    def ingest(self, outdir, member=None):
+        r"""Append the gauges of the run in *outdir* as ensemble *member*
+
+        *member* defaults to the name of the run directory, the parent of
+        *outdir* if that is called _output.  Returns the number of series
+        added.
+        """
+
+        if member is None:
+            run_dir = os.path.abspath(outdir)
+            if os.path.basename(run_dir) == "_output":
+                run_dir = os.path.dirname(run_dir)
+            member = os.path.basename(run_dir)
+        if member in self.members:
+            raise ValueError("Member %s is already in %s." % (member,
+                                                              self.path))
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+
+        # Drop the memory maps, they are sized for the old record count
+        self._columns = {}
+        added = 0
+        column_files = [open(os.path.join(self.path, "%s.f8" % name), "ab")
+                        for name in columns]
+        try:
+            for (gauge_id, location, data) in output_gauges(outdir):
+                if data.shape[0] == 0:
+                    continue
+                for (m, column_file) in enumerate(column_files):
+                    column_file.write(numpy.ascontiguousarray(data[:, m],
+                                                        dtype="<f8").tobytes())
+                start = self.num_records
+                self.series.append({"member": member,
+                                    "gauge": gauge_id,
+                                    "location": location,
+                                    "start": start,
+                                    "stop": start + data.shape[0]})
+                added += 1
+        finally:
+            for column_file in column_files:
+                column_file.close()
+        self._write_index()
+        return added
+
+    def _write_index(self):
+        temp_path = os.path.join(self.path, "index.json.%s" % os.getpid())
+        with open(temp_path, "w") as index_file:
+            json.dump({"columns": list(columns), "series": self.series},
+                      index_file, indent=1)
+        os.rename(temp_path, os.path.join(self.path, "index.json"))
+
+    def select(self, gauges=None, members=None):
+        """Indices into *series* of the given gauges and members, all if None"""
+        selected = []
+        for (n, series) in enumerate(self.series):
+            if gauges is not None and series['gauge'] not in gauges:
+                continue
+            if members is not None and series['member'] not in members:
+                continue
+            selected.append(n)
+        return numpy.array(selected, dtype=int)
+
+    def _ranges(self, selected):
+        if selected is None:
+            selected = numpy.arange(len(self.series))
+        starts = numpy.array([self.series[n]['start'] for n in selected],
+                             dtype=int)
+        stops = numpy.array([self.series[n]['stop'] for n in selected],
+                            dtype=int)
+        return starts, stops
+
+    def _reduce(self, ufunc, values, selected):
+        r"""Reduce *values* over each selected series
+
+        The selected series lie within the records [lo, hi) and
+        values(lo, hi, starts, stops) returns the quantity to reduce over
+        those records, given the series bounds relative to lo.  *selected*
+        may be in any order and repeat series, each distinct series is
+        reduced once in record order and the results are returned in the
+        order of *selected*.
+        """
+        if selected is None:
+            selected = numpy.arange(len(self.series))
+        selected = numpy.asarray(selected, dtype=int)
+        if selected.shape[0] == 0:
+            return numpy.empty(0)
+        if selected.min() < 0 or selected.max() >= len(self.series):
+            raise IndexError("Selected series out of range.")
+
+        # Series are stored in the order of self.series
+        distinct, inverse = numpy.unique(selected, return_inverse=True)
+        starts, stops = self._ranges(distinct)
+        lo, hi = starts[0], stops[-1]
+        starts = starts - lo
+        stops = stops - lo
+        return _segment_reduce(ufunc, values(lo, hi, starts, stops), starts,
+                               stops)[inverse.reshape(-1)]
+
+    def peak_stage(self, selected=None):
+        """Maximum eta of each selected series"""
+        eta = self.column("eta")
+        return self._reduce(numpy.maximum,
+                            lambda lo, hi, starts, stops: eta[lo:hi],
+                            selected)
+
+    def peak_discharge(self, selected=None):
+        """Maximum discharge per unit width |(hu, hv)| of each selected series"""
+        hu = self.column("hu")
+        hv = self.column("hv")
+        return self._reduce(numpy.maximum,
+                            lambda lo, hi, starts, stops:
+                                numpy.hypot(hu[lo:hi], hv[lo:hi]),
+                            selected)
+
+    def arrival_time(self, threshold=0.1, selected=None):
+        r"""First time h exceeds its first sample by more than *threshold*,
+        NaN for series where it never does"""
+
+        h = self.column("h")
+        time = self.column("time")
+
+        def first_arrival(lo, hi, starts, stops):
+            # Absolute record number where h has risen above threshold
+            series = numpy.searchsorted(starts, numpy.arange(hi - lo),
+                                        side="right") - 1
+            rise = h[lo:hi] - h[lo + starts[series]]
+            return numpy.where(rise > threshold, numpy.arange(lo, hi), hi)
+
+        first = self._reduce(numpy.minimum, first_arrival, selected)
+        starts, stops = self._ranges(selected)
+        arrival = numpy.empty(first.shape[0])
+        arrival.fill(numpy.nan)
+        found = first < stops
+        arrival[found] = time[first[found]]
+        return arrival
+
+    def duration_above(self, threshold, column="h", selected=None):
+        r"""Total time *column* is above *threshold* in each selected series
+
+        A sample above the threshold counts until the next sample.
+        """
+
+        values = self.column(column)
+        time = self.column("time")
+
+        def above(lo, hi, starts, stops):
+            dt = numpy.zeros(hi - lo)
+            dt[:-1] = numpy.diff(time[lo:hi])
+            # The last sample of a series does not carry over to the next
+            dt[stops - 1] = 0.0
+            return numpy.where(values[lo:hi] > threshold, dt, 0.0)
+
+        return self._reduce(numpy.add, above, selected)
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) < 3 or sys.argv[1] not in ("ingest", "summary"):
+        print(__doc__)
+        sys.exit(1)
+
+    store = GaugeStore(sys.argv[2])
+    if sys.argv[1] == "ingest":
+        member = None
+        if len(sys.argv) > 4:
+            member = sys.argv[4]
+        added = store.ingest(sys.argv[3], member=member)
+        print("Added %s gauges to %s" % (added, store.path))
+    else:
+        threshold = 0.1
+        if len(sys.argv) > 3:
+            threshold = float(sys.argv[3])
+        stage = store.peak_stage()
+        discharge = store.peak_discharge()
+        arrival = store.arrival_time(threshold)
+        duration = store.duration_above(threshold)
+        print("%-20s %6s %12s %12s %10s %10s" % ("member", "gauge", "stage",
+                                                "discharge", "arrival",
+                                                "duration"))
+        for (n, series) in enumerate(store.series):
+            print("%-20s %6s %12.3f %12.3f %10.1f %10.1f" % (series['member'],
+                                              series['gauge'], stage[n],
+                                              discharge[n], arrival[n],
+                                              duration[n]))
@@ -0,0 +1,238 @@
+! ::::::::::::::::::::::::: lake_module ::::::::::::::::::::::::::::::::::::
+!
+! Lakes filled to their level by qinit, read from lakes.data (written by
+! setrun.py from the lakes of the location in scenarios.json).
+!
+! A lake is a box [x_low, x_hi] x [y_low, y_hi] and a level.  A cell lying
+! in the box is filled to the level unless its center falls in one of the
+! cutouts, or outside the shoreline polygon or the mask raster when the
+! lake has them.  The mask is a topotype 3 file whose nonzero values mark
+! the lake, looked up at the node nearest the cell center.
+!
+! The data is read once, the first time qinit is called.
+!
+! ::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+module lake_module
+
+    implicit none
+    save
+
+    type lake_type
+        real(kind=8) :: level
+        real(kind=8) :: x_low, x_hi, y_low, y_hi
+
+        ! Shoreline polygon, vertices(:, k) = (x, y), not closed
+        integer :: num_vertices
+        real(kind=8), allocatable :: vertices(:, :)
+
+        ! Boxes excluded from the lake, cutouts(:, k) = (x1, x2, y1, y2)
+        integer :: num_cutouts
+        real(kind=8), allocatable :: cutouts(:, :)
+
+        ! Mask raster, mask(i, j) at (mask_xlower + (i - 1) * mask_dx, ...)
+        logical :: has_mask
+        integer :: mask_mx, mask_my
+        real(kind=8) :: mask_xlower, mask_ylower, mask_dx, mask_dy
+        logical, allocatable :: mask(:, :)
+    end type lake_type
+
+    logical, private :: module_setup = .false.
+
+    integer :: num_lakes = 0
+    type(lake_type), allocatable :: lakes(:)
+
+contains
+
+    ! ========================================================================
+    !  set_lakes(data_file)
+    !    Read the lakes from data_file (lakes.data by default), only done once
+    ! ========================================================================
+    subroutine set_lakes(data_file)
+
+        implicit none
+
+        character(len=*), intent(in), optional :: data_file
+
+        integer, parameter :: iunit = 7
+        integer :: n, k
+        real(kind=8) :: extent(4)
+        character(len=512) :: file_name, mask_file
+        logical :: setup
+
+        ! Pairs with the flush and atomic write once the lakes are read
+        !$OMP ATOMIC READ
+        setup = module_setup
+        !$OMP FLUSH
+        if (setup) return
+
+        !$OMP CRITICAL (lake_setup)
+        if (.not. module_setup) then
+
+            if (present(data_file)) then
+                file_name = data_file
+            else
+                file_name = 'lakes.data'
+            end if
+
+            call opendatafile(iunit, file_name)
+            read(iunit, *) num_lakes
+            allocate(lakes(num_lakes))
+
+            do n = 1, num_lakes
+                read(iunit, *) extent
+                lakes(n)%x_low = extent(1)
+                lakes(n)%x_hi = extent(2)
+                lakes(n)%y_low = extent(3)
+                lakes(n)%y_hi = extent(4)
+                read(iunit, *) lakes(n)%level
+
+                read(iunit, *) lakes(n)%num_vertices
+                allocate(lakes(n)%vertices(2, lakes(n)%num_vertices))
+                if (lakes(n)%num_vertices > 0) then
+                    read(iunit, *) (lakes(n)%vertices(:, k),                 &
+                                    k = 1, lakes(n)%num_vertices)
+                end if
+
+                read(iunit, *) lakes(n)%num_cutouts
+                allocate(lakes(n)%cutouts(4, lakes(n)%num_cutouts))
+                if (lakes(n)%num_cutouts > 0) then
+                    read(iunit, *) (lakes(n)%cutouts(:, k),                  &
+                                    k = 1, lakes(n)%num_cutouts)
+                end if
+
+                read(iunit, *) mask_file
+                lakes(n)%has_mask = len_trim(mask_file) > 0
+                if (lakes(n)%has_mask) then
+                    call read_mask(lakes(n), trim(mask_file))
+                end if
+            end do
+            close(iunit)
+
+            write(6, '(" Read ",i3," lakes from ",a)') num_lakes,            &
+                                                       trim(file_name)
+            !$OMP FLUSH
+            !$OMP ATOMIC WRITE
+            module_setup = .true.
+        end if
+        !$OMP END CRITICAL (lake_setup)
+
+    end subroutine set_lakes
+
+    ! ========================================================================
+    !  read_mask(lake, path)
+    !    Read a topotype 3 mask raster, rows are stored north first
+    ! ========================================================================
+    subroutine read_mask(lake, path)
+
+        implicit none
+
+        type(lake_type), intent(inout) :: lake
+        character(len=*), intent(in) :: path
+
+        integer, parameter :: iunit = 8
+        integer :: j, ios
+        real(kind=8) :: no_data_value
+        real(kind=8), allocatable :: row(:)
+        character(len=256) :: line
+
+        open(unit=iunit, file=path, status='old', form='formatted',          &
+             iostat=ios)
+        if (ios /= 0) then
+            print *, 'lake_module: cannot open mask file ', path
+            stop
+        end if
+
+        read(iunit, *) lake%mask_mx
+        read(iunit, *) lake%mask_my
+        read(iunit, *) lake%mask_xlower
+        read(iunit, *) lake%mask_ylower
+        ! The cell size line holds dx or dx and dy
+        read(iunit, '(a)') line
+        read(line, *, iostat=ios) lake%mask_dx, lake%mask_dy
+        if (ios /= 0) then
+            read(line, *) lake%mask_dx
+            lake%mask_dy = lake%mask_dx
+        end if
+        read(iunit, *) no_data_value
+
+        allocate(lake%mask(lake%mask_mx, lake%mask_my))
+        allocate(row(lake%mask_mx))
+        do j = lake%mask_my, 1, -1
+            read(iunit, *) row
+            lake%mask(:, j) = row /= 0.d0 .and. row /= no_data_value
+        end do
+        close(iunit)
+        deallocate(row)
+
+    end subroutine read_mask
+
+    ! ========================================================================
+    !  in_lake(lake, x, y)
+    !    True if the point (x, y) in the box of lake belongs to the lake
+    ! ========================================================================
+    logical function in_lake(lake, x, y)
+
+        implicit none
+
+        type(lake_type), intent(in) :: lake
+        real(kind=8), intent(in) :: x, y
+
+        integer :: k, i, j
+
+        in_lake = .true.
+
+        do k = 1, lake%num_cutouts
+            if (lake%cutouts(1, k) <= x .and. x <= lake%cutouts(2, k) .and. &
+                lake%cutouts(3, k) <= y .and. y <= lake%cutouts(4, k)) then
+                in_lake = .false.
+                return
+            end if
+        end do
+
+        if (lake%num_vertices > 0) then
+            in_lake = in_polygon(lake%num_vertices, lake%vertices, x, y)
+            if (.not. in_lake) return
+        end if
+
+        if (lake%has_mask) then
+            i = nint((x - lake%mask_xlower) / lake%mask_dx) + 1
+            j = nint((y - lake%mask_ylower) / lake%mask_dy) + 1
+            if (i < 1 .or. i > lake%mask_mx .or.                            &
+                j < 1 .or. j > lake%mask_my) then
+                in_lake = .false.
+            else
+                in_lake = lake%mask(i, j)
+            end if
+        end if
+
+    end function in_lake
+
+    ! ========================================================================
+    !  in_polygon(num_vertices, vertices, x, y)
+    !    Even-odd rule test of (x, y) against the closed polygon
+    ! ========================================================================
+    logical function in_polygon(num_vertices, vertices, x, y)
+
+        implicit none
+
+        integer, intent(in) :: num_vertices
+        real(kind=8), intent(in) :: vertices(2, num_vertices), x, y
+
+        integer :: k, m
+
+        in_polygon = .false.
+        m = num_vertices
+        do k = 1, num_vertices
+            if ((vertices(2, k) > y) .neqv. (vertices(2, m) > y)) then
+                if (x < vertices(1, k) + (y - vertices(2, k))                &
+                            * (vertices(1, m) - vertices(1, k))              &
+                            / (vertices(2, m) - vertices(2, k))) then
+                    in_polygon = .not. in_polygon
+                end if
+            end if
+            m = k
+        end do
+
+    end function in_polygon
+
+end module lake_module
@@ -1,63 +1,62 @@
-
 subroutine qinit(meqn, mbc, mx, my, xlower, ylower, dx, dy, q, maux, aux)
-    
-    use geoclaw_module, only: sea_level
-    
+
+    use lake_module, only: set_lakes, num_lakes, lakes, in_lake
+    use instrument_module, only: start_timer, record_qinit
+
     implicit none
-    
+
     ! Subroutine arguments
     integer, intent(in) :: meqn,mbc,mx,my,maux
     real(kind=8), intent(in) :: xlower,ylower,dx,dy
     real(kind=8), intent(inout) :: q(meqn,1-mbc:mx+mbc,1-mbc:my+mbc)
     real(kind=8), intent(inout) :: aux(maux,1-mbc:mx+mbc,1-mbc:my+mbc)
-    
-    type lake_region
-        ! Lake shoreline elevation
-        real(kind=8) :: lake_level
-
-        ! Region specification
-        real(kind=8) :: lower(2)
-        real(kind=8) :: upper(2)
-
-    end type lake_region
-
-    type(lake_region), allocatable :: lake_regions(:), cutout_regions(:)
 
     ! Locals
-    integer :: i, j, n, k, region
-    integer :: num_regions
-    real(kind=8) :: xm, x, xp, ym, y, yp, x_c, y_c
-
-    ! Lake Regions - Data for setting lake_level
-    num_regions = 1
-    allocate(lake_regions(num_regions))
-
-    lake_regions(1)%lake_level = 5000.d0
-    lake_regions(1)%lower = [86.910814d0, 27.883193d0]
-    lake_regions(1)%upper = [86.951576d0, 27.912485d0]
-
-    ! Loop through locations and set anything below given 
-    do j = 1, my
-        ym = ylower + j * dy
-        y = ylower + (j - 0.5d0) * dy
-        yp = ylower + (j + 1.d0) * dy
-        do i = 1, mx
-            xm = xlower + i * dx
-            x = xlower + (i - 0.5d0) * dx
-            xp = xlower + (i + 1.d0) * dx
-
-            do n = 1, num_regions
-                if (lake_regions(n)%lower(1) <= xm .and.            &
-                    xp <= lake_regions(n)%upper(1) .and.            &
-                    lake_regions(n)%lower(2) <= ym .and.            &
-                    yp <= lake_regions(n)%upper(2)) then
-
-                    q(1, i, j) = max(0.d0, lake_regions(n)%lake_level &
-                             - aux(1, i, j))
-
+    integer :: i, j, n
+    integer :: i_low, i_hi, j_low, j_hi
+    real(kind=8) :: xm, x, xp, ym, y, yp, xupper, yupper
+    integer(kind=8) :: clock
+
+    call start_timer(clock)
+
+    ! Lakes from lakes.data, read on the first call
+    call set_lakes()
+
+    xupper = xlower + mx * dx
+    yupper = ylower + my * dy
+
+    ! Fill the cells lying in a lake up to its level, going backwards so the
+    ! first lake in lakes.data containing a cell wins
+    do n = num_lakes, 1, -1
+
+        ! Skip lakes whose box misses this patch
+        if (lakes(n)%x_hi < xlower .or. xupper < lakes(n)%x_low .or.        &
+            lakes(n)%y_hi < ylower .or. yupper < lakes(n)%y_low) cycle
+
+        ! Cells that can lie in the box, one spare on each side for round off
+        i_low = max(1, int((lakes(n)%x_low - xlower) / dx))
+        i_hi = min(mx, int((lakes(n)%x_hi - xlower) / dx) + 1)
+        j_low = max(1, int((lakes(n)%y_low - ylower) / dy))
+        j_hi = min(my, int((lakes(n)%y_hi - ylower) / dy) + 1)
+
+        do j = j_low, j_hi
+            ym = ylower + (j - 1.d0) * dy
+            y = ylower + (j - 0.5d0) * dy
+            yp = ylower + j * dy
+            if (ym < lakes(n)%y_low .or. lakes(n)%y_hi < yp) cycle
+            do i = i_low, i_hi
+                xm = xlower + (i - 1.d0) * dx
+                x = xlower + (i - 0.5d0) * dx
+                xp = xlower + i * dx
+                if (xm < lakes(n)%x_low .or. lakes(n)%x_hi < xp) cycle
+
+                if (in_lake(lakes(n), x, y)) then
+                    q(1, i, j) = max(0.d0, lakes(n)%level - aux(1, i, j))
                 end if
             end do
         end do
     end do
 
-end subroutine qinit
\ No newline at end of file
+    call record_qinit(dx, mx, my, clock)
+
+end subroutine qinit
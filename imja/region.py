@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+r"""Region of interest subsetting of output frames
+
+The patch headers of every frame in an output directory are indexed once and
+kept in ``patch_index.json`` in that directory, so asking for the patches of
+a frame that intersect a box never rescans fort.qNNNN.  An entry is rebuilt
+when its fort.qNNNN changes.  Only the intersecting patches are read, see
+frame_reader.py.
+
+:func:`resample` samples a frame onto a uniform grid over a box, taking each
+point from the finest patch covering it.
+
+Usage:  python region.py frameno region [outdir]
+
+where region is "lake", a region named in scenarios.json or x1,x2,y1,y2.
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import sys
+import os
+import json
+
+import numpy
+
+import frame_reader
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                ".."))
+import catalog
+
+# Named boxes [x1, x2, y1, y2] from scenarios.json, the lake and the regions
+# of imja, where the villages are a ~1 km box around their gauges
+_location = catalog.location("imja")
+regions = dict(_location['regions'])
+regions['lake'] = _location['lakes'][0]['extent']
+
+index_name = "patch_index.json"
+
+
+class PatchIndex(object):
+    r"""Patch headers of the frames in *outdir*, built once and kept on disk"""
+
+    def __init__(self, outdir="_output"):
+        self.outdir = outdir
+        self.path = os.path.join(outdir, index_name)
+        self.frames = {}
+        self._modified = False
+        if os.path.exists(self.path):
+            with open(self.path) as index_file:
+                self.frames = json.load(index_file)
+
+    def _stamp(self, frameno):
+        stat = os.stat(os.path.join(self.outdir, "fort.q%04d" % frameno))
+        return [stat.st_size, stat.st_mtime]
+
+    def frame(self, frameno):
+        """:class:`frame_reader.Frame` of *frameno* built from the index"""
+        key = str(frameno)
+        stamp = self._stamp(frameno)
+        entry = self.frames.get(key, None)
+        if entry is not None and entry['stamp'] == stamp:
+            return frame_reader.Frame(frameno, self.outdir,
+                                      headers=entry['headers'])
+
+        frame = frame_reader.Frame(frameno, self.outdir)
+        self.frames[key] = {"stamp": stamp, "headers": frame.headers()}
+        self._modified = True
+        return frame
+
+    def save(self):
+        """Write the index back if frames were added"""
+        if not self._modified:
+            return
+        temp_path = "%s.%s" % (self.path, os.getpid())
+        with open(temp_path, "w") as index_file:
+            json.dump(self.frames, index_file)
+        os.rename(temp_path, self.path)
+        self._modified = False
+
+
+_indices = {}
+
+def patch_index(outdir="_output"):
+    """Shared :class:`PatchIndex` of *outdir*"""
+    outdir = os.path.abspath(outdir)
+    if outdir not in _indices:
+        _indices[outdir] = PatchIndex(outdir)
+    return _indices[outdir]
+
+
+def _extent(region):
+    if isinstance(region, str):
+        return regions[region.lower()]
+    return list(region)
+
+
+def region_patches(frameno, region, outdir="_output", level=None):
+    r"""Patches of *frameno* intersecting *region*
+
+    :Input:
+     - *region* (str or list) Name of one of *regions* or [x1, x2, y1, y2]
+     - *level* (int or list) Only return patches on these levels
+    """
+    index = patch_index(outdir)
+    frame = index.frame(frameno)
+    index.save()
+    return frame.select(level=level, extent=_extent(region))
+
+
+def sample(patches, x, y, var=0, out=None):
+    r"""Sample *patches* at the points (x[i], y[j]) into out[j, i]
+
+    Patches are visited coarsest first so finer ones overwrite them.  *var*
+    is a component of q or a function of q returning a (mx, my) array.
+    Points no patch covers are left as they are in *out* (NaN by default).
+    """
+
+    if out is None:
+        out = numpy.empty((y.shape[0], x.shape[0]))
+        out.fill(numpy.nan)
+    for patch in sorted(patches, key=lambda patch: patch.level):
+        # The points are sorted so those in the patch form a block
+        i1, i2 = numpy.searchsorted(x, [patch.xlower, patch.xupper])
+        j1, j2 = numpy.searchsorted(y, [patch.ylower, patch.yupper])
+        if i1 == i2 or j1 == j2:
+            continue
+        i = numpy.minimum(((x[i1:i2] - patch.xlower) / patch.dx).astype(int),
+                          patch.mx - 1)
+        j = numpy.minimum(((y[j1:j2] - patch.ylower) / patch.dy).astype(int),
+                          patch.my - 1)
+        if callable(var):
+            values = var(patch.q)
+        else:
+            values = patch.q[var]
+        out[j1:j2, i1:i2] = values[numpy.ix_(i, j)].T
+    return out
+
+
+def resample(frameno, region, delta, outdir="_output", var=0):
+    r"""Sample *frameno* onto a uniform grid over *region*
+
+    :Input:
+     - *region* (str or list) Name of one of *regions* or [x1, x2, y1, y2]
+     - *delta* (float) Grid spacing, the grid points are cell centers
+     - *var* (int or function) Component of q or function of q to sample
+
+    :Output:
+     - (x, y, values) with values[j, i] at (x[i], y[j])
+    """
+
+    extent = _extent(region)
+    x = numpy.arange(extent[0] + 0.5 * delta, extent[1], delta)
+    y = numpy.arange(extent[2] + 0.5 * delta, extent[3], delta)
+    patches = region_patches(frameno, extent, outdir=outdir)
+    return x, y, sample(patches, x, y, var=var)
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) < 3:
+        print(__doc__)
+        print("Available regions:")
+        for name in regions.keys():
+            print("  %s" % name)
+        sys.exit(0)
+
+    frameno = int(sys.argv[1])
+    region = sys.argv[2]
+    if "," in region:
+        region = [float(value) for value in region.split(",")]
+    outdir = "_output"
+    if len(sys.argv) > 3:
+        outdir = sys.argv[3]
+
+    patches = region_patches(frameno, region, outdir=outdir)
+    cells = sum([patch.mx * patch.my for patch in patches])
+    frame = patches[0].frame if len(patches) > 0 else None
+    total = 0 if frame is None else len(frame.patches)
+    print("%s of %s patches (%s cells) intersect %s" % (len(patches), total,
+                                                         cells, region))
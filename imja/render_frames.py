@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+r"""Render the frame figures of setplot.py in a pool of processes
+
+Frames are handed out to the workers one at a time.  A worker loads the
+patches of its frame once and renders every frame figure from that load,
+i.e. both "Surface Full Domain" and "Surface Zoom 1", then drops the frame
+before taking the next one.  The time spent loading and rendering each
+frame is reported and written to render_timings.json in the plot directory
+together with a simple index.html of the figures.
+
+Gauge figures are not rendered here, use "make .plots" for those.
+
+Usage:  python render_frames.py [outdir] [plotdir] [processes] [frames]
+
+where frames is a comma separated list of frame numbers, all by default.
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import os
+import sys
+import glob
+import time
+import json
+import multiprocessing
+
+_plotdata = None
+
+
+def output_frames(outdir):
+    """Frame numbers with output in *outdir*"""
+    frames = []
+    for path in glob.glob(os.path.join(outdir, "fort.t[0-9]*")):
+        frames.append(int(os.path.basename(path)[6:]))
+    return sorted(frames)
+
+
+def _setup(outdir, plotdir):
+    """Build plotdata in each worker, rendering goes to plotdir"""
+    global _plotdata
+
+    import matplotlib
+    matplotlib.use("Agg")
+    from clawpack.visclaw.data import ClawPlotData
+    import setplot
+
+    outdir = os.path.abspath(outdir)
+    plotdir = os.path.abspath(plotdir)
+    _plotdata = ClawPlotData()
+    _plotdata.outdir = outdir
+    _plotdata.plotdir = plotdir
+    _plotdata = setplot.setplot(_plotdata)
+    _plotdata.outdir = outdir
+    _plotdata.plotdir = plotdir
+    _plotdata.parallel = False
+    _plotdata.save_frames = True
+    os.chdir(plotdir)
+
+
+def render(frameno):
+    """Load *frameno* once and render all of its figures"""
+    from clawpack.visclaw import frametools
+    import matplotlib.pyplot as plt
+
+    tic = time.time()
+    _plotdata.getframe(frameno)
+    load_time = time.time() - tic
+
+    tic = time.time()
+    frametools.plotframe(frameno, _plotdata, verbose=False)
+    plt.close("all")
+    render_time = time.time() - tic
+
+    # Only one frame is kept in memory at a time
+    if hasattr(_plotdata, "framesoln_dict"):
+        _plotdata.framesoln_dict.clear()
+
+    return frameno, load_time, render_time, os.getpid()
+
+
+def frame_figures(outdir):
+    """Figure numbers and names of the frame figures in setplot"""
+    _setup(outdir, ".")
+    figures = []
+    for name in _plotdata._fignames:
+        plotfigure = _plotdata.plotfigure_dict[name]
+        if plotfigure.type == "each_frame" and plotfigure.show:
+            figures.append((plotfigure.figno, name))
+    return figures
+
+
+def write_index(plotdir, frames, figures):
+    """Write a bare index.html linking every rendered figure"""
+    with open(os.path.join(plotdir, "index.html"), "w") as index:
+        index.write("<html><body>\n")
+        for frameno in frames:
+            index.write("<h3>Frame %s</h3>\n" % frameno)
+            for (figno, name) in figures:
+                index.write('<a href="frame%04dfig%s.png">'
+                            '<img src="frame%04dfig%s.png" width=400 '
+                            'title="%s"></a>\n' % (frameno, figno, frameno,
+                                                   figno, name))
+        index.write("</body></html>\n")
+
+
+def render_frames(outdir="_output", plotdir="_plots", processes=None,
+                  frames=None):
+    r"""Render *frames* (default all in *outdir*) with a process pool
+
+    Returns a list of (frameno, load seconds, render seconds, pid).
+    """
+
+    if not os.path.exists(plotdir):
+        os.makedirs(plotdir)
+    if frames is None:
+        frames = output_frames(outdir)
+
+    tic = time.time()
+    timings = []
+    pool = multiprocessing.Pool(processes=processes, initializer=_setup,
+                                initargs=(outdir, plotdir))
+    try:
+        for timing in pool.imap_unordered(render, frames):
+            print("Frame %4s: load %7.2f s, render %7.2f s (pid %s)" % timing)
+            timings.append(timing)
+    finally:
+        pool.close()
+        pool.join()
+    total = time.time() - tic
+
+    timings.sort()
+    with open(os.path.join(plotdir, "render_timings.json"), "w") as out_file:
+        json.dump({"total": total,
+                   "frames": [dict(zip(("frame", "load", "render", "pid"),
+                                       timing)) for timing in timings]},
+                  out_file, indent=1)
+    write_index(plotdir, frames, frame_figures(outdir))
+
+    load = sum([timing[1] for timing in timings])
+    render = sum([timing[2] for timing in timings])
+    print("%s frames in %.2f s wall, %.2f s loading and %.2f s rendering"
+                                    % (len(timings), total, load, render))
+    return timings
+
+
+if __name__ == "__main__":
+
+    outdir = "_output"
+    plotdir = "_plots"
+    processes = None
+    frames = None
+    if len(sys.argv) > 1:
+        outdir = sys.argv[1]
+    if len(sys.argv) > 2:
+        plotdir = sys.argv[2]
+    if len(sys.argv) > 3:
+        processes = int(sys.argv[3])
+    if len(sys.argv) > 4:
+        frames = [int(frameno) for frameno in sys.argv[4].split(",")]
+
+    render_frames(outdir, plotdir, processes=processes, frames=frames)
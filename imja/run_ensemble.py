@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+r"""Generate, launch and collect an ensemble of GeoClaw runs
+
+Every member is a slide scenario of the catalog (scenarios.json), or a
+variant of one from sweeping its parameters as in ensemble_dtopo.py, e.g.
+
+    python run_ensemble.py snow_line --sweep sigma=250:500:6 -j 8 -t 4
+
+runs the 6 variants of snow_line, 8 at a time with 4 OpenMP threads each.
+
+The dtopo files are built first with ensemble_dtopo.py (using the dtopo
+cache).  Each member then gets a run directory ``<ensemble>/<name>`` whose
+``_output`` holds the data files written by setrun.py for that scenario and
+the output of the xgeoclaw run, which is launched there with its log in
+``<name>/xgeoclaw.log``.  As runs finish their gauges are ingested into the
+gauge store ``<ensemble>/gauges`` (see gauge_store.py) and their outcome
+recorded in ``<ensemble>/results.json``.  Members that already completed
+are skipped, so an interrupted ensemble can simply be run again.
+
+xgeoclaw has to be built first, e.g. with "make .exe".
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import sys
+import os
+import time
+import json
+import argparse
+import subprocess
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+import gauge_store
+from render_frames import output_frames
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+topo_dir = os.path.abspath(os.path.join(base_dir, "..", "topo"))
+
+sys.path.insert(0, os.path.join(base_dir, ".."))
+import catalog
+
+
+def load_results(ensemble_dir):
+    """Contents of results.json in *ensemble_dir*, empty if there is none"""
+    path = os.path.join(ensemble_dir, "results.json")
+    if not os.path.exists(path):
+        return {"members": {}}
+    with open(path) as results_file:
+        return json.load(results_file)
+
+
+def save_results(ensemble_dir, results):
+    path = os.path.join(ensemble_dir, "results.json")
+    temp_path = "%s.%s" % (path, os.getpid())
+    with open(temp_path, "w") as results_file:
+        json.dump(results, results_file, indent=1, sort_keys=True)
+    os.rename(temp_path, path)
+
+
+def build_dtopo(location, members, ensemble_dir, processes=None, **kwargs):
+    r"""Build the dtopo files of *members*, a list of (name, scenario)
+
+    Returns a dict mapping the names built successfully to their paths.
+    """
+
+    sys.path.insert(0, topo_dir)
+    import ensemble_dtopo
+
+    out_dir = os.path.join(ensemble_dir, "dtopo")
+    cwd = os.getcwd()
+    os.chdir(topo_dir)
+    try:
+        results = ensemble_dtopo.build_ensemble(location, members,
+                                                out_dir=out_dir,
+                                                processes=processes, **kwargs)
+    finally:
+        os.chdir(cwd)
+
+    return dict([(name, path) for (name, path, status, seconds) in results
+                                            if not status.startswith("failed")])
+
+
+def write_run(run_dir, name, dtopo_path):
+    """Write the data files of member *name* to *run_dir*/_output"""
+
+    import setrun
+
+    out_dir = os.path.join(run_dir, "_output")
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+    rundata = setrun.setrun(scenario_name=name, dtopo_path=dtopo_path,
+                            topo_dir=topo_dir)
+    cwd = os.getcwd()
+    os.chdir(out_dir)
+    try:
+        rundata.write()
+    finally:
+        os.chdir(cwd)
+    return out_dir
+
+
+def launch(job):
+    """Thread pool worker, run xgeoclaw for one member and wait for it"""
+
+    name, run_dir, executable, threads = job
+    env = dict(os.environ)
+    env['OMP_NUM_THREADS'] = str(threads)
+
+    tic = time.time()
+    with open(os.path.join(run_dir, "xgeoclaw.log"), "w") as log:
+        returncode = subprocess.call([executable],
+                                     cwd=os.path.join(run_dir, "_output"),
+                                     stdout=log, stderr=subprocess.STDOUT,
+                                     env=env)
+    return name, returncode, time.time() - tic
+
+
+def run_ensemble(location, members, ensemble_dir, processes=None, threads=1,
+                 executable=None, force=False, dtopo_options={}):
+    r"""Build, run and collect *members*, a list of (name, scenario)
+
+    :Input:
+     - *processes* (int) Number of concurrent runs, by default as many as
+       fit in the cores with *threads* each
+     - *threads* (int) OpenMP threads of every run
+     - *executable* (path) xgeoclaw to run, ./xgeoclaw by default
+     - *force* (bool) Rerun members that already completed, gauges already
+       in the store are kept
+
+    Returns the results dict also written to results.json.
+    """
+
+    import setrun
+    if location != setrun.location_name:
+        raise ValueError("setrun.py sets up %s, cannot run %s."
+                                        % (setrun.location_name, location))
+
+    ensemble_dir = os.path.abspath(ensemble_dir)
+    if executable is None:
+        executable = os.path.join(base_dir, "xgeoclaw")
+    executable = os.path.abspath(executable)
+    if not os.path.exists(executable):
+        raise IOError("%s does not exist, build it with make .exe."
+                                                                % executable)
+    if processes is None:
+        processes = max(1, multiprocessing.cpu_count() // threads)
+    if not os.path.exists(ensemble_dir):
+        os.makedirs(ensemble_dir)
+
+    results = load_results(ensemble_dir)
+    store = gauge_store.GaugeStore(os.path.join(ensemble_dir, "gauges"))
+    todo = [(name, scenario) for (name, scenario) in members
+              if force or results['members'].get(name, {}).get('status') != "done"]
+    print("%s of %s members to run" % (len(todo), len(members)))
+    if len(todo) == 0:
+        return results
+
+    dtopo_paths = build_dtopo(location, todo, ensemble_dir,
+                              processes=multiprocessing.cpu_count(),
+                              **dtopo_options)
+
+    jobs = []
+    for (name, scenario) in todo:
+        run_dir = os.path.join(ensemble_dir, name)
+        entry = {"scenario": scenario, "run_dir": run_dir}
+        results['members'][name] = entry
+        if name not in dtopo_paths:
+            entry['status'] = "dtopo failed"
+            continue
+        write_run(run_dir, name, os.path.abspath(dtopo_paths[name]))
+        entry['status'] = "queued"
+        jobs.append((name, run_dir, executable, threads))
+    save_results(ensemble_dir, results)
+
+    # Results are collected here, one at a time, as the runs finish
+    pool = ThreadPool(processes)
+    try:
+        for (name, returncode, wall_time) in pool.imap_unordered(launch, jobs):
+            entry = results['members'][name]
+            entry['returncode'] = returncode
+            entry['wall_time'] = wall_time
+            if returncode == 0:
+                out_dir = os.path.join(entry['run_dir'], "_output")
+                entry['frames'] = len(output_frames(out_dir))
+                if name not in store.members:
+                    entry['gauges'] = store.ingest(out_dir, member=name)
+                entry['status'] = "done"
+            else:
+                entry['status'] = "failed"
+            save_results(ensemble_dir, results)
+            print("%-50s %-8s %10.1f s" % (name, entry['status'], wall_time))
+    finally:
+        pool.close()
+        pool.join()
+
+    return results
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("scenarios", nargs="*",
+                        help="Base scenarios, defaults to all of the location")
+    parser.add_argument("--location", default="imja",
+                        help="Location setrun.py sets up, only imja")
+    parser.add_argument("--sweep", action="append", default=[],
+                        metavar="PARAM=RANGE",
+                        help="Sweep PARAM over RANGE, may be repeated")
+    parser.add_argument("-j", "--processes", type=int, default=None,
+                        help="Concurrent runs")
+    parser.add_argument("-t", "--threads", type=int, default=1,
+                        help="OpenMP threads per run")
+    parser.add_argument("--ensemble-dir", default="_ensemble")
+    parser.add_argument("--executable", default=None)
+    parser.add_argument("-N", type=int, default=100,
+                        help="dtopo grid size")
+    parser.add_argument("--points-per-sigma", type=float, default=None,
+                        help="Sample the dtopo around the slide instead")
+    parser.add_argument("--force", action="store_true")
+    args = parser.parse_args()
+
+    ranges = {}
+    for spec in args.sweep:
+        key, values = spec.split("=")
+        ranges[key] = catalog.parse_range(values)
+    members = list(catalog.scenarios(args.location,
+                                     names=args.scenarios or None,
+                                     ranges=ranges))
+
+    results = run_ensemble(args.location, members, args.ensemble_dir,
+                           processes=args.processes, threads=args.threads,
+                           executable=args.executable, force=args.force,
+                           dtopo_options={"N": args.N, "force": args.force,
+                                          "points_per_sigma":
+                                                    args.points_per_sigma})
+    failed = [name for (name, entry) in results['members'].items()
+                                            if entry['status'] != "done"]
+    print("%s members, %s not done" % (len(results['members']), len(failed)))
+    if len(failed) > 0:
+        sys.exit(1)
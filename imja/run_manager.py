@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+r"""Run xgeoclaw in checkpointed segments that resume automatically
+
+Each invocation runs one segment of a simulation in *outdir*:
+
+ 1. The latest valid checkpoint is looked up.  A checkpoint fort.chkXXXXX
+    counts as valid once its fort.tckXXXXX companion, which GeoClaw writes
+    after the checkpoint itself, exists and is not older than it.  If there
+    is one, claw.data is rewritten to restart from it.
+ 2. claw.data is set to checkpoint every *checkpt_interval* level 1 steps
+    (checkpt_style 3), chosen from the wall time per level 1 step measured
+    in earlier segments so that a checkpoint is written about every
+    *checkpoint_every* seconds.
+ 3. xgeoclaw is run, timing its level 1 steps from the progress lines it
+    prints (verbosity >= 1) and pruning all but the *keep* latest valid
+    checkpoints as new ones appear.  With a *wall_limit* the run is stopped
+    shortly before the limit, the next segment resumes from its last
+    checkpoint.
+
+The measurements and segments are kept in run_manager.json in *outdir*, so
+a batch job only needs to call this script until it reports the run done.
+
+Usage:  python run_manager.py [outdir] [--wall-limit S] [--keep N] ...
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import sys
+import os
+import re
+import glob
+import time
+import json
+import shutil
+import argparse
+import subprocess
+
+state_name = "run_manager.json"
+
+# Progress line GeoClaw prints for every level 1 step
+step_pattern = re.compile(r"AMRCLAW:\s+level\s+1\s+CFL\s*=\s*\S+\s+"
+                          r"dt\s*=\s*(\S+)\s+final t\s*=\s*(\S+)")
+
+
+def checkpoints(outdir):
+    r"""Valid checkpoints in *outdir* as a list of (time, chk path, tck path)
+    sorted by time"""
+
+    valid = []
+    for tck_path in glob.glob(os.path.join(outdir, "fort.tck*")):
+        chk_path = tck_path.replace("fort.tck", "fort.chk")
+        if not os.path.exists(chk_path):
+            continue
+        if os.path.getmtime(tck_path) < os.path.getmtime(chk_path):
+            continue
+        with open(tck_path) as tck_file:
+            match = re.search(r"time\s+t\s*=\s*(\S+)", tck_file.read())
+        if match is None:
+            continue
+        valid.append((float(match.group(1).replace("D", "E")), chk_path,
+                      tck_path))
+    return sorted(valid)
+
+
+def prune_checkpoints(outdir, keep=2):
+    """Remove all but the *keep* latest valid checkpoints, returns the removed"""
+    removed = checkpoints(outdir)[:-keep]
+    for (t, chk_path, tck_path) in removed:
+        os.remove(chk_path)
+        os.remove(tck_path)
+    return removed
+
+
+def read_data_value(path, name):
+    """Value of *name* in the data file *path* as the string written"""
+    with open(path) as data_file:
+        for line in data_file:
+            if "=:" in line and line.split("=:")[1].split()[0] == name:
+                return line.split("=:")[0].strip()
+    raise KeyError("%s not found in %s." % (name, path))
+
+
+def set_data_values(path, values, insert_after={}):
+    r"""Replace the values of the entries in *values* in the data file *path*
+
+    An entry missing from the file is inserted after the entry named in
+    *insert_after*, the Fortran code reads the values in order.
+    """
+
+    with open(path) as data_file:
+        lines = data_file.readlines()
+
+    def entry_name(line):
+        if "=:" in line:
+            return line.split("=:")[1].split()[0]
+        return None
+
+    missing = set(values.keys()) - set([entry_name(line) for line in lines])
+    new_lines = []
+    for line in lines:
+        name = entry_name(line)
+        if name in values:
+            new_lines.append("%-25s =: %s\n" % (values[name], name))
+        else:
+            new_lines.append(line)
+        for (key, after) in insert_after.items():
+            if after == name and key in missing:
+                new_lines.append("%-25s =: %s\n" % (values[key], key))
+                missing.discard(key)
+    if len(missing) > 0:
+        raise KeyError("%s not found in %s." % (", ".join(sorted(missing)),
+                                                path))
+
+    with open(path, "w") as data_file:
+        data_file.writelines(new_lines)
+
+
+def load_state(outdir):
+    path = os.path.join(outdir, state_name)
+    if not os.path.exists(path):
+        return {"seconds_per_step": None, "segments": [], "status": "new"}
+    with open(path) as state_file:
+        return json.load(state_file)
+
+
+def save_state(outdir, state):
+    path = os.path.join(outdir, state_name)
+    with open("%s.tmp" % path, "w") as state_file:
+        json.dump(state, state_file, indent=1)
+    os.rename("%s.tmp" % path, path)
+
+
+def checkpoint_interval(seconds_per_step, checkpoint_every, default=10):
+    """Level 1 steps between checkpoints to write one every *checkpoint_every* s"""
+    if not seconds_per_step:
+        return default
+    return max(1, int(checkpoint_every / seconds_per_step))
+
+
+def prepare(outdir, rundir="."):
+    """Copy the data files from *rundir* if *outdir* does not have them yet"""
+    if not os.path.exists(outdir):
+        os.makedirs(outdir)
+    if not os.path.exists(os.path.join(outdir, "claw.data")):
+        for path in glob.glob(os.path.join(rundir, "*.data")):
+            shutil.copy(path, outdir)
+
+
+def run_segment(outdir="_output", executable="./xgeoclaw", wall_limit=None,
+                checkpoint_every=900.0, keep=2, margin=120.0, rundir="."):
+    r"""Run the next segment of the simulation in *outdir*
+
+    :Input:
+     - *wall_limit* (float) Seconds this segment may take, unlimited if None
+     - *checkpoint_every* (float) Target wall seconds between checkpoints,
+       at most a quarter of *wall_limit*
+     - *keep* (int) Number of valid checkpoints kept
+     - *margin* (float) Seconds before *wall_limit* at which the run stops
+
+    Returns the state written to run_manager.json, its "status" is "done"
+    once the simulation reached tfinal.
+    """
+
+    prepare(outdir, rundir)
+    executable = os.path.abspath(executable)
+    data_path = os.path.join(outdir, "claw.data")
+    state = load_state(outdir)
+    if state['status'] == "done":
+        print("Run in %s is already done." % outdir)
+        return state
+    if wall_limit is not None:
+        checkpoint_every = min(checkpoint_every, wall_limit / 4.0)
+
+    # Resume from the latest checkpoint, or start from scratch
+    values = {}
+    latest = checkpoints(outdir)
+    if len(latest) > 0:
+        t_restart, chk_path = latest[-1][:2]
+        values['restart'] = "T"
+        values['restart_file'] = "'%s'" % os.path.basename(chk_path)
+        print("Restarting from %s at t = %s" % (chk_path, t_restart))
+    else:
+        t_restart = None
+        values['restart'] = "F"
+
+    interval = checkpoint_interval(state['seconds_per_step'], checkpoint_every)
+    values['checkpt_style'] = "3"
+    values['checkpt_interval'] = "%s" % interval
+    set_data_values(data_path, values,
+                    insert_after={"checkpt_interval": "checkpt_style"})
+    tfinal = float(read_data_value(data_path, "tfinal").replace("D", "E"))
+
+    segment = {"restart_time": t_restart, "checkpt_interval": interval,
+               "steps": 0, "final_time": t_restart}
+    state['segments'].append(segment)
+    state['status'] = "running"
+    save_state(outdir, state)
+
+    tic = time.time()
+    stopped = False
+    log = open(os.path.join(outdir, "xgeoclaw_%02d.log"
+                                    % len(state['segments'])), "w")
+    # Have gfortran flush every progress line instead of buffering the pipe
+    env = dict(os.environ)
+    env['GFORTRAN_UNBUFFERED_PRECONNECTED'] = "y"
+    process = subprocess.Popen([executable], cwd=outdir, stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT, env=env,
+                               universal_newlines=True)
+    try:
+        for line in process.stdout:
+            log.write(line)
+            match = step_pattern.search(line)
+            if match is None:
+                continue
+            segment['steps'] += 1
+            segment['final_time'] = float(match.group(2).replace("D", "E"))
+            if segment['steps'] % interval == 0:
+                prune_checkpoints(outdir, keep)
+            if (wall_limit is not None
+                                and time.time() - tic > wall_limit - margin):
+                process.terminate()
+                stopped = True
+                break
+        process.wait()
+    finally:
+        log.close()
+        if process.poll() is None:
+            process.kill()
+
+    wall_time = time.time() - tic
+    segment['wall_time'] = wall_time
+    segment['returncode'] = process.returncode
+    if segment['steps'] > 0:
+        state['seconds_per_step'] = wall_time / segment['steps']
+    prune_checkpoints(outdir, keep)
+
+    if (process.returncode == 0 and not stopped and
+            segment['final_time'] is not None and
+            segment['final_time'] >= tfinal * (1.0 - 1e-12)):
+        state['status'] = "done"
+    elif stopped:
+        state['status'] = "stopped"
+    else:
+        state['status'] = "failed"
+    save_state(outdir, state)
+
+    print("Segment %s: %s level 1 steps in %.1f s, t = %s, %s"
+                % (len(state['segments']), segment['steps'], wall_time,
+                   segment['final_time'], state['status']))
+    return state
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("outdir", nargs="?", default="_output")
+    parser.add_argument("--executable", default="./xgeoclaw")
+    parser.add_argument("--wall-limit", type=float, default=None,
+                        help="Seconds available to this segment")
+    parser.add_argument("--checkpoint-every", type=float, default=900.0,
+                        help="Target wall seconds between checkpoints")
+    parser.add_argument("--keep", type=int, default=2,
+                        help="Number of checkpoints to keep")
+    args = parser.parse_args()
+
+    state = run_segment(args.outdir, executable=args.executable,
+                        wall_limit=args.wall_limit,
+                        checkpoint_every=args.checkpoint_every, keep=args.keep)
+    if state['status'] not in ("done", "stopped"):
+        sys.exit(1)
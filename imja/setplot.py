@@ -12,6 +12,7 @@ from __future__ import print_function
 from six.moves import range
 
 import os
+import sys
 
 import numpy
 import matplotlib.pyplot as plt
@@ -31,31 +32,75 @@ wind_cmap = plt.get_cmap('PuBu')
 pressure_cmap = plt.get_cmap('PuBu')
 land_cmap = geoplot.land_colors
 
-# Contruct lake mask for plotting
-init_region = [86.910814, 86.951576, 27.883193, 27.912485]
-cutouts = []
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                ".."))
+import catalog
+
+# Contruct lake mask for plotting, the lake is defined in scenarios.json and
+# its cutouts converted from [x1, x2, y1, y2] to [x1, y1, x2, y2]
+lake = catalog.location("imja")['lakes'][0]
+init_region = lake['extent']
+lake_level = lake['level']
+cutouts = [[cutout[0], cutout[2], cutout[1], cutout[3]]
+                                                for cutout in lake['cutouts']]
 
 def lake_mask(x, y):
-    region = numpy.where((init_region[0] <= x) * 
-                         (x <= init_region[1]) *
-                         (init_region[2] <= y) * 
-                         (y <= init_region[3]), True, False)
+    region = ((init_region[0] <= x) & (x <= init_region[1]) &
+              (init_region[2] <= y) & (y <= init_region[3]))
     for cutout in cutouts:
-        region = numpy.where((cutout[0] < x) * (x < cutout[2]) *
-                             (cutout[1] < y) * (y < cutout[3]), 
-                             False, region)
+        region &= ~((cutout[0] < x) & (x < cutout[2]) &
+                    (cutout[1] < y) & (y < cutout[3]))
 
     return region
 
 
-def surface_or_depth(cd, DRY_TOL=1e-3):
+# Lake masks of the patches seen so far, keyed on the patch geometry.  Patches
+# wholly outside or inside the lake store False or True instead of an array.
+_lake_masks = {}
+max_cached_masks = 4096
+
+def patch_lake_mask(cd):
+    """Cached lake_mask for the patch in cd, or True/False if uniform"""
+    x = cd.x
+    y = cd.y
+    key = (getattr(cd, 'level', None), x.shape, x[0, 0], y[0, 0],
+                                                x[-1, -1], y[-1, -1])
+    mask = _lake_masks.get(key, None)
+    if mask is not None:
+        return mask
+
+    x_low, x_hi = min(x[0, 0], x[-1, -1]), max(x[0, 0], x[-1, -1])
+    y_low, y_hi = min(y[0, 0], y[-1, -1]), max(y[0, 0], y[-1, -1])
+    if (x_hi < init_region[0] or init_region[1] < x_low or
+        y_hi < init_region[2] or init_region[3] < y_low):
+        mask = False
+    elif (init_region[0] <= x_low and x_hi <= init_region[1] and
+          init_region[2] <= y_low and y_hi <= init_region[3] and
+          not any([x_low < cutout[2] and cutout[0] < x_hi and
+                   y_low < cutout[3] and cutout[1] < y_hi
+                   for cutout in cutouts])):
+        mask = True
+    else:
+        mask = lake_mask(x, y)
+
+    if len(_lake_masks) >= max_cached_masks:
+        _lake_masks.clear()
+    _lake_masks[key] = mask
+    return mask
+
+
+def surface_or_depth(cd):
+    """Surface relative to the lake level in the lake, depth elsewhere"""
     h = cd.q[0, :, :]
-    eta = cd.q[3, :, :]
-    b = cd.q[3, :, :] - cd.q[0, :, :] 
+    mask = patch_lake_mask(cd)
+    if mask is False:
+        return h
 
-    surface = numpy.ma.masked_where(h <= DRY_TOL, eta - 5000.0)
-    depth = numpy.ma.masked_where(h <= DRY_TOL, h)
-    return numpy.where(lake_mask(cd.x, cd.y) * (b < 5000), surface, depth)
+    eta = cd.q[3, :, :]
+    in_lake = (eta - h) < lake_level
+    if mask is not True:
+        in_lake &= mask
+    return numpy.where(in_lake, eta - lake_level, h)
 
 
 #--------------------------
@@ -83,6 +128,11 @@ def setplot(plotdata=None):
     clawdata = data.ClawInputData(2)
     clawdata.read(os.path.join(plotdata.outdir, 'claw.data'))
 
+    # Read frames in the format they were written in
+    plotdata.format = {1: 'ascii', 2: 'netcdf', 3: 'binary64',
+                       4: 'binary32'}.get(clawdata.output_format,
+                                          clawdata.output_format)
+
 
     # To plot gauge locations on pcolor or contour plot, use this as
     # an afteraxis function:
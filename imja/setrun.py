@@ -10,7 +10,9 @@ from __future__ import absolute_import
 from __future__ import print_function
 
 import os
+import sys
 import subprocess
+import json
 
 import numpy
 
@@ -22,12 +24,32 @@ except:
 # Scratch directory for storing topo and dtopo files:
 scratch_dir = os.path.join(CLAW, 'geoclaw', 'scratch')
 
-lake_region = [86.910814, 86.951576, 27.883193, 27.912485]
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                ".."))
+import catalog
 
-scenario = "snow_line"
+# Lake, computational domain and default slide scenario as defined in
+# scenarios.json, the gauges below are also those of this location
+location_name = "imja"
+location = catalog.location(location_name)
+lake_region = location['lakes'][0]['extent']
+domain = location['domain']
+
+scenario = location['default_scenario']
+
+# Frame output format, 'ascii' writes the data as text, 'binary' (or
+# 'binary32' with newer Clawpack) writes the patch data to fort.bNNNN and
+# only the patch headers to fort.qNNNN, much smaller and faster to read with
+# frame_reader.py
+output_format = os.environ.get("GLOF_OUTPUT_FORMAT", "ascii")
+
+# GeoClaw only reads NetCDF topography (topotype 4) when built with NetCDF,
+# GLOF_NETCDF=1 uses it here and builds it in (see the Makefile)
+use_netcdf = os.environ.get("GLOF_NETCDF", "0") not in ("", "0")
 
 #------------------------------
-def setrun(claw_pkg='geoclaw'):
+def setrun(claw_pkg='geoclaw', scenario_name=None, dtopo_path=None,
+           topo_dir=None):
 #------------------------------
 
     """
@@ -35,6 +57,7 @@ def setrun(claw_pkg='geoclaw'):
 
     INPUT:
         claw_pkg expected to be "geoclaw" for this setrun.
+        scenario_name, dtopo_path and topo_dir are passed on to setgeo.
 
     OUTPUT:
         rundata - object of class ClawRunData
@@ -55,11 +78,17 @@ def setrun(claw_pkg='geoclaw'):
     
     #probdata = rundata.new_UserData(name='probdata',fname='setprob.data')
 
+    #------------------------------------------------------------------
+    # Lakes filled by qinit, written to lakes.data (see lake_module.f90)
+    #------------------------------------------------------------------
+    setlakes(rundata, location['lakes'])
+
 
     #------------------------------------------------------------------
     # GeoClaw specific parameters:
     #------------------------------------------------------------------
-    rundata = setgeo(rundata)
+    rundata = setgeo(rundata, scenario_name=scenario_name,
+                     dtopo_path=dtopo_path, topo_dir=topo_dir)
 
     #------------------------------------------------------------------
     # Standard Clawpack parameters to be written to claw.data:
@@ -80,14 +109,15 @@ def setrun(claw_pkg='geoclaw'):
     clawdata.num_dim = num_dim
 
     # Lower and upper edge of computational domain:
-    clawdata.lower[0] = 86.816889
-    clawdata.upper[0] = 86.968107
+    # (shared with topo_pyramid.py through scenarios.json)
+    clawdata.lower[0] = domain['extent'][0]
+    clawdata.upper[0] = domain['extent'][1]
 
-    clawdata.lower[1] = 27.880479
-    clawdata.upper[1] = 27.921050
+    clawdata.lower[1] = domain['extent'][2]
+    clawdata.upper[1] = domain['extent'][3]
 
     # Number of grid cells: Coarsest grid
-    coarse_delta = 0.005
+    coarse_delta = domain['coarse_delta']
     clawdata.num_cells[0] = int((clawdata.upper[0] - clawdata.lower[0]) / coarse_delta)
     clawdata.num_cells[1] = int((clawdata.upper[1] - clawdata.lower[1]) / coarse_delta)
 
@@ -116,7 +146,8 @@ def setrun(claw_pkg='geoclaw'):
     # Restart from checkpoint file of a previous run?
     # If restarting, t0 above should be from original run, and the
     # restart_file 'fort.chkNNNNN' specified below should be in 
-    # the OUTDIR indicated in Makefile.
+    # the OUTDIR indicated in Makefile.  run_manager.py sets restart,
+    # restart_file and checkpointing in claw.data when running in segments.
 
     clawdata.restart = False              # True to restart from prior results
     clawdata.restart_file = 'fort.chk00096'  # File to use for restart data
@@ -148,7 +179,7 @@ def setrun(claw_pkg='geoclaw'):
         clawdata.output_t0 = True
         
 
-    clawdata.output_format = 'ascii'      # 'ascii' or 'netcdf' 
+    clawdata.output_format = output_format  # 'ascii', 'binary' or 'netcdf'
 
     clawdata.output_q_components = 'all'   # need all
     clawdata.output_aux_components = 'none'  # eta=h+B is in q
@@ -285,12 +316,12 @@ def setrun(claw_pkg='geoclaw'):
     amrdata = rundata.amrdata
 
     # max number of refinement levels:
-    amrdata.amr_levels_max = 4
+    amrdata.amr_levels_max = len(domain['refinement_ratios']) + 1
 
     # List of refinement ratios at each level (length at least mxnest-1)
-    amrdata.refinement_ratios_x = [2, 6, 2]
-    amrdata.refinement_ratios_y = [2, 6, 2]
-    amrdata.refinement_ratios_t = [2, 6, 2]
+    amrdata.refinement_ratios_x = list(domain['refinement_ratios'])
+    amrdata.refinement_ratios_y = list(domain['refinement_ratios'])
+    amrdata.refinement_ratios_t = list(domain['refinement_ratios'])
     delta = coarse_delta
     print("Refinement levels (meters):")
     print("  Level %s:  %s" % (1, delta))
@@ -368,13 +399,55 @@ def setrun(claw_pkg='geoclaw'):
 
 
 #-------------------
-def setgeo(rundata):
+def setlakes(rundata, lakes):
+#-------------------
+    """
+    Write the lakes to lakes.data, read by qinit (lake_module.f90) in the
+    order written: extent, level, polygon, cutouts and mask of each lake.
+    """
+
+    lakedata = rundata.new_UserData(name='lakedata', fname='lakes.data')
+    lakedata.add_param('num_lakes', len(lakes), 'number of lakes')
+    for (n, lake) in enumerate(lakes):
+        prefix = 'lake_%s_' % (n + 1)
+        lakedata.add_param(prefix + 'extent', lake['extent'],
+                           '%s [x1, x2, y1, y2]' % lake.get('name', ''))
+        lakedata.add_param(prefix + 'level', lake['level'], 'lake level (m)')
+        polygon = lake.get('polygon', [])
+        lakedata.add_param(prefix + 'num_vertices', len(polygon))
+        if len(polygon) > 0:
+            lakedata.add_param(prefix + 'vertices',
+                               [value for point in polygon for value in point])
+        cutouts = lake.get('cutouts', [])
+        lakedata.add_param(prefix + 'num_cutouts', len(cutouts))
+        if len(cutouts) > 0:
+            lakedata.add_param(prefix + 'cutouts',
+                               [value for cutout in cutouts for value in cutout])
+        lakedata.add_param(prefix + 'mask', lake.get('mask', ''),
+                           'topotype 3 mask, nonzero in the lake')
+
+    return rundata
+    # end of function setlakes
+    # ----------------------
+
+
+#-------------------
+def setgeo(rundata, scenario_name=None, dtopo_path=None, topo_dir=None):
 #-------------------
     """
     Set GeoClaw specific runtime parameters.
     For documentation see ....
+
+    The slide is read from ./<scenario_name>.tt3, scenario_name defaulting to
+    the module level scenario, unless dtopo_path is given.  Topography is
+    looked for in topo_dir, ../topo by default.
     """
 
+    if scenario_name is None:
+        scenario_name = scenario
+    if topo_dir is None:
+        topo_dir = os.path.join("../", "topo")
+
     try:
         geo_data = rundata.geo_data
     except:
@@ -408,21 +481,47 @@ def setgeo(rundata):
     # for topography, append lines of the form
     #    [topotype, minlevel, maxlevel, t1, t2, fname]
     # topo_path = os.path.join("topo", "imja.tt3")
-    topo_path = os.path.join("../", "topo", "everest.tt3")
-    topo_data.topofiles.append([3, 1, 3, 0., 1.e10, topo_path])
+    # Use the multi-resolution tiles if topo_pyramid.py built them, otherwise
+    # with use_netcdf prefer the NetCDF (topotype 4) version if convert_topo.py
+    # made one
+    tiles = []
+    pyramid_path = os.path.join(topo_dir, "imja_pyramid.json")
+    if os.path.exists(pyramid_path):
+        with open(pyramid_path) as pyramid_file:
+            tiles = json.load(pyramid_file)['tiles']
+        if not use_netcdf and any(tile['topo_type'] == 4 for tile in tiles):
+            print("*** Ignoring the NetCDF topo pyramid, set GLOF_NETCDF=1 "
+                  "to use it")
+            tiles = []
+    if len(tiles) > 0:
+        for tile in tiles:
+            topo_path = os.path.join(topo_dir, tile['path'])
+            topo_data.topofiles.append([tile['topo_type'], tile['min_level'],
+                                        tile['max_level'], 0., 1.e10,
+                                        topo_path])
+    else:
+        topo_path = os.path.join(topo_dir, "everest.nc")
+        topo_type = 4
+        if not (use_netcdf and os.path.exists(topo_path)):
+            topo_path = os.path.join(topo_dir, "everest.tt3")
+            topo_type = 3
+        topo_data.topofiles.append([topo_type, 1, 3, 0., 1.e10, topo_path])
 
     # == setdtopo.data values ==
     dtopo_data = rundata.dtopo_data
     # for moving topography, append lines of the form :   (<= 1 allowed for now!)
     #   [topotype, minlevel,maxlevel,fname]
-    dtopo_path = os.path.join(".", "%s.tt3" % scenario)
+    if dtopo_path is None:
+        dtopo_path = os.path.join(".", "%s.tt3" % scenario_name)
     dtopo_data.dtopofiles.append([3, 0, 10, dtopo_path])
 
     # Check for the above files
-    if not os.path.exists(topo_path):
-        raise Exception("Check to make sure that the topography file ",
-                        "%s exists.  If not run the " % topo_path,
-                        "convert_topo.py script." )
+    for topo_file in topo_data.topofiles:
+        topo_path = topo_file[-1]
+        if not os.path.exists(topo_path):
+            raise Exception("Check to make sure that the topography file ",
+                            "%s exists.  If not run the " % topo_path,
+                            "convert_topo.py script." )
 
     if not os.path.exists(dtopo_path):
         raise Exception("Check to make sure that the slide file ",
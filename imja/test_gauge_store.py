@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+r"""Tests of the gauge store queries, run with pytest from this directory"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import os
+
+import numpy
+
+import gauge_store
+
+
+def write_gauge(outdir, gauge_id, t, h, hu, hv):
+    """Write a gaugeNNNNN.txt file as GeoClaw does"""
+    path = os.path.join(outdir, "gauge%05d.txt" % gauge_id)
+    with open(path, "w") as gauge_file:
+        gauge_file.write("# gauge_id=    %s location=( 86.9 27.9 ) "
+                         "num_var=  4\n" % gauge_id)
+        gauge_file.write("# level, time, q[  1  2  3], eta, aux[]\n")
+        for n in range(t.shape[0]):
+            gauge_file.write("1 %s %s %s %s %s\n" % (t[n], h[n], hu[n],
+                                                     hv[n], h[n] + 4000.0))
+
+
+def make_store(path):
+    r"""Store of two members with three gauges of different lengths
+
+    Returns the store and the (t, h, hu, hv) of each series in store order.
+    """
+    random = numpy.random.RandomState(3)
+    expected = []
+    for member in ("a", "b"):
+        outdir = os.path.join(str(path), member)
+        os.makedirs(outdir)
+        for gauge_id in (1, 2, 3):
+            num = 5 + 3 * gauge_id
+            t = numpy.linspace(0.0, 10.0, num)
+            h = random.uniform(0.0, 2.0, num)
+            hu = random.uniform(-1.0, 1.0, num)
+            hv = random.uniform(-1.0, 1.0, num)
+            write_gauge(outdir, gauge_id, t, h, hu, hv)
+            expected.append((t, h, hu, hv))
+    store = gauge_store.GaugeStore(os.path.join(str(path), "store"))
+    store.ingest(os.path.join(str(path), "a"), member="a")
+    store.ingest(os.path.join(str(path), "b"), member="b")
+    return store, expected
+
+
+def test_unsorted_selection(tmpdir):
+    store, expected = make_store(tmpdir)
+    selected = numpy.array([4, 0, 5, 2, 0])
+
+    stage = store.peak_stage(selected)
+    discharge = store.peak_discharge(selected)
+    arrival = store.arrival_time(0.5, selected)
+    duration = store.duration_above(1.0, selected=selected)
+
+    for (k, n) in enumerate(selected):
+        t, h, hu, hv = expected[n]
+        assert numpy.isclose(stage[k], (h + 4000.0).max())
+        assert numpy.isclose(discharge[k], numpy.hypot(hu, hv).max())
+        rise = numpy.nonzero(h - h[0] > 0.5)[0]
+        if rise.shape[0] > 0:
+            assert arrival[k] == t[rise[0]]
+        else:
+            assert numpy.isnan(arrival[k])
+        assert numpy.isclose(duration[k],
+                             numpy.sum(numpy.diff(t)[h[:-1] > 1.0]))
+
+    # Same values as the full sorted query
+    assert numpy.all(stage == store.peak_stage()[selected])
@@ -0,0 +1,268 @@
+! ::::::::::::::::::::: instrument_module ::::::::::::::::::::::::::::::::::
+!
+! Optional counters for the custom hot routines, flag2refine2 and qinit.
+!
+! Enabled by setting the environment variable GLOF_INSTRUMENT to anything
+! but 0.  For each level it records the calls, cells and summed wall time
+! of both routines and the number of cells flag2refine2 flagged for each
+! reason (see reason_names).  The wall times are summed over calls, so with
+! several threads they are thread seconds.
+!
+! GeoClaw has no end of run hook for user code, so the summary is written
+! to instrument.json in the run directory at exit and also rewritten at
+! most every WRITE_INTERVAL seconds when flagging level 1, which keeps it
+! current when a run is killed.  analyze_instrument.py ranks the costs.
+!
+! ::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+module instrument_module
+
+    use iso_c_binding, only: c_int, c_funptr, c_funloc
+
+    implicit none
+    save
+
+    ! Reasons a cell is flagged, in the order of the checks in flag2refine2
+    integer, parameter :: NUM_REASONS = 7
+    integer, parameter :: REASON_STORM = 1, REASON_TOPO = 2,                &
+                          REASON_REGION = 3, REASON_DTOPO = 4,              &
+                          REASON_QINIT = 5, REASON_WAVE = 6, REASON_SPEED = 7
+    character(len=15), parameter :: reason_names(NUM_REASONS) =             &
+        [character(len=15) :: "storm", "topo", "region", "dtopo", "qinit",  &
+                              "wave_tolerance", "speed_tolerance"]
+
+    ! Seconds between rewrites of the summary
+    real(kind=8), parameter :: WRITE_INTERVAL = 10.d0
+
+    character(len=*), parameter :: summary_file = 'instrument.json'
+
+    logical :: instrumenting = .false.
+    logical, private :: module_setup = .false.
+
+    ! Per level counts, indexed (level)
+    integer(kind=8), allocatable :: flag_calls(:), flag_cells(:)
+    integer(kind=8), allocatable :: flag_counts(:, :)
+    real(kind=8), allocatable :: flag_time(:)
+    integer(kind=8), allocatable :: qinit_calls(:), qinit_cells(:)
+    real(kind=8), allocatable :: qinit_time(:)
+
+    integer(kind=8), private :: clock_rate, start_clock, last_write
+
+    interface
+        integer(c_int) function atexit(handler) bind(C, name='atexit')
+            import :: c_int, c_funptr
+            type(c_funptr), value :: handler
+        end function atexit
+    end interface
+
+contains
+
+    ! ========================================================================
+    !  set_instrument()
+    !    Check GLOF_INSTRUMENT and allocate the counters, only done once
+    ! ========================================================================
+    subroutine set_instrument()
+
+        use amr_module, only: mxnest
+
+        implicit none
+
+        character(len=16) :: value
+        integer :: length, status
+        logical :: setup
+
+        ! Acquire side of the atomic write at the end of the setup below
+        !$OMP ATOMIC READ
+        setup = module_setup
+        !$OMP FLUSH
+        if (setup) return
+
+        !$OMP CRITICAL (instrument_setup)
+        if (.not. module_setup) then
+            call get_environment_variable('GLOF_INSTRUMENT', value, length,  &
+                                          status)
+            instrumenting = status == 0 .and. length > 0 .and.               &
+                            trim(value) /= '0'
+
+            if (instrumenting) then
+                allocate(flag_calls(mxnest), flag_cells(mxnest))
+                allocate(flag_counts(NUM_REASONS, mxnest), flag_time(mxnest))
+                allocate(qinit_calls(mxnest), qinit_cells(mxnest))
+                allocate(qinit_time(mxnest))
+                flag_calls = 0
+                flag_cells = 0
+                flag_counts = 0
+                flag_time = 0.d0
+                qinit_calls = 0
+                qinit_cells = 0
+                qinit_time = 0.d0
+
+                call system_clock(start_clock, clock_rate)
+                last_write = start_clock
+                if (atexit(c_funloc(write_at_exit)) /= 0) then
+                    print *, 'instrument_module: could not register the ',   &
+                             'exit handler'
+                end if
+            end if
+
+            !$OMP FLUSH
+            !$OMP ATOMIC WRITE
+            module_setup = .true.
+        end if
+        !$OMP END CRITICAL (instrument_setup)
+
+    end subroutine set_instrument
+
+    ! ========================================================================
+    !  start_timer(clock)
+    !    Read the clock at the start of an instrumented call
+    ! ========================================================================
+    subroutine start_timer(clock)
+
+        implicit none
+
+        integer(kind=8), intent(out) :: clock
+
+        call set_instrument()
+        clock = 0
+        if (instrumenting) call system_clock(clock)
+
+    end subroutine start_timer
+
+    ! ========================================================================
+    !  record_flagging(level, mx, my, clock, counts)
+    !    Add one flag2refine2 call on a mx by my patch started at clock that
+    !    flagged counts(reason) cells
+    ! ========================================================================
+    subroutine record_flagging(level, mx, my, clock, counts)
+
+        implicit none
+
+        integer, intent(in) :: level, mx, my
+        integer(kind=8), intent(in) :: clock
+        integer, intent(in) :: counts(NUM_REASONS)
+
+        integer(kind=8) :: now
+        logical :: write_now
+
+        if (.not. instrumenting) return
+
+        call system_clock(now)
+        write_now = .false.
+
+        !$OMP CRITICAL (instrument_counts)
+        flag_calls(level) = flag_calls(level) + 1
+        flag_cells(level) = flag_cells(level) + mx * my
+        flag_counts(:, level) = flag_counts(:, level) + counts
+        flag_time(level) = flag_time(level) + real(now - clock, kind=8)     &
+                                            / real(clock_rate, kind=8)
+        if (level == 1 .and. real(now - last_write, kind=8)                 &
+                          / real(clock_rate, kind=8) > WRITE_INTERVAL) then
+            last_write = now
+            write_now = .true.
+        end if
+        !$OMP END CRITICAL (instrument_counts)
+
+        if (write_now) call write_summary()
+
+    end subroutine record_flagging
+
+    ! ========================================================================
+    !  record_qinit(dx, mx, my, clock)
+    !    Add one qinit call on a mx by my patch with cell width dx
+    ! ========================================================================
+    subroutine record_qinit(dx, mx, my, clock)
+
+        use amr_module, only: mxnest, hxposs
+
+        implicit none
+
+        real(kind=8), intent(in) :: dx
+        integer, intent(in) :: mx, my
+        integer(kind=8), intent(in) :: clock
+
+        integer(kind=8) :: now
+        integer :: level
+
+        if (.not. instrumenting) return
+
+        call system_clock(now)
+
+        ! qinit is not told the level, find it from the cell width
+        level = 1
+        do while (level < mxnest .and.                                      &
+                  abs(hxposs(level) - dx) > 1.d-6 * dx)
+            level = level + 1
+        end do
+
+        !$OMP CRITICAL (instrument_counts)
+        qinit_calls(level) = qinit_calls(level) + 1
+        qinit_cells(level) = qinit_cells(level) + mx * my
+        qinit_time(level) = qinit_time(level) + real(now - clock, kind=8)   &
+                                              / real(clock_rate, kind=8)
+        !$OMP END CRITICAL (instrument_counts)
+
+    end subroutine record_qinit
+
+    ! ========================================================================
+    !  write_summary()
+    !    Write the counters to summary_file, replacing it atomically
+    ! ========================================================================
+    subroutine write_summary()
+
+        use amr_module, only: mxnest
+
+        implicit none
+
+        integer, parameter :: iunit = 93
+        integer :: level, k, threads
+        integer(kind=8) :: now
+        !$ integer, external :: omp_get_max_threads
+
+        if (.not. instrumenting) return
+
+        threads = 1
+        !$ threads = omp_get_max_threads()
+        call system_clock(now)
+
+        !$OMP CRITICAL (instrument_counts)
+        open(unit=iunit, file=summary_file // '.tmp', status='replace',     &
+             form='formatted')
+        write(iunit, '("{")')
+        write(iunit, '(''  "elapsed": '', es16.8, '','')')                   &
+                real(now - start_clock, kind=8) / real(clock_rate, kind=8)
+        write(iunit, '(''  "threads": '', i0, '','')') threads
+        write(iunit, '(''  "reasons": ['', *(a, :, '', ''))')                &
+                ('"' // trim(reason_names(k)) // '"', k = 1, NUM_REASONS)
+        write(iunit, '(''  ],'')')
+        write(iunit, '(''  "levels": ['')')
+        do level = 1, mxnest
+            write(iunit, '(''    {"level": '', i0, '','')') level
+            write(iunit, '(''     "flag2refine2": {"calls": '', i0,          &
+                          &'', "cells": '', i0, '', "seconds": '', es16.8,   &
+                          &''},'')')                                         &
+                    flag_calls(level), flag_cells(level), flag_time(level)
+            write(iunit, '(''     "qinit": {"calls": '', i0,                 &
+                          &'', "cells": '', i0, '', "seconds": '', es16.8,   &
+                          &''},'')')                                         &
+                    qinit_calls(level), qinit_cells(level), qinit_time(level)
+            write(iunit, '(''     "flags": ['', *(i0, :, '', ''))')          &
+                    flag_counts(:, level)
+            if (level < mxnest) then
+                write(iunit, '(''    ]},'')')
+            else
+                write(iunit, '(''    ]}'')')
+            end if
+        end do
+        write(iunit, '(''  ]'')')
+        write(iunit, '("}")')
+        close(iunit)
+        call rename(summary_file // '.tmp', summary_file)
+        !$OMP END CRITICAL (instrument_counts)
+
+    end subroutine write_summary
+
+    subroutine write_at_exit() bind(C)
+        call write_summary()
+    end subroutine write_at_exit
+
+end module instrument_module
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+"""Benchmark the fused slide kernel and slide shapes against slide_topo
+
+Usage:  python bench_slide_topo.py [location] [scenario] [num_times]
+
+Reports the wall time and the peak memory allocated while evaluating every
+time level of the scenario for N = 100, 500 and 2000, for the reference
+function, the fused kernel called per time, the batched evaluation and the
+gaussian of slide_shapes.py on NumPy and, if numba is installed, compiled.
+"""
+
+import sys
+import time
+import tracemalloc
+
+import numpy
+
+import make_dtopo
+import slide_shapes
+
+
+def run(func):
+    tracemalloc.start()
+    tic = time.perf_counter()
+    result = func()
+    toc = time.perf_counter()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, toc - tic, peak / 1024.0**2
+
+
+def bench(location, scenario_name, N, num_times=8):
+
+    scenario = make_dtopo.locations[location]["scenarios"][scenario_name]
+    extent = make_dtopo.locations[location]["extent"]
+    x = numpy.linspace(extent[0], extent[1], N)
+    y = numpy.linspace(extent[2], extent[3], N)
+    times = numpy.linspace(0, scenario['t_end'], num_times)
+    params = (scenario["start"], scenario["slide_speed"],
+              scenario["max_length"], scenario["theta"], scenario["sigma"],
+              scenario["A"])
+
+    # Grid and output are allocated outside the measured region for both
+    X, Y = numpy.meshgrid(x, y)
+    dZ = numpy.empty((times.shape[0], y.shape[0], x.shape[0]))
+
+    def reference():
+        for (i, t) in enumerate(times):
+            dZ[i, :, :] = make_dtopo.slide_topo(X, Y, t, *params)
+        return dZ.copy()
+
+    def fused():
+        kernel = make_dtopo.SlideKernel(x, y, *params)
+        for (i, t) in enumerate(times):
+            kernel(t, out=dZ[i, :, :])
+        return dZ
+
+    def batched():
+        kernel = make_dtopo.SlideKernel(x, y, *params)
+        return kernel.evaluate(times, out=dZ)
+
+    def shape():
+        return slide_shapes.make(scenario, jit=False)(x, y, times, out=dZ)
+
+    def shape_jit():
+        return slide_shapes.make(scenario, jit=True)(x, y, times, out=dZ)
+
+    methods = [("fused", fused), ("batched", batched), ("shape", shape)]
+    try:
+        import numba
+        # Compile outside the measured region
+        slide_shapes.make(scenario, jit=True)(x[:2], y[:2], times[:1])
+        methods.append(("shape-jit", shape_jit))
+    except ImportError:
+        pass
+
+    ref, ref_time, ref_mem = run(reference)
+    print("%6s  %-8s  %10.4f  %8s  %10.1f  %9s" 
+                % (N, "ref", ref_time, "", ref_mem, ""))
+    for (name, func) in methods:
+        new, new_time, new_mem = run(func)
+        error = numpy.max(numpy.abs(ref - new)) / numpy.max(numpy.abs(ref))
+        print("%6s  %-8s  %10.4f  %7.2fx  %10.1f  %9.2e"
+                    % (N, name, new_time, ref_time / new_time, new_mem, error))
+
+
+if __name__ == "__main__":
+
+    location = "imja"
+    scenario = "snow_line"
+    num_times = 8
+    if len(sys.argv) > 1:
+        location = sys.argv[1]
+    if len(sys.argv) > 2:
+        scenario = sys.argv[2]
+    if len(sys.argv) > 3:
+        num_times = int(sys.argv[3])
+
+    print("%s/%s, %s time levels" % (location, scenario, num_times))
+    print("%6s  %-8s  %10s  %8s  %10s  %9s"
+                % ("N", "method", "time (s)", "speedup", "peak (MB)",
+                   "rel err"))
+    for N in (100, 500, 2000):
+        bench(location, scenario, N, num_times=num_times)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+r"""Startup time regression benchmark for the topo tools
+
+Each command is run *repeats* times in a fresh interpreter and the median
+wall time less that of a bare interpreter is compared with the budget.  The
+commands that do not plot must also not load any of the heavy modules,
+which is checked in the same interpreter.  Exits with 1 if a command is over
+budget or loads a heavy module, so it can run as a regression check.
+
+Usage:  python bench_startup.py [--repeats R] [--budget S]
+"""
+
+import sys
+import os
+import time
+import argparse
+import subprocess
+
+heavy_modules = ("matplotlib", "clawpack", "rasterio", "netCDF4")
+
+# (label, python code) run from this directory
+commands = [("import catalog", "sys.path.insert(0, '..')\n"
+                                "import catalog\n"
+                                "catalog.locations()"),
+            ("import make_dtopo", "import make_dtopo"),
+            ("import convert_topo", "import convert_topo"),
+            ("import ensemble_dtopo", "import ensemble_dtopo"),
+            ("import topo_pyramid", "import topo_pyramid"),
+            ("list locations", "import runpy\n"
+                               "sys.argv = ['convert_topo.py']\n"
+                               "try:\n"
+                               "    runpy.run_path(sys.argv[0], "
+                                                  "run_name='__main__')\n"
+                               "except SystemExit:\n"
+                               "    pass")]
+
+check = ("\nimport sys\n"
+         "loaded = [name for name in %r if name in sys.modules]\n"
+         "if len(loaded) > 0: sys.stderr.write('HEAVY %%s' %% loaded)\n"
+                                                            % (heavy_modules,))
+
+
+def run(code, repeats):
+    """Median wall time of running *code* and the heavy modules it loaded"""
+    timings = []
+    loaded = ""
+    for n in range(repeats):
+        tic = time.time()
+        process = subprocess.Popen([sys.executable, "-c",
+                                    "import sys\n" + code + check],
+                                   cwd=os.path.dirname(os.path.abspath(__file__)),
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE,
+                                   universal_newlines=True)
+        out, err = process.communicate()
+        timings.append(time.time() - tic)
+        if process.returncode != 0:
+            raise RuntimeError("%s failed:\n%s" % (code, err))
+        if "HEAVY" in err:
+            loaded = err.split("HEAVY")[1].strip()
+    timings.sort()
+    return timings[len(timings) // 2], loaded
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--repeats", type=int, default=7)
+    parser.add_argument("--budget", type=float, default=0.3,
+                        help="Seconds allowed beyond a bare interpreter")
+    args = parser.parse_args()
+
+    baseline = run("pass", args.repeats)[0]
+    print("Bare interpreter: %.3f s, budget %.3f s" % (baseline, args.budget))
+
+    failed = False
+    for (label, code) in commands:
+        wall, loaded = run(code, args.repeats)
+        status = "ok"
+        if wall - baseline > args.budget:
+            status = "OVER BUDGET"
+            failed = True
+        if len(loaded) > 0:
+            status = "LOADS %s" % loaded
+            failed = True
+        print("%-22s %7.3f s  (+%.3f s)  %s" % (label, wall, wall - baseline,
+                                                status))
+
+    if failed:
+        sys.exit(1)
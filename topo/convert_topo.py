@@ -4,43 +4,163 @@ import sys
 import os
 
 import numpy
-import matplotlib.pyplot as plt
-
-import clawpack.geoclaw.topotools as topotools
-import clawpack.visclaw.colormaps as colormaps
-
-land_cmap = colormaps.make_colormap({ 0.0:[0.1,0.4,0.0],
-                                         0.25:[0.0,1.0,0.0],
-                                          0.5:[0.8,1.0,0.5],
-                                          1.0:[0.8,0.5,0.2]})
-
-
-locations = {'imja': [{'path': 'ASTGTM2_everest_mosaic.tif',
-                       'out_path': 'everest.tt3',
-                       'strip_zeros': True,
-                       'contours': (4730, 4740, 5000),
-                       'limits': (4700, 4800)}],
-             'barun': [{'path': 'ASTGTM2_everest_mosaic.tif',
-                        'out_path': 'everest.tt3',
-                        'strip_zeros': False,
-                        'contours': (4730, 4740, 5000),
-                        'limits': (4700, 4800)}
-                      ],
-             'thulagi': [{'path': "ASTGTM2_Thulagi_mosaic.tif",
-                          'out_path': 'thulagi.tt3',
-                          'strip_zeros': False,
-                          'contours': (4730, 4740, 5000),
-                          'limits': (4700, 4800)}]
-
-             }
-
-def convert_topo(location, plot=False):
-    """Convert geotiff to topotype 3"""
+
+import rawgrid
+
+# matplotlib and clawpack are only imported when reading through topotools or
+# plotting, streaming a conversion or listing locations does not need them
+land_colors = { 0.0:[0.1,0.4,0.0],
+               0.25:[0.0,1.0,0.0],
+                0.5:[0.8,1.0,0.5],
+                1.0:[0.8,0.5,0.2]}
+
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                ".."))
+import catalog
+
+# Topography sources of every location, defined in scenarios.json
+locations = dict([(name, location['topo']) for (name, location)
+                        in catalog.load()['locations'].items()
+                        if "topo" in location])
+
+class TT3Writer(object):
+    r"""Write a topotype 3 file incrementally, a block of rows at a time
+
+    Same interface as :class:`rawgrid.TopoWriter` except that the blocks
+    must arrive in order, north first, as topotype 3 is written that way.
+    """
+
+    def __init__(self, path, x, y, no_data_value=-9999):
+        self.path = path
+        self.temp_path = "%s.%s" % (path, os.getpid())
+        self._next_row = 0
+
+        dx = (x[-1] - x[0]) / (len(x) - 1)
+        dy = (y[-1] - y[0]) / (len(y) - 1)
+        self._file = open(self.temp_path, "w")
+        self._file.write("%6i                              ncols\n" % len(x))
+        self._file.write("%6i                              nrows\n" % len(y))
+        self._file.write("%22.15e              xlower\n" % x[0])
+        self._file.write("%22.15e              ylower\n" % y[0])
+        if numpy.allclose(dx, dy, rtol=1e-10):
+            self._file.write("%22.15e              cellsize\n" % dx)
+        else:
+            self._file.write("%22.15e %22.15e cellsize\n" % (dx, dy))
+        self._file.write("%10i                  nodata_value\n" % no_data_value)
+
+    def write_rows(self, start, rows):
+        if start != self._next_row:
+            raise ValueError("Topotype 3 rows must be written in order.")
+        numpy.savetxt(self._file, rows, fmt="%.10g")
+        self._next_row += rows.shape[0]
+
+    def close(self):
+        self._file.close()
+        os.rename(self.temp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+            os.remove(self.temp_path)
+
+
+def stream_topo(path, out_path, extent=None, margin=0.0, strip_zeros=False,
+                block_rows=256, no_data_value=-9999, dtype="f4", stride=1):
+    r"""Convert a GeoTIFF to topography a block of rows at a time
+
+    Only *block_rows* rows of the GeoTIFF are held in memory at once and
+    they are written straight to *out_path*, whose extension selects
+    topotype 3 (.tt3), NetCDF (.nc) or a raw binary grid (.bin).
+
+    :Input:
+     - *extent* (list) Crop to [x1, x2, y1, y2], grown by *margin* degrees
+       on every side.  By default the whole GeoTIFF is converted.
+     - *strip_zeros* (bool) Drop the last row and column, which are zero
+       in the merged ASTER mosaics.
+     - *stride* (int) Keep only every stride-th row and column.
+
+    :Output:
+     - (x, y) coordinates of the written grid.
+    """
+
+    import rasterio
+    from rasterio.windows import Window
+
+    with rasterio.open(path) as source:
+        # Cell centers from the affine transform, rows run north to south
+        dx = source.transform.a
+        dy = -source.transform.e
+        x_west = source.transform.c + 0.5 * dx
+        y_north = source.transform.f - 0.5 * dy
+
+        col_start, col_end = 0, source.width
+        row_start, row_end = 0, source.height
+        if strip_zeros:
+            col_end -= 1
+            row_end -= 1
+        if extent is not None:
+            col_start = max(col_start, 
+                    int(numpy.floor((extent[0] - margin - x_west) / dx)))
+            col_end = min(col_end,
+                    int(numpy.ceil((extent[1] + margin - x_west) / dx)) + 1)
+            row_start = max(row_start,
+                    int(numpy.floor((y_north - extent[3] - margin) / dy)))
+            row_end = min(row_end,
+                    int(numpy.ceil((y_north - extent[2] + margin) / dy)) + 1)
+        if col_end - col_start < 2 or row_end - row_start < 2:
+            raise ValueError("Extent %s does not overlap %s." % (extent, path))
+
+        rows = numpy.arange(row_start, row_end, stride)
+        x = x_west + dx * numpy.arange(col_start, col_end, stride)
+        y = y_north - dy * rows[::-1]
+
+        if os.path.splitext(out_path)[1] in (".nc", ".bin"):
+            writer = rawgrid.TopoWriter(out_path, x, y, dtype=dtype)
+        else:
+            writer = TT3Writer(out_path, x, y, no_data_value=no_data_value)
+
+        # Blocks hold a whole number of strides so the rows kept line up
+        block_rows = max(1, block_rows // stride) * stride
+        with writer:
+            for row in range(row_start, row_end, block_rows):
+                window = Window(col_start, row, col_end - col_start, 
+                                min(block_rows, row_end - row))
+                block = source.read(1, window=window)[::stride, ::stride]
+                block = block.astype(float)
+                if source.nodata is not None:
+                    block[block == source.nodata] = no_data_value
+                writer.write_rows((row - row_start) // stride, block)
+
+    return x, y
+
+
+def convert_topo(location, plot=False, file_format="tt3", extent=None,
+                 margin=0.0, streaming=True):
+    """Convert geotiff to topotype 3 or, with *file_format* "nc" or "bin", to
+    a NetCDF (topotype 4) or raw binary grid, see rawgrid.py
+
+    By default the conversion is streamed, see :func:`stream_topo` for
+    *extent* and *margin*.  With *streaming* False the whole mosaic is read
+    with topotools instead.
+    """
     
     for loc_dict in locations[location]:
         topo = None
-        if not os.path.exists(loc_dict['out_path']):
+        out_path = "%s.%s" % (os.path.splitext(loc_dict['out_path'])[0],
+                              file_format)
+        if not os.path.exists(out_path) and streaming:
+            stream_topo(loc_dict['path'], out_path, extent=extent, 
+                        margin=margin, strip_zeros=loc_dict['strip_zeros'])
+
+        elif not os.path.exists(out_path):
 
+            import clawpack.geoclaw.topotools as topotools
             topo = topotools.Topography(path=loc_dict['path'], topo_type=5)
             topo.read()
 
@@ -48,19 +168,32 @@ def convert_topo(location, plot=False):
                 # Remove 0 values around perimiter
                 topo.Z = numpy.flipud(topo.Z[:-1, :-1])
             
-            topo.write(loc_dict['out_path'], topo_type=3)
+            if file_format == "tt3":
+                topo.write(out_path, topo_type=3)
+            else:
+                rawgrid.write_topo(out_path, topo.x[:topo.Z.shape[1]],
+                                             topo.y[:topo.Z.shape[0]], topo.Z)
 
 
         if plot:
+            import matplotlib.pyplot as plt
+            import clawpack.geoclaw.topotools as topotools
+            import clawpack.visclaw.colormaps as colormaps
+
             if topo is None:
-                topo = topotools.Topography(path=loc_dict['out_path'])
+                if file_format == "tt3":
+                    topo = topotools.Topography(path=out_path)
+                else:
+                    grid = rawgrid.read(out_path)
+                    topo = topotools.Topography()
+                    topo.set_xyZ(grid.x, grid.y, numpy.asarray(grid.Z))
             
             fig = plt.figure()
             axes = fig.add_subplot(1, 1, 1)
 
             topo.plot(axes=axes, contour_levels=loc_dict['contours'], 
                                  limits=loc_dict['limits'],
-                                  cmap=land_cmap)
+                                  cmap=colormaps.make_colormap(land_colors))
     if plot:
         plt.show()
 
@@ -79,17 +212,31 @@ def draw_rect(rect, axes, style="k--"):
 
 if __name__ == '__main__':
     
-    # Command line parsing
+    # Command line parsing, --no-plot skips plotting and its imports
+    plot = "--no-plot" not in sys.argv
+    if not plot:
+        sys.argv.remove("--no-plot")
+
     if len(sys.argv) == 1:
         print("Available locations:")
         for location in locations.keys():
             print("  %s" % location)
         sys.exit(0)
     
-    elif len(sys.argv) == 2:
+    elif len(sys.argv) in [2, 3, 8]:
         location = sys.argv[1].lower()
+        file_format = "tt3"
+        margin = 0.0
+        extent = None
+        if len(sys.argv) >= 3:
+            file_format = sys.argv[2].lower()
+        if len(sys.argv) == 8:
+            margin = float(sys.argv[3])
+            extent = [float(value) for value in sys.argv[4:8]]
 
     else:
-        raise InputError("Expected a location.")
+        raise InputError("Usage: convert_topo.py location [format] "
+                         "[margin x1 x2 y1 y2] [--no-plot]")
 
-    convert_topo(location, plot=True)
+    convert_topo(location, plot=plot, file_format=file_format, extent=extent,
+                 margin=margin)
@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+r"""Content-addressed cache for generated dtopo files
+
+Entries are keyed on a hash of everything that determines a dtopo file: the
+scenario parameters, the grid size N, the time levels and the extent.  The
+cache directory holds one file per key and an ``index.json`` recording the
+size and last use of each entry.  When the cache grows past *max_bytes* or
+*max_entries* the least recently used entries are evicted.
+
+Cached files are hard linked into place when possible so serving an entry
+is instant and evicting it never touches files handed out earlier.
+
+Usage:  python dtopo_cache.py [cache_dir]   - List the cache contents
+"""
+
+import sys
+import os
+import time
+import json
+import shutil
+import hashlib
+import fcntl
+
+import numpy
+
+# Bump when the dtopo generator changes its output for the same parameters
+cache_version = 2
+
+default_cache_dir = os.environ.get("GLOF_DTOPO_CACHE",
+                        os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                     ".dtopo_cache"))
+
+
+def _canonical(value):
+    """Convert *value* into something json can dump deterministically"""
+    if isinstance(value, dict):
+        return dict((str(key), _canonical(item))
+                                            for (key, item) in value.items())
+    if isinstance(value, (list, tuple, numpy.ndarray)):
+        return [_canonical(item) for item in value]
+    if isinstance(value, (float, numpy.floating)):
+        return repr(float(value))
+    if isinstance(value, (int, numpy.integer)):
+        return repr(float(value))
+    return value
+
+
+def dtopo_key(scenario, N, times, extent, suffix=".tt3"):
+    """Hash identifying the dtopo file built from the given inputs
+
+    *N* is the number of points in each direction, or (nx, ny).
+    """
+    if numpy.ndim(N) > 0:
+        N = _canonical(N)
+    else:
+        N = int(N)
+    description = {"version": cache_version,
+                   "scenario": _canonical(scenario),
+                   "N": N,
+                   "times": _canonical(times),
+                   "extent": _canonical(extent),
+                   "suffix": suffix}
+    text = json.dumps(description, sort_keys=True)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class DTopoCache(object):
+    r"""On-disk LRU cache of dtopo files
+
+    :Input:
+     - *cache_dir* (path) Directory of the cache, created if needed.
+     - *max_bytes* (int) Evict entries when the total size exceeds this.
+     - *max_entries* (int) Evict entries when there are more than this.
+
+    Safe to use from several processes at once, the index is updated under
+    an exclusive lock.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None, max_entries=None):
+
+        if cache_dir is None:
+            cache_dir = default_cache_dir
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    @property
+    def index_path(self):
+        return os.path.join(self.cache_dir, "index.json")
+
+    def _locked(self):
+        lock = open(os.path.join(self.cache_dir, "index.lock"), "a")
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        return lock
+
+    def _read_index(self):
+        if not os.path.exists(self.index_path):
+            return {}
+        with open(self.index_path) as index_file:
+            return json.load(index_file)
+
+    def _write_index(self, index):
+        temp_path = "%s.%s" % (self.index_path, os.getpid())
+        with open(temp_path, "w") as index_file:
+            json.dump(index, index_file, indent=1, sort_keys=True)
+        os.rename(temp_path, self.index_path)
+
+    def entries(self):
+        """Return the index as a dict of key to entry"""
+        lock = self._locked()
+        try:
+            return self._read_index()
+        finally:
+            lock.close()
+
+    def fetch(self, key, path):
+        r"""Place the cached file for *key* at *path*
+
+        Returns True on a hit.  An existing file at *path* is replaced.
+        """
+
+        lock = self._locked()
+        try:
+            index = self._read_index()
+            entry = index.get(key, None)
+            cached_path = None
+            if entry is not None:
+                cached_path = os.path.join(self.cache_dir, entry['file'])
+                if not os.path.exists(cached_path):
+                    del index[key]
+                    self._write_index(index)
+                    entry = None
+
+            if entry is None:
+                self.misses += 1
+                return False
+
+            _place(cached_path, path)
+            entry['last_used'] = time.time()
+            entry['hits'] = entry.get('hits', 0) + 1
+            self._write_index(index)
+        finally:
+            lock.close()
+
+        self.hits += 1
+        return True
+
+    def store(self, key, path, info=None):
+        """Add the file at *path* to the cache under *key* and evict"""
+
+        file_name = key + os.path.splitext(path)[1]
+        cached_path = os.path.join(self.cache_dir, file_name)
+        temp_path = "%s.%s" % (cached_path, os.getpid())
+        shutil.copyfile(path, temp_path)
+
+        lock = self._locked()
+        try:
+            os.rename(temp_path, cached_path)
+            index = self._read_index()
+            now = time.time()
+            index[key] = {"file": file_name,
+                          "size": os.path.getsize(cached_path),
+                          "created": now,
+                          "last_used": now,
+                          "hits": 0,
+                          "info": info}
+            self._evict(index)
+            self._write_index(index)
+        finally:
+            lock.close()
+
+    def _evict(self, index):
+        """Remove least recently used entries until within the limits"""
+        by_age = sorted(index.keys(), key=lambda key: index[key]['last_used'])
+        total = sum([entry['size'] for entry in index.values()])
+        for key in by_age:
+            over_size = self.max_bytes is not None and total > self.max_bytes
+            over_count = (self.max_entries is not None
+                                            and len(index) > self.max_entries)
+            if not (over_size or over_count):
+                break
+            entry = index.pop(key)
+            total -= entry['size']
+            cached_path = os.path.join(self.cache_dir, entry['file'])
+            if os.path.exists(cached_path):
+                os.remove(cached_path)
+
+    def clear(self):
+        """Remove every entry"""
+        lock = self._locked()
+        try:
+            index = self._read_index()
+            for entry in index.values():
+                cached_path = os.path.join(self.cache_dir, entry['file'])
+                if os.path.exists(cached_path):
+                    os.remove(cached_path)
+            self._write_index({})
+        finally:
+            lock.close()
+
+
+def _place(source, path):
+    """Hard link *source* to *path*, copying if linking is not possible"""
+    temp_path = "%s.%s" % (path, os.getpid())
+    try:
+        os.link(source, temp_path)
+    except OSError:
+        shutil.copyfile(source, temp_path)
+    os.rename(temp_path, path)
+
+
+if __name__ == "__main__":
+
+    cache = DTopoCache(*sys.argv[1:2])
+    entries = cache.entries()
+    total = 0
+    for key in sorted(entries.keys(), key=lambda key: entries[key]['last_used']):
+        entry = entries[key]
+        total += entry['size']
+        info = entry.get('info') or {}
+        print("%s  %10.1f kB  %4s hits  %s" % (key[:12], entry['size'] / 1024.0,
+                                             entry.get('hits', 0),
+                                             info.get('name', '')))
+    print("%s entries, %.1f MB in %s" % (len(entries), total / 1024.0**2,
+                                          cache.cache_dir))
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+r"""Build dtopo files for many slide scenarios in parallel
+
+Scenarios are either the named ones in the catalog (scenarios.json) or
+variants of them generated by sweeping slide parameters over ranges, e.g.
+
+    python ensemble_dtopo.py imja snow_line --sweep sigma=250:500:6 \
+                                            --sweep theta=150:210:5 -j 64
+
+builds the 30 variants of snow_line in a pool of 64 processes.  A range is
+either "start:stop:num" (inclusive, as numpy.linspace) or a comma separated
+list of values, in catalog units (theta in degrees).  Outputs are served from
+the dtopo cache (see dtopo_cache.py) whenever their inputs are unchanged, and
+a failing scenario is reported without stopping the rest of the batch.
+"""
+
+import sys
+import os
+import time
+import argparse
+import multiprocessing
+
+import make_dtopo
+import dtopo_cache
+from catalog import parse_range, scenarios
+
+
+def key_path(path):
+    """Sidecar recording the :func:`dtopo_cache.dtopo_key` of output *path*"""
+    return path + ".key"
+
+
+def up_to_date(path, key):
+    r"""An output is up to date if it was built from the inputs with *key*
+    and is newer than the dtopo generator"""
+    if not (os.path.exists(path) and os.path.exists(key_path(path))):
+        return False
+    with open(key_path(path)) as key_file:
+        if key_file.read().strip() != key:
+            return False
+    return os.path.getmtime(path) >= os.path.getmtime(make_dtopo.__file__)
+
+
+def build(job):
+    """Pool worker, build one scenario and report the outcome"""
+
+    location, name, scenario, path, options = job
+    tic = time.time()
+    try:
+        extent = make_dtopo.locations[location]['extent']
+        ppsigma = options['points_per_sigma']
+        key = make_dtopo.dtopo_inputs(scenario, extent, N=options['N'],
+                                      num_times=options['num_times'],
+                                      points_per_sigma=ppsigma,
+                                      suffix=os.path.splitext(path)[1])[3]
+        if options['cache'] is None:
+            if up_to_date(path, key) and not options['force']:
+                return name, path, "skipped", 0.0
+            cache = None
+        else:
+            cache = dtopo_cache.DTopoCache(*options['cache'])
+        make_dtopo.create_dtopo(location, name, scenario=scenario, path=path,
+                                estimate_mass=False, plot=False, cache=cache,
+                                force=options['force'] or cache is None,
+                                N=options['N'], num_times=options['num_times'],
+                                file_format=options['file_format'],
+                                points_per_sigma=options['points_per_sigma'])
+        with open(key_path(path), "w") as key_file:
+            key_file.write(key + "\n")
+    except Exception as e:
+        return name, path, "failed: %s" % e, time.time() - tic
+    if cache is not None and cache.hits > 0:
+        return name, path, "cached", time.time() - tic
+    return name, path, "built", time.time() - tic
+
+
+def build_ensemble(location, jobs, out_dir=None, processes=None, N=100,
+                   num_times=8, force=False, cache=(None, None, None),
+                   file_format="tt3", points_per_sigma=None):
+    r"""Build the dtopo files for *jobs* in a process pool
+
+    *jobs* is an iterable of (name, scenario) pairs, see
+    :func:`catalog.scenarios`.
+    *cache* holds the (cache_dir, max_bytes, max_entries) arguments of the
+    :class:`dtopo_cache.DTopoCache` each worker uses, or None to only skip
+    outputs built from the same inputs, recorded in a ``.key`` file next to
+    each output.  With *points_per_sigma* the slides
+    are sampled around their footprint instead of on an *N* x *N* grid, see
+    :func:`make_dtopo.footprint_grid`.  Returns a list of
+    (name, path, status, seconds) in completion order.
+    """
+
+    if out_dir is None:
+        out_dir = os.path.join("..", location)
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+
+    options = {"N": N, "num_times": num_times, "force": force,
+               "cache": cache, "file_format": file_format,
+               "points_per_sigma": points_per_sigma}
+    tasks = [(location, name, scenario,
+              os.path.join(out_dir, "%s.%s" % (name, file_format)), options)
+             for (name, scenario) in jobs]
+
+    results = []
+    pool = multiprocessing.Pool(processes=processes)
+    try:
+        for result in pool.imap_unordered(build, tasks):
+            print("%-50s %-10s %8.2f s" % (result[0], result[2], result[3]))
+            results.append(result)
+    finally:
+        pool.close()
+        pool.join()
+
+    return results
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("location")
+    parser.add_argument("scenarios", nargs="*",
+                        help="Base scenarios, defaults to all of the location")
+    parser.add_argument("--sweep", action="append", default=[],
+                        metavar="PARAM=RANGE",
+                        help="Sweep PARAM over RANGE, may be repeated")
+    parser.add_argument("-j", "--processes", type=int, default=None)
+    parser.add_argument("-N", type=int, default=100)
+    parser.add_argument("--points-per-sigma", type=float, default=None,
+                        help="Sample around the slide with this resolution "
+                             "instead of on an N x N grid")
+    parser.add_argument("--num-times", type=int, default=8)
+    parser.add_argument("--out-dir", default=None)
+    parser.add_argument("--force", action="store_true")
+    parser.add_argument("--format", default="tt3", choices=("tt3", "bin", "nc"),
+                        help="Output format, only tt3 is read by GeoClaw")
+    parser.add_argument("--cache-dir", default=None)
+    parser.add_argument("--cache-size", type=float, default=None,
+                        help="Maximum cache size in MB")
+    parser.add_argument("--no-cache", action="store_true")
+    args = parser.parse_args()
+
+    cache = None
+    if not args.no_cache:
+        max_bytes = None
+        if args.cache_size is not None:
+            max_bytes = int(args.cache_size * 1024**2)
+        cache = (args.cache_dir, max_bytes, None)
+
+    ranges = {}
+    for spec in args.sweep:
+        key, values = spec.split("=")
+        ranges[key] = parse_range(values)
+
+    jobs = scenarios(args.location, names=args.scenarios or None,
+                     ranges=ranges)
+    results = build_ensemble(args.location, jobs, out_dir=args.out_dir,
+                             processes=args.processes, N=args.N,
+                             num_times=args.num_times, force=args.force,
+                             cache=cache, file_format=args.format,
+                             points_per_sigma=args.points_per_sigma)
+
+    failed = [result for result in results if result[2].startswith("failed")]
+    print("%s scenarios, %s failed" % (len(results), len(failed)))
+    if len(failed) > 0:
+        sys.exit(1)
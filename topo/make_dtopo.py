@@ -6,38 +6,20 @@ import subprocess
 import shutil
 
 import numpy
-import matplotlib.pyplot as plt
-
-import clawpack.geoclaw.topotools as tt
-import clawpack.geoclaw.dtopotools as dt
-
-
-locations = {"imja": {"scenarios": {"island_peak": {"start": (86.930245, 27.905104),
-                                                    "slide_speed": 25,
-                                                    "max_length": 1e3,
-                                                    "theta": 4.0 * numpy.pi / 3.0,
-                                                    "sigma": 2.5e2,
-                                                    "A": 100.0,
-                                                    "t_end": 35.0},
-                                     "amphulapche": {"start": (86.911737, 27.885901),
-                                                     "slide_speed": 50,
-                                                     "max_length": 5e3,
-                                                     "theta": numpy.pi / 3.0,
-                                                     "sigma": 500.0,
-                                                     "A": 100.0,
-                                                     "t_end": 35.0},
-                                     "snow_line": {"start": (86.942428, 27.897892),
-                                                   "slide_speed": 50,
-                                                   "max_length": 1e3,
-                                                   "theta": numpy.pi,
-                                                   "sigma": 500,
-                                                   "A": 200.0,
-                                                   "t_end": 35.0}
-                                   },
-                     "extent": [86.910814, 86.951576, 27.883193, 27.912485],
-                     "topo_path": "./everest.tt3"
-                    },
-            }
+
+import dtopo_cache
+import projection
+import rawgrid
+import slide_mass
+import slide_shapes
+
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                ".."))
+import catalog
+
+# Locations and slide scenarios are defined in scenarios.json, see catalog.py
+locations = catalog.locations()
 
 
 def transform(x, y, theta=0.0):
@@ -48,16 +30,18 @@ def transform(x, y, theta=0.0):
 def slide_topo(x, y, t, start, slide_speed, max_length, theta, sigma_slide, 
                amplitude, estimate_mass=False):
 
-    # Convert input to lat-long coordinates
+    # Lengths are in meters in the local frame about start (see
+    # projection.py), the amplitude stays scaled to degrees
     deg2meters = 111.32e3
-    speed = slide_speed / deg2meters
-    L = max_length / deg2meters
-    sigma = sigma_slide / deg2meters
+    speed = slide_speed
+    L = max_length
+    sigma = sigma_slide
     A = amplitude / deg2meters
 
     # Transform coordinates
-    eta, zeta = transform(x, y, theta)
-    eta_start, zeta_start = transform(start[0], start[1], theta)
+    X, Y = projection.to_local(x, y, start)
+    eta, zeta = transform(X, Y, theta)
+    eta_start, zeta_start = 0.0, 0.0
 
     # Derive lengths in eta-zeta coordinate system
     eta_c = eta_start + speed * t
@@ -73,15 +57,18 @@ def slide_topo(x, y, t, start, slide_speed, max_length, theta, sigma_slide,
 
     # front
     slide += A * numpy.exp(-((eta - eta_c)**2 + (zeta - zeta_c)**2) / sigma**2) * (eta > eta_c)
-    estimated_mass += (A * numpy.pi * numpy.sqrt(sigma) / 4.0) ** 2
+    # The estimate is in degrees, as it always was, see slide_mass.py for
+    # the mass measured on the grid
+    sigma_deg = sigma / deg2meters
+    estimated_mass += (A * numpy.pi * numpy.sqrt(sigma_deg) / 4.0) ** 2
 
     # center
     slide += A * numpy.exp(-((zeta - zeta_c)**2) / sigma**2) * (eta  <= eta_c) * (eta >= eta_start)
-    estimated_mass += A * numpy.sqrt(sigma) / 2.0 * numpy.sqrt(2.0 * numpy.pi) * (eta_c - eta_start)
+    estimated_mass += A * numpy.sqrt(sigma_deg) / 2.0 * numpy.sqrt(2.0 * numpy.pi) * (eta_c - eta_start) / deg2meters
 
     # back
     slide += A * numpy.exp(-((eta - eta_start)**2 + (zeta - zeta_start)**2) / sigma**2) * (eta < eta_start)
-    estimated_mass += (A * numpy.pi * numpy.sqrt(sigma) / 4.0) ** 2
+    estimated_mass += (A * numpy.pi * numpy.sqrt(sigma_deg) / 4.0) ** 2
 
     if estimate_mass:
         estimated_mass *= 2000.0 / (1e3 * 1e6) * deg2meters**3
@@ -89,47 +76,318 @@ def slide_topo(x, y, t, start, slide_speed, max_length, theta, sigma_slide,
 
     return slide
 
-1 gm     (0.01 m)^3
-  --   * ---------
-  cm^3   (0.001 kg)
 
+class SlideKernel(object):
+    r"""Fused evaluation of :func:`slide_topo` on a fixed grid
+
+    The rotated coordinates and the cross-slope profile depend only on the
+    grid and the scenario so they are computed once here.  The front, center
+    and back lobes share the factor exp(-(zeta - zeta_c)**2 / sigma**2) and
+    differ only in the along-slope distance to the center strip, which is
+    zero inside the strip.  A call therefore reduces to a clip and an
+    exponential that fill the output buffer in place without any masks or
+    full-grid temporaries.
+
+    :Input:
+     - *x*, *y* (ndarray) 1d arrays of the grid coordinates.
+     - *start*, *slide_speed*, *max_length*, *theta*, *sigma_slide*,
+       *amplitude* - Slide parameters, see :func:`slide_topo`.
+    """
+
+    def __init__(self, x, y, start, slide_speed, max_length, theta, 
+                       sigma_slide, amplitude):
+
+        # Lengths are in meters in the local frame about start (see
+        # projection.py), the amplitude stays scaled to degrees
+        self.deg2meters = 111.32e3
+        self.speed = slide_speed
+        self.L = max_length
+        self.sigma = sigma_slide
+        self.A = amplitude / self.deg2meters
+
+        # Transform coordinates, the frame of the grid is cached and
+        # broadcasting avoids forming the meshgrid
+        X, Y = projection.local_grid(x, y, start)
+        self.eta, zeta = transform(X, Y, theta)
+        self.eta_start, self.zeta_start = 0.0, 0.0
+
+        # Cross-slope profile common to all three lobes, reuses zeta
+        self.profile = zeta
+        self.profile -= self.zeta_start
+        numpy.square(self.profile, out=self.profile)
+        self.profile *= -1.0 / self.sigma**2
+        numpy.exp(self.profile, out=self.profile)
+        self.profile *= self.A
+
+        self._work = numpy.empty(self.eta.shape)
+
+    @property
+    def shape(self):
+        return self.eta.shape
+
+    def lobe_bounds(self, t):
+        """Return the back and front edges of the center strip at time(s) *t*"""
+        eta_c = self.eta_start + self.speed * numpy.asarray(t)
+        return numpy.maximum(self.eta_start, eta_c - self.L), eta_c
+
+    def estimate_mass(self, t):
+        """Closed-form mass estimate in million tons, see :func:`slide_topo`"""
+        eta_back, eta_c = self.lobe_bounds(t)
+        # In degrees as it always was
+        sigma = self.sigma / self.deg2meters
+        estimated_mass = 2.0 * (self.A * numpy.pi * numpy.sqrt(sigma) / 4.0) ** 2
+        estimated_mass += self.A * numpy.sqrt(sigma) / 2.0                 \
+                                 * numpy.sqrt(2.0 * numpy.pi)             \
+                                 * (eta_c - eta_back) / self.deg2meters
+        # Density of 2 g / cm^3:
+        #   2 gm     (0.01 m)^3
+        #   --   * ---------
+        #   cm^3   (0.001 kg)
+        return estimated_mass * 2000.0 / (1e3 * 1e6) * self.deg2meters**3
+
+    def __call__(self, t, out=None):
+        """Evaluate the slide at time *t* into *out* and return it"""
+
+        if out is None:
+            out = numpy.empty(self.shape)
+        eta_back, eta_c = self.lobe_bounds(t)
+
+        # Along-slope distance to the center strip
+        work = self._work
+        numpy.clip(self.eta, eta_back, eta_c, out=work)
+        numpy.subtract(self.eta, work, out=work)
+
+        numpy.square(work, out=work)
+        work *= -1.0 / self.sigma**2
+        numpy.exp(work, out=work)
+        numpy.multiply(self.profile, work, out=out)
+
+        return out
+
+    def evaluate(self, times, out=None, tile_size=2**16):
+        r"""Evaluate the slide at all *times* at once into an (nt, ny, nx) cube
+
+        The lobe bounds for every time are computed in one vectorized step.
+        The grid is then walked in tiles of *tile_size* cells and each tile
+        is evaluated for all times while its coordinates are still in cache,
+        so the cost per cell stays that of :meth:`__call__` without its
+        per-time setup or any cube-sized temporaries.
+        """
+
+        times = numpy.asarray(times, dtype=float)
+        if out is None:
+            out = numpy.empty(times.shape + self.shape)
+        eta_back, eta_c = self.lobe_bounds(times)
+        scale = -1.0 / self.sigma**2
+
+        eta = self.eta.reshape(-1)
+        profile = self.profile.reshape(-1)
+        dZ = out.reshape(times.shape[0], -1)
+        for start in range(0, eta.shape[0], tile_size):
+            eta_tile = eta[start:start + tile_size]
+            profile_tile = profile[start:start + tile_size]
+            for n in range(times.shape[0]):
+                tile = dZ[n, start:start + tile_size]
+                numpy.clip(eta_tile, eta_back[n], eta_c[n], out=tile)
+                numpy.subtract(eta_tile, tile, out=tile)
+                numpy.square(tile, out=tile)
+                tile *= scale
+                numpy.exp(tile, out=tile)
+                tile *= profile_tile
+
+        return out
+
+
+def slide_footprint(scenario, t_end, extent=None, support=4.0):
+    r"""Box [x1, x2, y1, y2] holding the slide of *scenario* up to *t_end*
+
+    The slide covers the strip swept by its center in the slide direction
+    and is a Gaussian of width sigma across and beyond it, so the box of the
+    strip widened by *support* sigma on every side holds all of it but
+    exp(-support**2) of the amplitude.  A slide following a *path* is held
+    by the box of the path widened the same way.  The box is clipped to
+    *extent*.
+    """
+
+    start = scenario['start']
+    pad = support * scenario['sigma']
+    if scenario.get('path', None) is not None:
+        x, y = numpy.transpose(scenario['path'])
+        X, Y = projection.to_local(x, y, start)
+        X = numpy.concatenate(([0.0], X))
+        Y = numpy.concatenate(([0.0], Y))
+        X, Y = numpy.meshgrid([X.min() - pad, X.max() + pad],
+                              [Y.min() - pad, Y.max() + pad])
+    else:
+        # transform is its own inverse, map the corners of the strip back
+        eta = numpy.array([-pad, scenario['slide_speed'] * t_end + pad])
+        zeta = numpy.array([-pad, pad])
+        X, Y = transform(eta[:, numpy.newaxis], zeta[numpy.newaxis, :],
+                         scenario['theta'])
+
+    # Mapping back is all but linear over a slide, the corners suffice
+    x, y = projection.from_local(X, Y, start)
+    return _clip_box([x.min(), x.max(), y.min(), y.max()], extent)
+
+
+def _clip_box(box, extent):
+    if extent is not None:
+        box = [max(box[0], extent[0]), min(box[1], extent[1]),
+               max(box[2], extent[2]), min(box[3], extent[3])]
+        if box[0] >= box[1] or box[2] >= box[3]:
+            raise ValueError("The slide does not reach the extent %s."
+                                                                    % extent)
+    return box
+
+
+def footprint_grid(scenario, t_end, extent=None, points_per_sigma=8.0,
+                   support=4.0):
+    r"""Grid coordinates x, y covering :func:`slide_footprint`
+
+    The spacing is at most sigma / *points_per_sigma* m in both directions,
+    bilinear interpolation of the Gaussian then errs by at most about
+    (1 / points_per_sigma)**2 / 2 of the amplitude.
+    """
+
+    box = slide_footprint(scenario, t_end, extent=extent, support=support)
+    delta = scenario['sigma'] / points_per_sigma
+    dy = delta / projection.meters_per_degree
+    # Widest degree of longitude in the box
+    dx = delta / projection.row_factors(min(abs(box[2]), abs(box[3])))
+    nx = max(2, int(numpy.ceil((box[1] - box[0]) / dx)) + 1)
+    ny = max(2, int(numpy.ceil((box[3] - box[2]) / dy)) + 1)
+    return (numpy.linspace(box[0], box[1], nx),
+            numpy.linspace(box[2], box[3], ny))
+
+
+def sample_grid(scenario, extent, N=100, points_per_sigma=None):
+    r"""Grid coordinates x, y the slide is sampled on
+
+    An *N* x *N* grid over *extent*, or with *points_per_sigma* the grid of
+    :func:`footprint_grid`.
+    """
+    if points_per_sigma is None:
+        return (numpy.linspace(extent[0], extent[1], N),
+                numpy.linspace(extent[2], extent[3], N))
+    return footprint_grid(scenario, scenario['t_end'], extent=extent,
+                          points_per_sigma=points_per_sigma)
+
+
+def dtopo_inputs(scenario, extent, N=100, num_times=8, points_per_sigma=None,
+                 suffix=".tt3"):
+    r"""Sample grid, times and :func:`dtopo_cache.dtopo_key` of the dtopo
+    file :func:`create_dtopo` builds with these arguments
+
+    Returns (x, y, times, key).
+    """
+    times = numpy.linspace(0, scenario['t_end'], num_times)
+    x, y = sample_grid(scenario, extent, N=N, points_per_sigma=points_per_sigma)
+    grid_size = N if points_per_sigma is None else (x.shape[0], y.shape[0])
+    key = dtopo_cache.dtopo_key(scenario, grid_size, times,
+                                [x[0], x[-1], y[0], y[-1]], suffix=suffix)
+    return x, y, times, key
+
+
+def dtopography(x, y, times, dZ):
+    """Wrap a dtopo grid in a clawpack DTopography for writing or plotting"""
+    # Imported here so computing and the binary formats do not need clawpack
+    import clawpack.geoclaw.dtopotools as dt
 
-def create_dtopo(location, scenario_name, N=100, estimate_mass=True, 
-                 force=False, plot=False, topo_path=None):
+    dtopo = dt.DTopography()
+    dtopo.x = x
+    dtopo.y = y
+    dtopo.X, dtopo.Y = numpy.meshgrid(x, y)
+    dtopo.times = times
+    dtopo.dZ = dZ
+    return dtopo
 
-    scenario = locations[location]["scenarios"][scenario_name]
-    extent = locations[location]['extent']
-    path = os.path.join("..", location, "%s.tt3" % scenario_name)
 
+def create_dtopo(location, scenario_name, N=100, estimate_mass=True, 
+                 force=False, plot=False, topo_path=None, num_times=8,
+                 batched=True, scenario=None, path=None, cache=None,
+                 file_format="tt3", points_per_sigma=None):
+    r"""Create the dtopo file for a slide scenario and return its path
+
+    *scenario* may be given explicitly (e.g. for a parameter sweep), by
+    default it is looked up in *locations*.  *file_format* is one of "tt3"
+    (ASCII dtopotype 3, the only one GeoClaw reads), "bin" or "nc" (see
+    rawgrid.py) and sets the extension of the default *path*.
+
+    A scenario with a ``shape`` or ``path`` is evaluated by that shape of
+    slide_shapes.py, otherwise by :class:`SlideKernel`.
+
+    By default the slide is sampled on an *N* x *N* grid over the extent of
+    *location*.  With *points_per_sigma* the grid instead only covers the
+    footprint of the slide over all times, with a spacing of sigma /
+    *points_per_sigma*, see :func:`footprint_grid`.
+
+    Without a *cache* an existing file at *path* is left alone unless
+    *force* is set.  With a :class:`dtopo_cache.DTopoCache` the file is
+    served from the cache whenever one was built from identical inputs and
+    otherwise rebuilt and added to it, so a stale file is never reused.
+    """
+
+    if scenario is None:
+        scenario = locations[location]["scenarios"][scenario_name]
+    extent = locations[location]['extent']
+    if path is None:
+        path = os.path.join("..", location, "%s.%s" % (scenario_name,
+                                                          file_format))
+    x, y, times, key = dtopo_inputs(scenario, extent, N=N, num_times=num_times,
+                                    points_per_sigma=points_per_sigma,
+                                    suffix=os.path.splitext(path)[1])
+
+    if cache is not None:
+        if not force and cache.fetch(key, path):
+            print("Slide file %s served from cache." % path)
+            return path
+    elif os.path.exists(path) and not force:
+        print("Slide file %s already exists." % path)
+        return path
+
+    # A file served from the cache earlier may be hard linked to its entry,
+    # writing over it in place would change the entry too
     if os.path.exists(path):
-        if force:
-            os.remove(path)
-        else:
-            print("Slide file already exists.")
-            sys.exit(0)
+        os.remove(path)
 
     # Create dtopo
-    dtopo = dt.DTopography()
-    dtopo.x = numpy.linspace(extent[0], extent[1], N)
-    dtopo.y = numpy.linspace(extent[2], extent[3], N)
-    dtopo.X, dtopo.Y = numpy.meshgrid(dtopo.x, dtopo.y)
-    dtopo.times = numpy.linspace(0, scenario['t_end'], 8)
-    dtopo.dZ = numpy.empty((dtopo.times.shape[0], dtopo.x.shape[0], 
-                                                  dtopo.y.shape[0]))
-
-    for (i, t) in enumerate(dtopo.times):
-        dtopo.dZ[i, :, :] = slide_topo(dtopo.X, dtopo.Y, t, 
-                                       scenario["start"],
-                                       scenario["slide_speed"],
-                                       scenario["max_length"],
-                                       scenario["theta"],
-                                       scenario["sigma"],
-                                       scenario["A"],
-                                       estimate_mass=estimate_mass)
-
-    dtopo.write(path=path)
+    dZ = numpy.empty((times.shape[0], y.shape[0], x.shape[0]))
+
+    if "shape" in scenario or "path" in scenario:
+        slide_shapes.make(scenario)(x, y, times, out=dZ)
+    else:
+        kernel = SlideKernel(x, y, scenario["start"],
+                                   scenario["slide_speed"],
+                                   scenario["max_length"],
+                                   scenario["theta"],
+                                   scenario["sigma"],
+                                   scenario["A"])
+        if batched:
+            kernel.evaluate(times, out=dZ)
+        else:
+            for (i, t) in enumerate(times):
+                kernel(t, out=dZ[i, :, :])
+
+    if estimate_mass:
+        # Measured on the grid, see slide_mass.py for the units
+        slide_mass.report(times, slide_mass.volumes(x, y, dZ))
+
+    dtopo = None
+    if os.path.splitext(path)[1] in (".bin", ".nc"):
+        rawgrid.write_dtopo(path, x, y, times, dZ)
+    else:
+        dtopo = dtopography(x, y, times, dZ)
+        dtopo.write(path=path)
+    if cache is not None:
+        cache.store(key, path, info={"location": location,
+                                     "name": scenario_name})
 
     if plot:
+      import matplotlib.pyplot as plt
+      import clawpack.geoclaw.topotools as tt
+      if dtopo is None:
+          dtopo = dtopography(x, y, times, dZ)
+
       # Load topo for comparison
       topo = tt.Topography(path=locations[location]["topo_path"], topo_type=3)
 
@@ -155,6 +413,8 @@ def create_dtopo(location, scenario_name, N=100, estimate_mass=True,
                                                                       scenario_name)
       subprocess.call(cmd, shell=True)
 
+    return path
+
 
 if __name__ == "__main__":
 
@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+r"""Binary topography and dtopography grids
+
+Two formats are supported, chosen by the file extension:
+
+ - ``.bin`` - A 64 byte little-endian header followed by the time levels (for
+   dtopo) and the raw float32 or float64 values in C order with y increasing,
+   i.e. Z[j, i] or dZ[k, j, i].  The header is
+
+       char[8]  magic "GLOFGRID"
+       int32    version, kind (1 = topo, 2 = dtopo), itemsize (4 or 8)
+       int32    mx, my, mt (mt = 0 for topo)
+       float64  xlower, ylower, dx, dy     (cell centers of the first point)
+
+   followed by mt float64 times.  This is a format of the tools here
+   only, GeoClaw cannot read it.
+
+ - ``.nc`` - NetCDF with lon/lat coordinates and a z(lat, lon) or
+   dz(time, lat, lon) variable, which GeoClaw reads directly as topotype 4
+   for topography when built with NetCDF, see GLOF_NETCDF in
+   imja/setrun.py.  This is the only one of the two that makes GeoClaw's
+   startup faster than parsing a .tt3 file.  Requires netCDF4.
+
+:func:`read` memory maps ``.bin`` files and opens ``.nc`` files lazily so
+only the parts of the grid that are accessed are read from disk.
+
+Usage:  python rawgrid.py path [path ...]  - Print the header of each file
+"""
+
+import sys
+import os
+import struct
+
+import numpy
+
+magic = b"GLOFGRID"
+version = 1
+header_format = "<8s6i4d"
+header_size = struct.calcsize(header_format)
+
+TOPO = 1
+DTOPO = 2
+
+
+class RawGrid(object):
+    r"""Grid read by :func:`read`
+
+    *Z* holds the values, shaped (my, mx) for topography and (mt, my, mx)
+    for dtopography, backed by the file rather than loaded into memory.
+    """
+
+    def __init__(self, kind, x, y, Z, times=None, path=None):
+        self.kind = kind
+        self.x = x
+        self.y = y
+        self.Z = Z
+        self.times = times
+        self.path = path
+
+    @property
+    def extent(self):
+        return [float(self.x[0]), float(self.x[-1]),
+                float(self.y[0]), float(self.y[-1])]
+
+    def dZ_at_t(self, t):
+        """Linearly interpolate dtopography in time, as GeoClaw does"""
+        if self.kind != DTOPO:
+            raise ValueError("%s is not a dtopo file." % self.path)
+        if t <= self.times[0]:
+            return numpy.array(self.Z[0])
+        if t >= self.times[-1]:
+            return numpy.array(self.Z[-1])
+        n = numpy.searchsorted(self.times, t) - 1
+        alpha = (t - self.times[n]) / (self.times[n + 1] - self.times[n])
+        return (1.0 - alpha) * self.Z[n] + alpha * self.Z[n + 1]
+
+
+def _check_uniform(x, y):
+    if x.shape[0] < 2 or y.shape[0] < 2:
+        raise ValueError("Grids need at least 2 points in x and y to define "
+                         "their spacing, got %s x %s." % (x.shape[0],
+                                                           y.shape[0]))
+    dx = (x[-1] - x[0]) / (x.shape[0] - 1)
+    dy = (y[-1] - y[0]) / (y.shape[0] - 1)
+    if not (numpy.allclose(numpy.diff(x), dx)
+            and numpy.allclose(numpy.diff(y), dy)):
+        raise ValueError("Binary grids must be uniform.")
+    return dx, dy
+
+
+def _write_binary(path, kind, x, y, Z, times, dtype):
+    dtype = numpy.dtype(dtype).newbyteorder("<")
+    if dtype.kind != "f":
+        raise ValueError("Expected a float32 or float64 dtype.")
+    dx, dy = _check_uniform(x, y)
+    mt = 0 if times is None else times.shape[0]
+
+    temp_path = "%s.%s" % (path, os.getpid())
+    with open(temp_path, "wb") as out_file:
+        out_file.write(struct.pack(header_format, magic, version, kind,
+                                   dtype.itemsize, x.shape[0], y.shape[0], mt,
+                                   x[0], y[0], dx, dy))
+        if times is not None:
+            out_file.write(numpy.asarray(times, dtype="<f8").tobytes())
+        # Write a level at a time to avoid a full converted copy
+        for level in Z.reshape((-1,) + Z.shape[-2:]):
+            out_file.write(numpy.ascontiguousarray(level, dtype=dtype).tobytes())
+    os.rename(temp_path, path)
+
+
+def _write_netcdf(path, kind, x, y, Z, times, dtype):
+    import netCDF4
+
+    with netCDF4.Dataset(path, "w") as data:
+        data.createDimension("lon", x.shape[0])
+        data.createDimension("lat", y.shape[0])
+        lon = data.createVariable("lon", "f8", ("lon",))
+        lon.units = "degrees_east"
+        lon[:] = x
+        lat = data.createVariable("lat", "f8", ("lat",))
+        lat.units = "degrees_north"
+        lat[:] = y
+
+        dtype = numpy.dtype(dtype)
+        if kind == TOPO:
+            z = data.createVariable("z", dtype, ("lat", "lon"), zlib=False)
+            z.units = "meters"
+            z[:, :] = Z
+        else:
+            data.createDimension("time", times.shape[0])
+            time = data.createVariable("time", "f8", ("time",))
+            time.units = "seconds"
+            time[:] = times
+            dz = data.createVariable("dz", dtype, ("time", "lat", "lon"),
+                                     zlib=False)
+            dz.units = "meters"
+            for n in range(times.shape[0]):
+                dz[n, :, :] = Z[n]
+
+
+def _write(path, kind, x, y, Z, times, dtype):
+    x = numpy.asarray(x)
+    y = numpy.asarray(y)
+    if Z.shape[-2:] != (y.shape[0], x.shape[0]):
+        raise ValueError("Grid of shape %s does not match %s x %s coordinates."
+                                           % (Z.shape, y.shape[0], x.shape[0]))
+    if os.path.splitext(path)[1] == ".nc":
+        _write_netcdf(path, kind, x, y, Z, times, dtype)
+    else:
+        _write_binary(path, kind, x, y, Z, times, dtype)
+
+
+def write_topo(path, x, y, Z, dtype="f4"):
+    """Write topography Z[j, i] at (x[i], y[j]) to *path*"""
+    _write(path, TOPO, x, y, Z, None, dtype)
+
+
+def write_dtopo(path, x, y, times, dZ, dtype="f4"):
+    """Write dtopography dZ[k, j, i] at (x[i], y[j], times[k]) to *path*"""
+    _write(path, DTOPO, x, y, dZ, numpy.asarray(times, dtype=float), dtype)
+
+
+class TopoWriter(object):
+    r"""Write a topography grid incrementally, a block of rows at a time
+
+    Rows are passed north first as they come out of a GeoTIFF and placed at
+    their position in the file, so the full grid is never held in memory.
+    Use as a context manager or call :meth:`close` when done.
+    """
+
+    def __init__(self, path, x, y, dtype="f4"):
+        self.path = path
+        self.temp_path = "%s.%s" % (path, os.getpid())
+        self.x = numpy.asarray(x)
+        self.y = numpy.asarray(y)
+        self.dtype = numpy.dtype(dtype).newbyteorder("<")
+        self.netcdf = os.path.splitext(path)[1] == ".nc"
+
+        if self.netcdf:
+            import netCDF4
+            self._file = netCDF4.Dataset(self.temp_path, "w")
+            self._file.createDimension("lon", self.x.shape[0])
+            self._file.createDimension("lat", self.y.shape[0])
+            self._file.createVariable("lon", "f8", ("lon",))[:] = self.x
+            self._file.createVariable("lat", "f8", ("lat",))[:] = self.y
+            self._z = self._file.createVariable("z", self.dtype.newbyteorder("="),
+                                                ("lat", "lon"), zlib=False)
+            self._z.units = "meters"
+        else:
+            dx, dy = _check_uniform(self.x, self.y)
+            self._file = open(self.temp_path, "wb")
+            self._file.write(struct.pack(header_format, magic, version, TOPO,
+                                         self.dtype.itemsize, self.x.shape[0],
+                                         self.y.shape[0], 0, self.x[0],
+                                         self.y[0], dx, dy))
+            self._file.truncate(header_size + self.dtype.itemsize
+                                        * self.x.shape[0] * self.y.shape[0])
+
+    def write_rows(self, start, rows):
+        """Write *rows* whose first row is *start* rows from the north edge"""
+        rows = numpy.flipud(numpy.asarray(rows))
+        my = self.y.shape[0]
+        lower = my - start - rows.shape[0]
+        if self.netcdf:
+            self._z[lower:lower + rows.shape[0], :] = rows
+        else:
+            self._file.seek(header_size + lower * self.dtype.itemsize
+                                                      * self.x.shape[0])
+            self._file.write(numpy.ascontiguousarray(rows,
+                                                     dtype=self.dtype).tobytes())
+
+    def close(self):
+        self._file.close()
+        os.rename(self.temp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+            os.remove(self.temp_path)
+
+
+def read_header(path):
+    """Return the header fields of a ``.bin`` grid as a dict"""
+    with open(path, "rb") as in_file:
+        fields = struct.unpack(header_format, in_file.read(header_size))
+    if fields[0] != magic:
+        raise IOError("%s is not a binary grid file." % path)
+    keys = ("magic", "version", "kind", "itemsize", "mx", "my", "mt",
+            "xlower", "ylower", "dx", "dy")
+    return dict(zip(keys, fields))
+
+
+def read(path, mode="r"):
+    """Open the grid at *path* without loading its values, see :class:`RawGrid`"""
+
+    if os.path.splitext(path)[1] == ".nc":
+        import netCDF4
+        data = netCDF4.Dataset(path, "r")
+        x = data.variables["lon"][:]
+        y = data.variables["lat"][:]
+        if "dz" in data.variables:
+            return RawGrid(DTOPO, x, y, data.variables["dz"],
+                           times=data.variables["time"][:], path=path)
+        return RawGrid(TOPO, x, y, data.variables["z"], path=path)
+
+    header = read_header(path)
+    if header["version"] > version:
+        raise IOError("%s has unsupported version %s." % (path,
+                                                          header["version"]))
+    mx, my, mt = header["mx"], header["my"], header["mt"]
+    x = header["xlower"] + header["dx"] * numpy.arange(mx)
+    y = header["ylower"] + header["dy"] * numpy.arange(my)
+    dtype = numpy.dtype("<f%s" % header["itemsize"])
+
+    times = None
+    shape = (my, mx)
+    if header["kind"] == DTOPO:
+        times = numpy.fromfile(path, dtype="<f8", count=mt, offset=header_size)
+        shape = (mt, my, mx)
+    Z = numpy.memmap(path, dtype=dtype, mode=mode, shape=shape,
+                     offset=header_size + 8 * mt)
+
+    return RawGrid(header["kind"], x, y, Z, times=times, path=path)
+
+
+if __name__ == "__main__":
+
+    for path in sys.argv[1:]:
+        grid = read(path)
+        kind = {TOPO: "topo", DTOPO: "dtopo"}[grid.kind]
+        print("%s: %s, %s x %s points, extent %s" % (path, kind, grid.x.shape[0],
+                                                    grid.y.shape[0], grid.extent))
+        if grid.times is not None:
+            print("  %s times in [%s, %s]" % (grid.times.shape[0],
+                                              grid.times[0], grid.times[-1]))
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+r"""Volume and mass of a generated slide, measured on its dtopo grid
+
+The dZ cube of a dtopo file is integrated over the grid cells on the sphere
+for every time level at once.  Each grid point stands for the cell of width
+dx by dy around it, clipped at the edges of the grid, whose area is
+
+    R**2 * dx * (sin(y + dy / 2) - sin(y - dy / 2))
+
+with dx, dy and y in radians.  As :class:`make_dtopo.SlideKernel` divides
+the amplitude A by 111.32e3, the dZ GeoClaw reads and hence the volume
+measured here are those of the amplitude A / 111.32e3 m.
+The volume is linear in A, so :func:`solve_amplitude` finds the A giving a
+target volume from a single evaluation.
+
+Usage:  python slide_mass.py location scenario [--volume V] [-N N] ...
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import argparse
+
+import numpy
+
+from projection import earth_radius
+
+# Slide density, 2 g / cm^3 (kg / m^3)
+density = 2000.0
+
+
+def _cell_factors(x, y, radius=earth_radius):
+    r"""Factors wx, wy of the cell areas, area[j, i] = wy[j] * wx[i]
+
+    *x* and *y* are the uniformly spaced longitudes and latitudes in degrees.
+    """
+
+    x = numpy.radians(numpy.asarray(x, dtype=float))
+    y = numpy.radians(numpy.asarray(y, dtype=float))
+
+    # Cell edges halfway between the points, clipped to the grid
+    x_edges = numpy.concatenate(([x[0]], 0.5 * (x[1:] + x[:-1]), [x[-1]]))
+    y_edges = numpy.concatenate(([y[0]], 0.5 * (y[1:] + y[:-1]), [y[-1]]))
+    wx = numpy.diff(x_edges)
+    wy = radius**2 * numpy.diff(numpy.sin(y_edges))
+    return wx, wy
+
+
+def cell_areas(x, y, radius=earth_radius):
+    """Areas (m^2) of the cells around the points of the grid *x*, *y*"""
+    wx, wy = _cell_factors(x, y, radius)
+    return numpy.outer(wy, wx)
+
+
+def volumes(x, y, dZ, radius=earth_radius):
+    r"""Volume (m^3) of the dZ cube (nt, ny, nx) at each time level
+
+    The cell area factors are separable, so this is a pair of contractions
+    over the cube without forming the area grid.
+    """
+    wx, wy = _cell_factors(x, y, radius)
+    return numpy.dot(numpy.dot(numpy.asarray(dZ), wx), wy)
+
+
+def mass(volume):
+    """Mass in million tons of *volume* (m^3) at *density*"""
+    return numpy.asarray(volume) * density / 1e9
+
+
+def drift(volume):
+    r"""Change of *volume* relative to its first nonzero level
+
+    Returns (relative change at each level, largest relative change between
+    consecutive levels).
+    """
+
+    volume = numpy.asarray(volume, dtype=float)
+    nonzero = numpy.nonzero(volume)[0]
+    if nonzero.shape[0] == 0:
+        return numpy.zeros(volume.shape), 0.0
+    reference = volume[nonzero[0]]
+    step = 0.0
+    if volume.shape[0] > 1:
+        step = (numpy.abs(numpy.diff(volume)) / abs(reference)).max()
+    return (volume - reference) / reference, step
+
+
+def report(times, volume):
+    """Print the volume, mass and drift at each of *times*"""
+    relative, step = drift(volume)
+    print("%10s %14s %14s %10s" % ("t", "volume (m^3)", "mass (Mt)", "drift"))
+    for (t, v, m, r) in zip(times, volume, mass(volume), relative):
+        print("%10.3f %14.6e %14.6e %9.3f%%" % (t, v, m, 100.0 * r))
+    print("Largest change between levels: %.3f%%" % (100.0 * step))
+
+
+def solve_amplitude(x, y, dZ, amplitude, target_volume, level=-1):
+    r"""Amplitude A giving *target_volume* (m^3) at time level *level*
+
+    *dZ* is the cube generated with *amplitude*, the volume scales with it.
+    """
+    volume = volumes(x, y, dZ[level][numpy.newaxis, :, :])[0]
+    if volume == 0.0:
+        raise ValueError("The slide has no volume on this grid.")
+    return amplitude * target_volume / volume
+
+
+if __name__ == "__main__":
+
+    import make_dtopo
+    import slide_shapes
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("location")
+    parser.add_argument("scenario")
+    parser.add_argument("--volume", type=float, default=None,
+                        help="Target volume (m^3) at the last time to "
+                             "solve for A")
+    parser.add_argument("-N", type=int, default=100)
+    parser.add_argument("--points-per-sigma", type=float, default=None)
+    parser.add_argument("--num-times", type=int, default=8)
+    args = parser.parse_args()
+
+    location = make_dtopo.locations[args.location]
+    scenario = location['scenarios'][args.scenario]
+    x, y = make_dtopo.sample_grid(scenario, location['extent'], N=args.N,
+                                  points_per_sigma=args.points_per_sigma)
+    times = numpy.linspace(0, scenario['t_end'], args.num_times)
+    # The same slide make_dtopo.create_dtopo generates
+    if "shape" in scenario or "path" in scenario:
+        dZ = slide_shapes.make(scenario)(x, y, times)
+    else:
+        dZ = make_dtopo.SlideKernel(x, y, scenario['start'],
+                                    scenario['slide_speed'],
+                                    scenario['max_length'], scenario['theta'],
+                                    scenario['sigma'],
+                                    scenario['A']).evaluate(times)
+    print("%s/%s on a %s x %s grid, A = %s" % (args.location, args.scenario,
+                                               x.shape[0], y.shape[0],
+                                               scenario['A']))
+    report(times, volumes(x, y, dZ))
+
+    if args.volume is not None:
+        A = solve_amplitude(x, y, dZ, scenario['A'], args.volume)
+        print("A = %.6g gives %.6e m^3" % (A, args.volume))
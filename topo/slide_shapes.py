@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+r"""Registry of slide shapes sharing one (x, y, times) -> dZ interface
+
+A slide moves along a path at *slide_speed*: at time t it covers the part
+of the path from s_back = max(0, s_front - max_length) to s_front = speed *
+t, s being the distance along the path from *start*.  Every grid point is
+given its distance s along the path and v across it once, and the slide at
+time t is A * profile(u, v) with u the distance along the path to the
+covered part, zero inside it.  The shapes differ in their profile:
+
+ - ``gaussian`` - exp(-(u**2 + v**2) / sigma**2), the shape of
+   :class:`make_dtopo.SlideKernel`
+ - ``parabolic_cap`` - max(0, 1 - (u**2 + v**2) / sigma**2)
+ - ``tapered_block`` - 1 within sigma across the path, falling to zero
+   over *taper* with a cosine ramp both across and along the path
+ - ``polyline`` - gaussian following the polyline *path* instead of a
+   straight line
+
+The path is the straight line from *start* in direction *theta*, or with a
+*path* in the scenario the polyline from *start* through its vertices, in
+which case theta is unused and the slide stops at the end of the path.
+Lengths are in meters in the local frame of projection.py about *start*,
+the amplitude is divided by 111.32e3 as in make_dtopo.py.
+
+The evaluation is compiled with numba when it is installed and *jit* is
+not False, otherwise it runs on NumPy.  New shapes are added with
+:func:`register`, e.g.
+
+    @register("cone")
+    class Cone(SlideShape):
+        @staticmethod
+        def profile(u, v, sigma, taper):
+            return numpy.maximum(0.0, 1.0 - numpy.sqrt(u * u + v * v) / sigma)
+
+The profile must only use NumPy ufuncs so that it works both on arrays and,
+compiled, on scalars.
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import numpy
+
+import projection
+
+deg2meters = 111.32e3
+
+shapes = {}
+
+
+def register(name):
+    r"""Class decorator adding a :class:`SlideShape` to *shapes* as *name*,
+    the class has to define its profile"""
+    def decorator(cls):
+        if not callable(getattr(cls, 'profile', None)):
+            raise TypeError("Slide shape %s does not define a profile."
+                                                                    % name)
+        cls.name = name
+        shapes[name] = cls
+        return cls
+    return decorator
+
+
+def make(scenario, jit=None):
+    """Shape named by scenario['shape'] (gaussian by default) for *scenario*"""
+    name = scenario.get('shape', "gaussian")
+    if name not in shapes:
+        raise ValueError("Unknown slide shape %s, expected one of %s."
+                                        % (name, ", ".join(sorted(shapes))))
+    return shapes[name](scenario, jit=jit)
+
+
+def line_coordinates(x, y, start, theta):
+    r"""Distance along and across the line from *start* in direction *theta*
+
+    The same rotation as :func:`make_dtopo.transform`, relative to *start*,
+    of points in a Cartesian frame.
+    """
+    c, s = numpy.cos(theta), numpy.sin(theta)
+    dx = x - start[0]
+    dy = y - start[1]
+    return dx * c + dy * s, dx * s - dy * c
+
+
+def polyline_coordinates(x, y, vertices):
+    r"""Distance along and across the polyline through *vertices*
+
+    Points and vertices are in a Cartesian frame.  Each point is projected
+    on the nearest segment.  The first segment is extended backwards and the
+    last forwards so that points beyond the ends get distances along the
+    path below 0 and past its length.
+
+    :Output:
+     - (s, v, length) with *length* the length of the polyline
+    """
+
+    vertices = numpy.asarray(vertices, dtype=float)
+    delta = numpy.diff(vertices, axis=0)
+    lengths = numpy.sqrt((delta**2).sum(axis=1))
+    if numpy.any(lengths == 0.0):
+        raise ValueError("The path has repeated vertices.")
+    offsets = numpy.concatenate(([0.0], numpy.cumsum(lengths)))
+
+    s = numpy.empty(numpy.broadcast(x, y).shape)
+    v = numpy.empty(s.shape)
+    nearest = numpy.empty(s.shape)
+    nearest.fill(numpy.inf)
+    for k in range(lengths.shape[0]):
+        direction = delta[k] / lengths[k]
+        along, across = line_coordinates(x, y, vertices[k],
+                                         numpy.arctan2(direction[1],
+                                                       direction[0]))
+        low = -numpy.inf if k == 0 else 0.0
+        high = numpy.inf if k == lengths.shape[0] - 1 else lengths[k]
+        clipped = numpy.clip(along, low, high)
+        distance = (along - clipped)**2 + across**2
+        closer = distance < nearest
+        nearest[closer] = distance[closer]
+        s[closer] = (offsets[k] + clipped)[closer]
+        v[closer] = across[closer]
+    return s, v, offsets[-1]
+
+
+def _compile(profile):
+    """numba compiled evaluation loop for *profile*, None without numba"""
+    try:
+        import numba
+    except ImportError:
+        return None
+
+    profile = numba.njit(profile)
+
+    @numba.njit(parallel=True)
+    def evaluate(s, v, back, front, sigma, taper, A, out):
+        for n in range(out.shape[0]):
+            for k in numba.prange(s.shape[0]):
+                u = s[k] - min(max(s[k], back[n]), front[n])
+                out[n, k] = A * profile(u, v[k], sigma, taper)
+
+    return evaluate
+
+
+class SlideShape(object):
+    r"""Base of the slide shapes, evaluates A * profile(u, v)
+
+    Subclasses define the static method profile(u, v, sigma, taper) and are
+    added with :func:`register`.
+
+    :Input:
+     - *scenario* (dict) Slide parameters as in the catalog (theta in
+       radians), plus optionally *path* and *taper* (m), see the module
+       documentation.
+     - *jit* (bool) Compile with numba, by default if numba is installed.
+    """
+
+    # Compiled evaluation of each shape class, built on first use
+    _compiled = {}
+
+    def __init__(self, scenario, jit=None):
+        self.start = tuple(scenario['start'])
+        self.theta = scenario['theta']
+        self.path = scenario.get('path', None)
+        self.speed = scenario['slide_speed']
+        self.L = scenario['max_length']
+        self.sigma = scenario['sigma']
+        self.taper = scenario.get('taper', 0.5 * scenario['sigma'])
+        self.A = scenario['A'] / deg2meters
+        self.jit = jit
+
+    def coordinates(self, X, Y):
+        r"""Distances s along and v across the path of the points *X*, *Y*
+        in the local frame about *start* and the length of the path"""
+        if self.path is None:
+            s, v = line_coordinates(X, Y, (0.0, 0.0), self.theta)
+            return s, v, numpy.inf
+        x, y = numpy.transpose(self.path)
+        vertices = numpy.transpose(projection.to_local(x, y, self.start))
+        return polyline_coordinates(X, Y, numpy.concatenate(([[0.0, 0.0]],
+                                                             vertices)))
+
+    def lobe_bounds(self, times, length=numpy.inf):
+        """Back and front of the covered part of the path at *times*"""
+        front = numpy.minimum(self.speed * numpy.asarray(times, dtype=float),
+                              length)
+        return numpy.maximum(0.0, front - self.L), front
+
+    def _evaluator(self):
+        if self.jit is False:
+            return None
+        cls = type(self)
+        if cls not in SlideShape._compiled:
+            SlideShape._compiled[cls] = _compile(cls.profile)
+        evaluate = SlideShape._compiled[cls]
+        if evaluate is None and self.jit:
+            raise ImportError("numba is needed to compile the slide shapes.")
+        return evaluate
+
+    def __call__(self, x, y, times, out=None):
+        r"""Evaluate the slide on the grid *x*, *y* (1d) at all *times*
+
+        Returns the (nt, ny, nx) cube, written into *out* if given.
+        """
+
+        times = numpy.atleast_1d(numpy.asarray(times, dtype=float))
+        X, Y = numpy.broadcast_arrays(*projection.local_grid(x, y,
+                                                             self.start))
+        s, v, length = self.coordinates(X.reshape(-1), Y.reshape(-1))
+        back, front = self.lobe_bounds(times, length)
+        if out is None:
+            out = numpy.empty((times.shape[0],) + X.shape)
+        dZ = out.reshape(times.shape[0], -1)
+
+        evaluate = self._evaluator()
+        if evaluate is not None:
+            evaluate(s, v, back, front, self.sigma, self.taper, self.A, dZ)
+            return out
+
+        u = numpy.empty(s.shape)
+        for n in range(times.shape[0]):
+            numpy.clip(s, back[n], front[n], out=u)
+            numpy.subtract(s, u, out=u)
+            dZ[n] = self.A * self.profile(u, v, self.sigma, self.taper)
+        return out
+
+
+@register("gaussian")
+class Gaussian(SlideShape):
+
+    @staticmethod
+    def profile(u, v, sigma, taper):
+        return numpy.exp(-(u * u + v * v) / (sigma * sigma))
+
+
+@register("parabolic_cap")
+class ParabolicCap(SlideShape):
+
+    @staticmethod
+    def profile(u, v, sigma, taper):
+        return numpy.maximum(0.0, 1.0 - (u * u + v * v) / (sigma * sigma))
+
+
+@register("tapered_block")
+class TaperedBlock(SlideShape):
+
+    @staticmethod
+    def profile(u, v, sigma, taper):
+        # Distances into the ramps, 0 inside the block and 1 past the ramp
+        ramp_u = numpy.minimum(1.0, numpy.absolute(u) / taper)
+        ramp_v = numpy.minimum(1.0, numpy.maximum(0.0, numpy.absolute(v)
+                                                       - sigma) / taper)
+        return (0.25 * (1.0 + numpy.cos(numpy.pi * ramp_u))
+                     * (1.0 + numpy.cos(numpy.pi * ramp_v)))
+
+
+@register("polyline")
+class Polyline(Gaussian):
+
+    def __init__(self, scenario, jit=None):
+        if scenario.get('path', None) is None:
+            raise ValueError("The polyline shape needs a path.")
+        super(Polyline, self).__init__(scenario, jit=jit)
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+r"""Build a multi-resolution pyramid of topography files
+
+Rather than one full-resolution mosaic for every AMR level, each location
+of the catalog (scenarios.json, see catalog.py) lists in its ``pyramid``
+nested boxes together with the AMR level that box has to resolve: a
+wide one covering the whole computational domain, a finer one around the
+gauge corridor and the finest around the lake.  Each box is cut out of the
+source DEM and decimated to the coarsest sampling that still resolves its
+level, and a manifest ``<location>_pyramid.json`` records the tiles and the
+min/max levels to register them with, which setrun.py picks up.
+
+GeoClaw uses the finest topography available at each point, so the small
+fine tiles take over where they exist and the coarse levels interpolate from
+a much smaller file.
+
+Usage:  python topo_pyramid.py location [format] [force]
+"""
+
+import sys
+import os
+import json
+
+import numpy
+
+import convert_topo
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                ".."))
+import catalog
+
+
+def load_pyramid(location_name):
+    r"""Pyramid of *location_name* from the catalog
+
+    Each tile's extent is the bounding box of the boxes it covers, the
+    source DEM is the location's first topo entry and the domain gives the
+    level spacings, the same the run uses in setrun.py.
+    """
+
+    location = catalog.location(location_name)
+    if len(location.get('pyramid', [])) == 0:
+        raise ValueError("Location %s has no pyramid." % location_name)
+    topo = location['topo'][0]
+
+    tiles = []
+    for tile in location['pyramid']:
+        boxes = [catalog.box(location, name) for name in tile['covers']]
+        tiles.append({"name": tile['name'],
+                      "extent": [min([box[0] for box in boxes]),
+                                 max([box[1] for box in boxes]),
+                                 min([box[2] for box in boxes]),
+                                 max([box[3] for box in boxes])],
+                      "margin": tile['margin'],
+                      "level": tile['level'],
+                      "max_level": tile['max_level']})
+
+    return {"source": topo['path'],
+            "strip_zeros": topo['strip_zeros'],
+            "base_name": os.path.splitext(topo['out_path'])[0],
+            "coarse_delta": location['domain']['coarse_delta'],
+            "refinement_ratios": location['domain']['refinement_ratios'],
+            "tiles": tiles}
+
+
+def level_delta(coarse_delta, refinement_ratios, level):
+    """Grid spacing of AMR *level* (1 based)"""
+    delta = coarse_delta
+    for ratio in refinement_ratios[:level - 1]:
+        delta /= ratio
+    return delta
+
+
+def source_delta(path):
+    """Grid spacing of the source GeoTIFF"""
+    import rasterio
+    with rasterio.open(path) as source:
+        return abs(source.transform.a)
+
+
+def contains(outer, inner):
+    return (outer[0] <= inner[0] and inner[1] <= outer[1] and
+            outer[2] <= inner[2] and inner[3] <= outer[3])
+
+
+def grow(extent, margin):
+    return [extent[0] - margin, extent[1] + margin,
+            extent[2] - margin, extent[3] + margin]
+
+
+def plan_pyramid(pyramid, dem_delta):
+    r"""Decide the stride and the registered levels of every tile
+
+    A tile's stride is the largest decimation whose spacing still resolves
+    its level.  A tile that lies inside an earlier tile with the same stride
+    adds no resolution and is dropped.  Each tile is registered from level 1
+    (nothing is forced beyond the refinement regions) up to its
+    *max_level*, which only limits the refinement and is independent of the
+    level the tile is sampled for.
+    """
+
+    plan = []
+    for tile in pyramid['tiles']:
+        delta = level_delta(pyramid['coarse_delta'],
+                            pyramid['refinement_ratios'], tile['level'])
+        stride = max(1, int(numpy.floor(delta / dem_delta * (1.0 + 1e-8))))
+        extent = grow(tile['extent'], tile['margin'])
+
+        redundant = False
+        for previous in plan:
+            if previous['stride'] == stride and contains(previous['extent'],
+                                                         extent):
+                redundant = True
+        if redundant:
+            print("Tile %s adds no resolution, skipping." % tile['name'])
+            continue
+
+        plan.append({"name": tile['name'],
+                     "extent": extent,
+                     "stride": stride,
+                     "min_level": 1,
+                     "max_level": tile['max_level']})
+    return plan
+
+
+def build_pyramid(location, file_format="tt3", force=False):
+    r"""Build the tiles of *location* and write its manifest
+
+    Returns the path to the manifest.
+    """
+
+    pyramid = load_pyramid(location)
+    plan = plan_pyramid(pyramid, source_delta(pyramid['source']))
+    topo_type = {"tt3": 3, "nc": 4}[file_format]
+
+    for tile in plan:
+        tile['path'] = "%s_%s.%s" % (pyramid['base_name'], tile['name'],
+                                     file_format)
+        tile['topo_type'] = topo_type
+        if os.path.exists(tile['path']) and not force:
+            print("Tile %s already exists." % tile['path'])
+            continue
+        print("Building %s, stride %s, levels %s to %s" % (tile['path'],
+                                         tile['stride'], tile['min_level'],
+                                         tile['max_level']))
+        convert_topo.stream_topo(pyramid['source'], tile['path'],
+                                 extent=tile['extent'],
+                                 strip_zeros=pyramid['strip_zeros'],
+                                 stride=tile['stride'])
+
+    manifest_path = "%s_pyramid.json" % location
+    with open(manifest_path, "w") as manifest:
+        json.dump({"location": location, "tiles": plan}, manifest, indent=4)
+
+    return manifest_path
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) < 2:
+        print("Available locations:")
+        for (name, location) in sorted(catalog.load()['locations'].items()):
+            if len(location.get('pyramid', [])) > 0:
+                print("  %s" % name)
+        sys.exit(0)
+
+    location = sys.argv[1].lower()
+    file_format = "tt3"
+    force = False
+    if len(sys.argv) >= 3:
+        file_format = sys.argv[2].lower()
+    if len(sys.argv) >= 4:
+        force = bool(sys.argv[3])
+
+    print("Wrote %s" % build_pyramid(location, file_format=file_format,
+                                     force=force))